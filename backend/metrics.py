@@ -0,0 +1,80 @@
+"""Prometheus metrics for the API, MongoDB, reminder dispatch and SMTP.
+
+Metrics live in the default prometheus_client registry, one per worker
+process; `/metrics` serves them with `generate_latest()`.
+"""
+import time
+from typing import Dict
+
+from prometheus_client import Counter, Histogram
+from pymongo import monitoring
+
+LATENCY_BUCKETS = [0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+http_request_duration = Histogram(
+    "http_request_duration_seconds", "API request latency by route", ("method", "route", "status"), buckets=LATENCY_BUCKETS)
+mongo_command_duration = Histogram(
+    "mongo_command_duration_seconds", "MongoDB command latency by collection", ("collection", "command"), buckets=LATENCY_BUCKETS)
+reminder_batch_claimed = Histogram(
+    "reminder_batch_size", "Reminders claimed per process_reminders batch", buckets=[1, 5, 10, 25, 50, 100, 250, 500, 1000])
+reminder_batch_duration = Histogram(
+    "reminder_batch_duration_seconds", "Time to process one reminder batch", buckets=LATENCY_BUCKETS)
+reminder_dispatch_lag = Histogram(
+    "reminder_dispatch_lag_seconds", "Delay from scheduled time to send", ("channel",),
+    buckets=[1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600])
+smtp_send_duration = Histogram(
+    "smtp_send_duration_seconds", "SMTP send latency including connection setup", buckets=LATENCY_BUCKETS)
+smtp_send_failures = Counter(
+    "smtp_send_failures", "SMTP sends that raised an error")
+reminder_retries = Counter(
+    "reminder_retries", "Failed reminder sends scheduled for another attempt", ("channel",))
+reminder_dead_letters = Counter(
+    "reminder_dead_letters", "Reminders given up on and moved to the dead-letter collection", ("reason",))
+
+
+class MongoCommandTimer(monitoring.CommandListener):
+    """Times every command the driver runs, labelled by collection"""
+
+    def __init__(self):
+        self._collections: Dict[tuple, str] = {}
+
+    def started(self, event):
+        target = event.command.get("collection") if event.command_name == "getMore" else event.command.get(event.command_name)
+        self._collections[(event.connection_id, event.request_id)] = target if isinstance(target, str) else ""
+
+    def succeeded(self, event):
+        self._observe(event)
+
+    def failed(self, event):
+        self._observe(event)
+
+    def _observe(self, event):
+        collection = self._collections.pop((event.connection_id, event.request_id), "")
+        mongo_command_duration.labels(collection=collection, command=event.command_name).observe(event.duration_micros / 1e6)
+
+
+class RequestMetricsMiddleware:
+    """ASGI middleware timing each request, labelled by its route template"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # Route templates keep label cardinality bounded; unknown paths share one label
+            route = getattr(scope.get("route"), "path", "unmatched")
+            http_request_duration.labels(method=scope["method"], route=route, status=status_code).observe(time.perf_counter() - started)
@@ -1,39 +1,68 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, UploadFile, File, status
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, UploadFile, File, BackgroundTasks, Response, Query, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from fastapi.responses import StreamingResponse
 import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict, EmailStr
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple, Callable, AsyncIterator, TYPE_CHECKING
 import uuid
-from datetime import datetime, timezone, timedelta
+import random
+import base64
+import socket
+import json
+from datetime import datetime, date, timezone, timedelta
 import jwt
+import orjson
 from passlib.context import CryptContext
-import pandas as pd
 import io
+import csv
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import pytz
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+import time
+import asyncio
+import heapq
+import bisect
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+import tempfile
+import importlib
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from storage import LAG_BUCKETS, REPEATING_RECURRENCES, DuplicateError, Storage
+from metrics import (
+    MongoCommandTimer, RequestMetricsMiddleware, reminder_batch_claimed, reminder_batch_duration,
+    reminder_dead_letters, reminder_dispatch_lag, reminder_retries, smtp_send_duration, smtp_send_failures
+)
+
+# pandas (with NumPy) and openpyxl dominate import time and memory but only
+# uploads need them, so the upload functions import them on first use.
+# Run `python server.py importtime` for a cold-start breakdown.
+if TYPE_CHECKING:
+    import pandas as pd
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# Storage: "mongo" (Motor) or "memory" (process-local; see storage.py)
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "mongo").lower()
+if STORAGE_BACKEND not in ("mongo", "memory"):
+    raise RuntimeError(f"Unknown STORAGE_BACKEND {STORAGE_BACKEND!r}; expected 'mongo' or 'memory'")
 
 # Create the main app
 app = FastAPI()
 api_router = APIRouter(prefix="/api")
 
 # Security
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Raising BCRYPT_ROUNDS makes existing hashes "deprecated"; they are rehashed on next login
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=int(os.environ.get("BCRYPT_ROUNDS", 12)))
+PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", min(4, os.cpu_count() or 1)))
+PASSWORD_HASH_MAX_PENDING = int(os.environ.get("PASSWORD_HASH_MAX_PENDING", 64))
 security = HTTPBearer()
 SECRET_KEY = os.environ.get("JWT_SECRET_KEY", "your-secret-key-change-in-production")
 ALGORITHM = "HS256"
@@ -41,6 +70,82 @@ ALGORITHM = "HS256"
 # Scheduler
 scheduler = AsyncIOScheduler(timezone=pytz.UTC)
 
+# Authenticated-user cache
+USER_CACHE_SIZE = int(os.environ.get("USER_CACHE_SIZE", 1024))
+USER_CACHE_TTL_SECONDS = float(os.environ.get("USER_CACHE_TTL_SECONDS", 60))
+
+# Per-teacher agenda cache; the TTL bounds staleness from writes on other workers
+AGENDA_CACHE_SIZE = int(os.environ.get("AGENDA_CACHE_SIZE", 2048))
+AGENDA_CACHE_TTL_SECONDS = float(os.environ.get("AGENDA_CACHE_TTL_SECONDS", 60))
+
+# Pagination
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+# Bookkeeping fields of stored classes that clients never read
+CLASS_BOOKKEEPING_FIELDS = ("materialized_until", "created_at")
+
+# Exports
+EXPORT_BATCH_SIZE = 1000
+EXPORT_COLUMNS = {
+    "logs": ["id", "reminder_id", "channel", "timestamp", "scheduled_time", "lag_seconds", "status", "response"],
+    "classes": ["id", "title", "room", "teacher_email", "start_datetime", "end_datetime",
+                "recurrence", "repeat_until", "timezone", "exception_dates", "created_at"],
+}
+
+# Delivery statistics: raw logs expire after the retention period, hourly rollups are kept
+LOG_RETENTION_DAYS = int(os.environ.get("LOG_RETENTION_DAYS", 30))
+STATS_PERCENTILES = [50, 90, 99]
+
+# Timetable import
+UPLOAD_BATCH_SIZE = int(os.environ.get("UPLOAD_BATCH_SIZE", 1000))
+REQUIRED_TIMETABLE_COLUMNS = ['class_title', 'room', 'teacher_email', 'start_datetime', 'end_datetime']
+RECURRENCE_TYPES = {"ONCE", *REPEATING_RECURRENCES}
+EMAIL_PATTERN = r"^[^@\s]+@[^@\s]+\.[^@\s]+$"
+UPLOAD_CHUNK_ROWS = int(os.environ.get("UPLOAD_CHUNK_ROWS", 5000))
+UPLOAD_READ_BYTES = 1024 * 1024
+UPLOAD_JOB_MAX_ERRORS = 1000
+# Finished import jobs are kept this long for polling, then expire by TTL
+UPLOAD_JOB_RETENTION_DAYS = int(os.environ.get("UPLOAD_JOB_RETENTION_DAYS", 7))
+
+# Reminder dispatch
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+REMINDER_LEASE_SECONDS = int(os.environ.get("REMINDER_LEASE_SECONDS", 120))
+SUPPORTED_CHANNELS = {"email"}
+REMINDER_BATCH_SIZE = 100
+MIN_REMINDER_BATCH_SIZE = 10
+MAX_REMINDER_BATCH_SIZE = 1000
+REMINDER_BATCH_TARGET_SECONDS = float(os.environ.get("REMINDER_BATCH_TARGET_SECONDS", 2))
+BACKLOG_WARNING_SECONDS = 60
+DISPATCH_LOOKAHEAD = int(os.environ.get("DISPATCH_LOOKAHEAD", 1000))
+RECONCILE_INTERVAL_MINUTES = int(os.environ.get("RECONCILE_INTERVAL_MINUTES", 15))
+# Failed sends are retried with jittered exponential backoff, never past the class start
+REMINDER_MAX_ATTEMPTS = int(os.environ.get("REMINDER_MAX_ATTEMPTS", 5))
+RETRY_BASE_SECONDS = float(os.environ.get("RETRY_BASE_SECONDS", 30))
+RETRY_MAX_SECONDS = float(os.environ.get("RETRY_MAX_SECONDS", 900))
+
+# Recurrence
+RECURRENCE_PARITY = {"ODD_WEEKS": 1, "EVEN_WEEKS": 0}  # ISO week number % 2
+REMINDER_HORIZON = timedelta(days=int(os.environ.get("REMINDER_HORIZON_DAYS", 14)))
+# Wall-clock zone that classes repeat in unless they name their own
+CLASS_TIMEZONE = os.environ.get("CLASS_TIMEZONE", "UTC")
+# One-off classes have a single reminder, so the horizon never holds them back
+UNBOUNDED = datetime.max.replace(tzinfo=timezone.utc)
+# Open-ended repeating classes are checked for double-bookings this far ahead
+CONFLICT_CHECK_WEEKS = int(os.environ.get("CONFLICT_CHECK_WEEKS", 16))
+
+storage: Storage
+if STORAGE_BACKEND == "memory":
+    from storage_memory import MemoryStorage
+    storage = MemoryStorage(LOG_RETENTION_DAYS, UPLOAD_JOB_RETENTION_DAYS)
+else:
+    from storage_mongo import MongoStorage
+    storage = MongoStorage(
+        os.environ['MONGO_URL'], os.environ['DB_NAME'], LOG_RETENTION_DAYS, UPLOAD_JOB_RETENTION_DAYS,
+        event_listeners=[MongoCommandTimer()]
+    )
+
 # --- Models ---
 class User(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -77,6 +182,9 @@ class Class(BaseModel):
     start_datetime: datetime
     end_datetime: datetime
     recurrence: str = "ONCE"  # ONCE, WEEKLY, ODD_WEEKS, EVEN_WEEKS
+    repeat_until: Optional[datetime] = None
+    exception_dates: List[date] = Field(default_factory=list)  # cancelled occurrences, as local dates
+    timezone: str = Field(default_factory=lambda: CLASS_TIMEZONE)  # IANA zone the class repeats in
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class Reminder(BaseModel):
@@ -85,22 +193,95 @@ class Reminder(BaseModel):
     class_id: str
     user_id: str
     scheduled_time: datetime
-    status: str = "pending"  # pending, sent, failed
+    occurrence_start: Optional[datetime] = None
+    status: str = "pending"  # pending, processing, sent, failed, suppressed
     channel: str = "email"
     sent_at: Optional[datetime] = None
     error: Optional[str] = None
 
+class ClassUpdate(BaseModel):
+    title: Optional[str] = None
+    room: Optional[str] = None
+    teacher_email: Optional[EmailStr] = None
+    start_datetime: Optional[datetime] = None
+    end_datetime: Optional[datetime] = None
+    recurrence: Optional[str] = None
+    repeat_until: Optional[datetime] = None
+    timezone: Optional[str] = None
+
+class ClassException(BaseModel):
+    date: date
+
 class PreferencesUpdate(BaseModel):
+    timezone: Optional[str] = None
     lead_time_minutes: Optional[int] = None
     channels: Optional[Dict[str, bool]] = None
     quiet_hours: Optional[Dict[str, Any]] = None
 
 # --- Helper Functions ---
-def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+class PasswordHasher:
+    """Runs bcrypt on a dedicated thread pool so it never blocks the event loop.
+
+    bcrypt releases the GIL, so the pool gives real parallelism. Once
+    `max_pending` calls are queued or running, new ones are refused with a
+    503 instead of piling up behind a login storm.
+    """
+
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS, max_pending: int = PASSWORD_HASH_MAX_PENDING):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self._pending = 0
+        self.rejected = 0
+        self.rehashed = 0
+        self._latencies: deque = deque(maxlen=1000)
+
+    async def _run(self, fn, *args):
+        if self._pending >= self.max_pending:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=503,
+                detail="Too many authentication requests, please retry",
+                headers={"Retry-After": "1"}
+            )
+        self._pending += 1
+        started = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            self._pending -= 1
+            self._latencies.append(time.perf_counter() - started)
+
+    async def hash(self, password: str) -> str:
+        return await self._run(pwd_context.hash, password)
+
+    async def verify_and_update(self, password: str, hashed: str):
+        """Return (valid, new_hash); new_hash is set when the stored hash needs upgrading"""
+        valid, new_hash = await self._run(pwd_context.verify_and_update, password, hashed)
+        if new_hash:
+            self.rehashed += 1
+        return valid, new_hash
+
+    def stats(self) -> Dict[str, Any]:
+        latencies = sorted(self._latencies)
+
+        def percentile(p: float):
+            return round(latencies[min(int(len(latencies) * p), len(latencies) - 1)] * 1000, 2) if latencies else None
+
+        return {
+            "workers": self.workers,
+            "pending": self._pending,
+            "max_pending": self.max_pending,
+            "rejected": self.rejected,
+            "rehashed": self.rehashed,
+            "p50_ms": percentile(0.5),
+            "p99_ms": percentile(0.99)
+        }
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+password_hasher = PasswordHasher()
 
 def create_token(user_id: str, email: str, role: str) -> str:
     payload = {
@@ -111,155 +292,1766 @@ def create_token(user_id: str, email: str, role: str) -> str:
     }
     return jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
 
+class UserCache:
+    """Bounded LRU of validated users by id, each entry expiring after a TTL.
+
+    Entries must be invalidated whenever the stored user changes.
+    """
+
+    def __init__(self, max_size: int = USER_CACHE_SIZE, ttl_seconds: float = USER_CACHE_TTL_SECONDS):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: str) -> Optional[User]:
+        entry = self._entries.get(user_id)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[user_id]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(user_id)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, user: User):
+        self._entries[user.id] = (time.monotonic() + self.ttl_seconds, user)
+        self._entries.move_to_end(user.id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: str):
+        self._entries.pop(user_id, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None
+        }
+
+user_cache = UserCache()
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     try:
         token = credentials.credentials
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user = await db.users.find_one({"id": payload["user_id"]}, {"_id": 0})
+        cached = user_cache.get(payload["user_id"])
+        if cached is not None:
+            return cached
+        user = await storage.users.get(payload["user_id"])
         if not user:
             raise HTTPException(status_code=401, detail="User not found")
-        return User(**user)
+        # Stored users were validated on write; skip re-validating on every cache miss
+        user = User.model_construct(**user)
+        user_cache.put(user)
+        return user
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
     except Exception as e:
         raise HTTPException(status_code=401, detail="Invalid token")
 
-async def send_email_reminder(to_email: str, class_info: Dict):
-    """Send email reminder"""
-    try:
+class MailDeliveryError(Exception):
+    """A failed send; permanent failures (5xx replies, refused recipients) are not retried"""
+
+    def __init__(self, message: str, permanent: bool = False):
+        super().__init__(message)
+        self.permanent = permanent
+
+class LeaseLostError(MailDeliveryError):
+    """A send skipped because the batch's lease may have lapsed; another worker can reclaim it"""
+
+    def __init__(self):
+        super().__init__("Reminder lease lost before sending")
+
+def classify_smtp_error(e: Exception) -> MailDeliveryError:
+    """Map an smtplib or socket error to a delivery error, deciding whether a retry can help"""
+    if isinstance(e, MailDeliveryError):
+        return e
+    if isinstance(e, smtplib.SMTPRecipientsRefused):
+        codes = [code for code, _ in e.recipients.values()]
+        return MailDeliveryError(f"Recipient refused ({', '.join(map(str, codes))})", permanent=all(code >= 500 for code in codes))
+    if isinstance(e, smtplib.SMTPAuthenticationError):
+        # Credentials are fixed server-side, not per message; keep retrying
+        return MailDeliveryError(f"SMTP authentication failed ({e.smtp_code})")
+    if isinstance(e, smtplib.SMTPResponseException):
+        detail = e.smtp_error.decode(errors="replace") if isinstance(e.smtp_error, bytes) else str(e.smtp_error)
+        return MailDeliveryError(f"SMTP {e.smtp_code}: {detail}", permanent=e.smtp_code >= 500)
+    # Timeouts, refused connections and dropped sessions are transient
+    return MailDeliveryError(f"{type(e).__name__}: {e}")
+
+class MailTransport:
+    """Delivers built email messages; subclasses decide how"""
+
+    async def send(self, msg: MIMEMultipart, may_send: Optional[Callable[[], bool]] = None):
+        """Deliver one message or raise MailDeliveryError.
+
+        `may_send` is checked right before the message goes out, once any
+        queueing is over; if it returns False, LeaseLostError is raised.
+        """
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Any]:
+        return {}
+
+    async def close(self):
+        pass
+
+class UnconfiguredTransport(MailTransport):
+    """Used when SMTP settings are missing; every send is skipped"""
+
+    async def send(self, msg: MIMEMultipart, may_send: Optional[Callable[[], bool]] = None):
+        logging.warning("SMTP not configured, skipping email")
+        raise MailDeliveryError("SMTP not configured", permanent=True)
+
+# Errors about a single message; the SMTP session itself is still usable
+SMTP_MESSAGE_ERRORS = (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError)
+
+class SMTPPoolTransport(MailTransport):
+    """Sends over a pool of authenticated SMTP connections reused across messages.
+
+    smtplib is blocking, so each send runs in a worker thread. At most
+    `pool_size` messages are in flight at once, one per connection. A
+    connection is only ever held by the send that popped it, which either
+    returns it to the pool or closes it.
+    """
+
+    def __init__(self, host: str, port: int, user: Optional[str] = None, password: Optional[str] = None,
+                 starttls: bool = True, pool_size: int = 4, timeout: float = 30):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.starttls = starttls
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._idle: List[smtplib.SMTP] = []
+        self._slots = asyncio.Semaphore(pool_size)
+        self._sent = 0
+        self._failed = 0
+        self._send_seconds = 0.0
+        self._first_send: Optional[float] = None
+        self._last_send: Optional[float] = None
+
+    def _connect(self) -> smtplib.SMTP:
+        conn = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.starttls:
+                conn.starttls()
+            if self.user and self.password:
+                conn.login(self.user, self.password)
+        except Exception:
+            self._discard(conn)
+            raise
+        return conn
+
+    @staticmethod
+    def _discard(conn: smtplib.SMTP):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _send_on(self, conn: smtplib.SMTP, msg: MIMEMultipart):
+        """Send on one connection, then pool it again or close it.
+
+        A refused sender or recipient or rejected data concerns this message
+        only; smtplib has already reset the session, so the connection goes
+        back to the pool. Any other error leaves it in an unknown state.
+        """
+        try:
+            conn.send_message(msg)
+        except SMTP_MESSAGE_ERRORS:
+            self._idle.append(conn)
+            raise
+        except Exception:
+            self._discard(conn)
+            raise
+        self._idle.append(conn)
+
+    def _send_blocking(self, conn: Optional[smtplib.SMTP], msg: MIMEMultipart):
+        if conn is not None:
+            try:
+                self._send_on(conn, msg)
+                return
+            except smtplib.SMTPServerDisconnected:
+                # Idle connections get dropped by the server; reconnect once
+                pass
+        self._send_on(self._connect(), msg)
+
+    async def send(self, msg: MIMEMultipart, may_send: Optional[Callable[[], bool]] = None):
+        async with self._slots:
+            if may_send is not None and not may_send():
+                raise LeaseLostError()
+            conn = self._idle.pop() if self._idle else None
+            started = time.perf_counter()
+            if self._first_send is None:
+                self._first_send = started
+            try:
+                await asyncio.to_thread(self._send_blocking, conn, msg)
+            except Exception as e:
+                logging.error(f"Email send failed: {str(e)}")
+                self._failed += 1
+                smtp_send_failures.inc()
+                raise classify_smtp_error(e) from e
+            finally:
+                self._last_send = time.perf_counter()
+                self._send_seconds += self._last_send - started
+                smtp_send_duration.observe(self._last_send - started)
+            self._sent += 1
+
+    def stats(self) -> Dict[str, Any]:
+        elapsed = (self._last_send or 0) - (self._first_send or 0)
+        return {
+            "sent": self._sent,
+            "failed": self._failed,
+            "pool_size": self.pool_size,
+            "idle_connections": len(self._idle),
+            "avg_send_ms": round(self._send_seconds / max(self._sent + self._failed, 1) * 1000, 2),
+            "messages_per_sec": round(self._sent / elapsed, 2) if elapsed > 0 else None
+        }
+
+    async def close(self):
+        idle, self._idle = self._idle, []
+        for conn in idle:
+            try:
+                await asyncio.to_thread(conn.quit)
+            except Exception:
+                pass
+
+mail_transport: Optional[MailTransport] = None
+
+def get_mail_transport() -> MailTransport:
+    """Return the configured transport, building it from SMTP_* settings on first use"""
+    global mail_transport
+    if mail_transport is None:
         smtp_host = os.environ.get("SMTP_HOST")
-        smtp_port = int(os.environ.get("SMTP_PORT", 587))
         smtp_user = os.environ.get("SMTP_USER")
         smtp_pass = os.environ.get("SMTP_PASS")
+        smtp_auth = os.environ.get("SMTP_AUTH", "true").lower() == "true"
         
-        if not all([smtp_host, smtp_user, smtp_pass]):
-            logging.warning("SMTP not configured, skipping email")
-            return False
-        
-        msg = MIMEMultipart()
-        msg['From'] = smtp_user
-        msg['To'] = to_email
-        msg['Subject'] = f"Class Reminder: {class_info['title']}"
-        
-        body = f"""
-        <html>
-        <body>
-            <h2>Class Reminder</h2>
-            <p><strong>Class:</strong> {class_info['title']}</p>
-            <p><strong>Room:</strong> {class_info['room']}</p>
-            <p><strong>Time:</strong> {class_info['start_datetime'].strftime('%Y-%m-%d %H:%M')}</p>
-            <p>This class will start in {class_info.get('lead_time', 15)} minutes.</p>
-        </body>
-        </html>
-        """
-        
-        msg.attach(MIMEText(body, 'html'))
-        
-        with smtplib.SMTP(smtp_host, smtp_port) as server:
-            server.starttls()
-            server.login(smtp_user, smtp_pass)
-            server.send_message(msg)
-        
-        return True
+        if not smtp_host or (smtp_auth and not (smtp_user and smtp_pass)):
+            mail_transport = UnconfiguredTransport()
+        else:
+            mail_transport = SMTPPoolTransport(
+                smtp_host,
+                int(os.environ.get("SMTP_PORT", 587)),
+                smtp_user if smtp_auth else None,
+                smtp_pass if smtp_auth else None,
+                starttls=os.environ.get("SMTP_STARTTLS", "true").lower() == "true",
+                pool_size=int(os.environ.get("SMTP_POOL_SIZE", 4))
+            )
+    return mail_transport
+
+def set_mail_transport(transport: MailTransport):
+    """Swap in a different transport, e.g. a local SMTP stand-in"""
+    global mail_transport
+    mail_transport = transport
+
+def build_reminder_email(to_email: str, class_info: Dict) -> MIMEMultipart:
+    msg = MIMEMultipart()
+    msg['From'] = os.environ.get("SMTP_FROM") or os.environ.get("SMTP_USER") or "noreply@localhost"
+    msg['To'] = to_email
+    msg['Subject'] = f"Class Reminder: {class_info['title']}"
+    
+    body = f"""
+    <html>
+    <body>
+        <h2>Class Reminder</h2>
+        <p><strong>Class:</strong> {class_info['title']}</p>
+        <p><strong>Room:</strong> {class_info['room']}</p>
+        <p><strong>Time:</strong> {class_info['start_datetime'].strftime('%Y-%m-%d %H:%M')}</p>
+        <p>This class will start in {class_info.get('lead_time', 15)} minutes.</p>
+    </body>
+    </html>
+    """
+    
+    msg.attach(MIMEText(body, 'html'))
+    return msg
+
+async def send_email_reminder(
+    to_email: str,
+    class_info: Dict,
+    may_send: Optional[Callable[[], bool]] = None
+) -> Optional[MailDeliveryError]:
+    """Send email reminder; returns None on success or the failure"""
+    try:
+        await get_mail_transport().send(build_reminder_email(to_email, class_info), may_send)
+        return None
+    except LeaseLostError as e:
+        return e
     except Exception as e:
         logging.error(f"Email send failed: {str(e)}")
-        return False
+        return classify_smtp_error(e)
+
+async def claim_reminders(batch_size: int) -> Tuple[str, List[Dict]]:
+    """Atomically move up to `batch_size` due reminders into `processing` under a lease.
+
+    The claim token tells this worker which reminders it actually won.
+    """
+    now = datetime.now(timezone.utc)
+    claim_token = uuid.uuid4().hex
+    claimed = await storage.reminders.claim_due(
+        now, batch_size, WORKER_ID, claim_token, now + timedelta(seconds=REMINDER_LEASE_SECONDS)
+    )
+    return (claim_token, claimed) if claimed else ("", [])
+
+class ReminderLease:
+    """Keeps the lease on a claimed batch alive while the batch is processed.
+
+    A batch has no fixed duration: slow SMTP sends can stretch it past
+    REMINDER_LEASE_SECONDS. The lease is extended every third of its length,
+    and `held` turns False once less than a third remains without a
+    successful renewal, so sends stop before another worker could reclaim
+    the same reminders.
+    """
+
+    def __init__(self, claim_token: str, claimed_at: float):
+        self.claim_token = claim_token
+        # Monotonic time the lease lapses; taken from before the claim, so it errs early
+        self._expires = claimed_at + REMINDER_LEASE_SECONDS
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def held(self) -> bool:
+        return self._expires - time.monotonic() > REMINDER_LEASE_SECONDS / 3
+
+    def start(self):
+        self._task = asyncio.create_task(self._renew())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _renew(self):
+        while True:
+            await asyncio.sleep(REMINDER_LEASE_SECONDS / 3)
+            renewed_at = time.monotonic()
+            try:
+                held = await storage.reminders.renew_lease(
+                    self.claim_token, datetime.now(timezone.utc) + timedelta(seconds=REMINDER_LEASE_SECONDS)
+                )
+            except Exception as e:
+                logging.error(f"Reminder lease renewal error: {str(e)}")
+                continue
+            if not held:
+                # Released or reclaimed already; nothing left to send under this claim
+                self._expires = 0
+                return
+            self._expires = renewed_at + REMINDER_LEASE_SECONDS
+
+async def release_expired_leases() -> int:
+    """Return reminders whose worker died mid-batch to pending so they are retried"""
+    released = await storage.reminders.release_expired(datetime.now(timezone.utc))
+    if released:
+        logging.warning(f"Released {released} reminders with expired leases")
+    return released
+
+async def acquire_job_lease(name: str, seconds: int) -> bool:
+    """Let only one worker run a periodic job at a time, across processes and nodes"""
+    now = datetime.now(timezone.utc)
+    return await storage.job_leases.acquire(name, WORKER_ID, now, now + timedelta(seconds=seconds))
+
+def next_retry_time(attempts: int, now: datetime) -> datetime:
+    """When to retry after `attempts` failed sends.
 
-async def process_reminders():
-    """Background job to check and send reminders"""
+    The delay doubles per attempt up to RETRY_MAX_SECONDS and is jittered
+    down by up to half, so a burst of failures does not retry in lockstep.
+    """
+    delay = min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+    return now + timedelta(seconds=delay * random.uniform(0.5, 1))
+
+async def process_reminders(batch_size: int = REMINDER_BATCH_SIZE) -> int:
+    """Claim and send up to `batch_size` due reminders, returning how many were claimed"""
+    reminders = []
+    lease = None
+    started = time.perf_counter()
     try:
-        now = datetime.now(timezone.utc)
-        # Get pending reminders that should be sent now
-        reminders = await db.reminders.find({
-            "status": "pending",
-            "scheduled_time": {"$lte": now}
-        }, {"_id": 0}).to_list(100)
+        claimed_at = time.monotonic()
+        claim_token, reminders = await claim_reminders(batch_size)
+        if not reminders:
+            return 0
+        reminder_batch_claimed.observe(len(reminders))
+        lease = ReminderLease(claim_token, claimed_at)
+        lease.start()
+        
+        # Fetch every class and user for the batch in one query each
+        class_ids = list({r["class_id"] for r in reminders})
+        user_ids = list({r["user_id"] for r in reminders})
+        classes = {c["id"]: c for c in await storage.classes.find_by_ids(class_ids)}
+        users = {u["id"]: u for u in await storage.users.find_by_ids(user_ids)}
         
+        # Legacy reminders predate occurrence tracking and are for the class's first start
         for reminder in reminders:
-            # Get class info
-            class_info = await db.classes.find_one({"id": reminder["class_id"]}, {"_id": 0})
-            if not class_info:
-                continue
-            
-            # Get user info
-            user = await db.users.find_one({"id": reminder["user_id"]}, {"_id": 0})
-            if not user:
-                continue
-            
-            # Send reminder
-            success = False
-            if reminder["channel"] == "email":
-                class_info['lead_time'] = user.get('preferences', {}).get('lead_time_minutes', 15)
-                success = await send_email_reminder(user["email"], class_info)
-            
-            # Update reminder status
-            await db.reminders.update_one(
-                {"id": reminder["id"]},
-                {"$set": {
-                    "status": "sent" if success else "failed",
-                    "sent_at": datetime.now(timezone.utc).isoformat(),
-                    "error": None if success else "Failed to send"
-                }}
-            )
+            if not reminder.get("occurrence_start") and reminder["class_id"] in classes:
+                reminder["occurrence_start"] = classes[reminder["class_id"]]["start_datetime"]
+        
+        # Quiet hours are checked again at send time: preferences may have
+        # changed, or a backlog may have pushed delivery into the window
+        now = datetime.now(timezone.utc)
+        send_times = enforce_quiet_hours(reminders, users, [now] * len(reminders))
+        
+        # Resolve each reminder, then send the whole batch concurrently
+        failures: Dict[str, MailDeliveryError] = {}
+        deferred: Dict[str, datetime] = {}
+        suppressed = set()
+        expired = set()
+        sends = []
+        for reminder, send_time in zip(reminders, send_times):
+            class_info = classes.get(reminder["class_id"])
+            user = users.get(reminder["user_id"])
             
-            # Log
-            await db.logs.insert_one({
+            if not class_info:
+                failures[reminder["id"]] = MailDeliveryError("Class not found", permanent=True)
+            elif not user:
+                failures[reminder["id"]] = MailDeliveryError("User not found", permanent=True)
+            elif reminder.get("attempts") and now >= parse_datetime(reminder["occurrence_start"]):
+                # A retry that could not go out before the class started is dropped
+                expired.add(reminder["id"])
+                failures[reminder["id"]] = MailDeliveryError("Class started before the retry was sent", permanent=True)
+            elif send_time is None:
+                suppressed.add(reminder["id"])
+            elif send_time > now:
+                deferred[reminder["id"]] = send_time
+            elif reminder["channel"] == "email":
+                # Send reminder for the occurrence it was scheduled against
+                class_info = {
+                    **class_info,
+                    "start_datetime": parse_datetime(reminder["occurrence_start"]),
+                    "lead_time": user.get('preferences', {}).get('lead_time_minutes', 15)
+                }
+                sends.append((reminder["id"], send_email_reminder(user["email"], class_info, lambda: lease.held)))
+            else:
+                failures[reminder["id"]] = MailDeliveryError(f"Unsupported channel {reminder['channel']}", permanent=True)
+        
+        results = await asyncio.gather(*(send for _, send in sends))
+        delivered = set()
+        for (reminder_id, _), failure in zip(sends, results):
+            if failure is None:
+                delivered.add(reminder_id)
+            else:
+                failures[reminder_id] = failure
+        
+        finished_at = datetime.now(timezone.utc)
+
+        def settle(reminder: Dict) -> Tuple[Dict, Optional[Dict], Optional[Dict], Optional[datetime]]:
+            """The fields to record, log entry, dead letter and wake time for one reminder's outcome"""
+            if reminder["id"] in deferred:
+                return {"status": "pending", "scheduled_time": deferred[reminder["id"]]}, None, None, None
+            # Retries move scheduled_time; lag is measured from the first schedule
+            scheduled_time = parse_datetime(reminder.get("first_scheduled_time") or reminder["scheduled_time"])
+            failure = failures.get(reminder["id"])
+            dead_letter = retry_at = None
+            if reminder["id"] in suppressed:
+                status, response = "suppressed", "Suppressed by quiet hours"
+                update = {"status": status, "sent_at": finished_at, "error": None}
+            elif failure is None:
+                status, response = "sent", "Email sent"
+                update = {"status": status, "sent_at": finished_at, "error": None}
+                reminder_dispatch_lag.labels(channel=reminder["channel"]).observe((finished_at - scheduled_time).total_seconds())
+            else:
+                error = str(failure)
+                attempts = reminder.get("attempts", 0) + (0 if reminder["id"] in expired else 1)
+                occurrence_start = reminder.get("occurrence_start")
+                if reminder["id"] in expired:
+                    reason = "class_started"
+                elif failure.permanent:
+                    reason = "permanent_failure"
+                elif attempts >= REMINDER_MAX_ATTEMPTS:
+                    reason = "max_attempts"
+                else:
+                    retry_at = next_retry_time(attempts, finished_at)
+                    if occurrence_start is not None and retry_at >= parse_datetime(occurrence_start):
+                        reason, retry_at = "class_started", None
+                    else:
+                        reason = None
+                
+                if reason is None:
+                    status, response = "retrying", f"{error}; attempt {attempts}, retrying at {retry_at.isoformat()}"
+                    update = {
+                        "status": "pending",
+                        "scheduled_time": retry_at,
+                        "first_scheduled_time": scheduled_time,
+                        "attempts": attempts,
+                        "error": error
+                    }
+                    reminder_retries.labels(channel=reminder["channel"]).inc()
+                else:
+                    status, response = "failed", f"{error}; gave up: {reason}"
+                    update = {"status": "failed", "sent_at": finished_at, "error": error, "attempts": attempts}
+                    if occurrence_start is None:
+                        # A legacy row whose class is gone; its reminder went out a lead time before the start
+                        lead_time = (users.get(reminder["user_id"]) or {}).get("preferences", {}).get("lead_time_minutes", 15)
+                        occurrence_start = scheduled_time + timedelta(minutes=lead_time)
+                    dead_letter = {
+                        "id": reminder["id"],
+                        "class_id": reminder["class_id"],
+                        "user_id": reminder["user_id"],
+                        "channel": reminder["channel"],
+                        "occurrence_start": occurrence_start,
+                        "scheduled_time": scheduled_time,
+                        "attempts": attempts,
+                        "error": error,
+                        "reason": reason,
+                        "dead_lettered_at": finished_at
+                    }
+                    reminder_dead_letters.labels(reason=reason).inc()
+            log = {
                 "id": str(uuid.uuid4()),
                 "reminder_id": reminder["id"],
-                "timestamp": datetime.now(timezone.utc).isoformat(),
-                "status": "sent" if success else "failed",
-                "response": "Email sent" if success else "Failed to send"
-            })
+                "channel": reminder["channel"],
+                "timestamp": finished_at,
+                "scheduled_time": scheduled_time,
+                "lag_seconds": round((finished_at - scheduled_time).total_seconds(), 3),
+                "status": status,
+                "response": response
+            }
+            return update, log, dead_letter, retry_at
+
+        updates: Dict[str, Dict] = {}
+        logs = []
+        dead_letters = []
+        wake_times = list(deferred.values())
+        for reminder in reminders:
+            if isinstance(failures.get(reminder["id"]), LeaseLostError):
+                # Never attempted; whoever reclaims it records the outcome
+                continue
+            try:
+                update, log, dead_letter, retry_at = settle(reminder)
+            except Exception as e:
+                # One malformed row must not hold back the outcomes of the rest
+                logging.error(f"Could not record outcome of reminder {reminder['id']}: {str(e)}")
+                # A delivered reminder must never be released and sent again
+                sent = reminder["id"] in delivered
+                update = {
+                    "status": "sent" if sent else "failed",
+                    "sent_at": finished_at,
+                    "error": None if sent else f"Could not record outcome: {str(e)}"
+                }
+                log = dead_letter = retry_at = None
+            updates[reminder["id"]] = update
+            if log:
+                logs.append(log)
+            if dead_letter:
+                dead_letters.append(dead_letter)
+            if retry_at:
+                wake_times.append(retry_at)
+        
+        lost = sum(isinstance(f, LeaseLostError) for f in failures.values())
+        if lost:
+            logging.warning(f"Skipped {lost} reminders after their lease lapsed mid-batch")
+        # Write statuses and logs for the whole batch at once; only the
+        # current lease holder may record the outcomes
+        if updates:
+            await storage.reminders.record_outcomes(claim_token, updates)
+        if dead_letters:
+            await storage.dead_letters.upsert_many(dead_letters)
+        if logs:
+            await storage.logs.insert_many(logs)
+        if wake_times:
+            reminder_dispatcher.notify(wake_times)
+        reminder_batch_duration.observe(time.perf_counter() - started)
     except Exception as e:
         logging.error(f"Reminder processing error: {str(e)}")
+        return 0
+    finally:
+        if lease is not None:
+            await lease.stop()
+    return len(reminders)
 
-async def schedule_class_reminders(class_obj: Dict):
-    """Schedule reminders for a class"""
+async def get_reminder_backlog() -> Dict[str, Any]:
+    """Count overdue pending reminders and how late the oldest one is"""
+    now = datetime.now(timezone.utc)
+    backlog = await storage.reminders.backlog(now)
+    oldest = backlog["oldest_scheduled_time"]
+    return {
+        "depth": backlog["depth"],
+        "oldest_overdue_seconds": round((now - parse_datetime(oldest)).total_seconds(), 1) if oldest else 0,
+        "retrying": backlog["retrying"],
+        "dead_letters": await storage.dead_letters.count()
+    }
+
+class ReminderDispatcher:
+    """Sleeps until the next due reminder instead of polling for it.
+
+    Keeps a min-heap of upcoming scheduled times loaded from storage.
+    Producers call notify() with new times so an earlier reminder wakes the
+    loop immediately; the heap is only refilled from storage once it drains.
+    """
+
+    def __init__(self, lookahead: int = DISPATCH_LOOKAHEAD):
+        self.lookahead = lookahead
+        self._due: List[datetime] = []
+        # Every pending reminder up to this time is in the heap
+        self._loaded_until = datetime.min.replace(tzinfo=timezone.utc)
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.batch_size = REMINDER_BATCH_SIZE
+        self.last_drain: Dict[str, Any] = {}
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @property
+    def next_due(self) -> Optional[datetime]:
+        return self._due[0] if self._due else None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def notify(self, scheduled_times: List[datetime]):
+        """Register newly created reminders, waking the loop if one is due sooner"""
+        if not self.running:
+            return
+        earliest = self.next_due
+        for scheduled_time in scheduled_times:
+            # Later ones are picked up when the heap is refilled
+            if scheduled_time <= self._loaded_until:
+                heapq.heappush(self._due, scheduled_time)
+        if self._due and (earliest is None or self._due[0] < earliest):
+            self._wake.set()
+
+    async def drain(self) -> int:
+        """Process due reminders batch after batch until none are left.
+
+        The batch size adapts so a batch takes about
+        REMINDER_BATCH_TARGET_SECONDS at the observed per-reminder latency.
+        """
+        started = time.perf_counter()
+        total = batches = 0
+        while True:
+            batch_size = self.batch_size
+            batch_started = time.perf_counter()
+            count = await process_reminders(batch_size)
+            elapsed = time.perf_counter() - batch_started
+            total += count
+            batches += 1
+            if count:
+                target = int(REMINDER_BATCH_TARGET_SECONDS / (elapsed / count))
+                # Move halfway towards the target to smooth out noisy batches
+                self.batch_size = max(MIN_REMINDER_BATCH_SIZE, min(MAX_REMINDER_BATCH_SIZE, (batch_size + target) // 2))
+            # A short batch means the backlog is empty
+            if count < batch_size:
+                break
+
+        backlog = await get_reminder_backlog()
+        self.last_drain = {
+            "finished_at": datetime.now(timezone.utc).isoformat(),
+            "reminders": total,
+            "batches": batches,
+            "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+            "backlog": backlog
+        }
+        if backlog["oldest_overdue_seconds"] > BACKLOG_WARNING_SECONDS:
+            logging.warning(
+                f"Reminder backlog: {backlog['depth']} overdue, oldest {backlog['oldest_overdue_seconds']}s late"
+            )
+        return total
+
+    async def reconcile(self):
+        """Recover expired leases and reload the heap to catch reminders written by other paths"""
+        await release_expired_leases()
+        await self._refill()
+        self._wake.set()
+
+    async def _refill(self):
+        scheduled_times = [parse_datetime(t) for t in await storage.reminders.next_pending_times(self.lookahead)]
+        # Merge rather than replace so concurrent notify() calls are not lost
+        self._due = list(set(self._due).union(scheduled_times))
+        heapq.heapify(self._due)
+        if len(scheduled_times) < self.lookahead:
+            self._loaded_until = datetime.max.replace(tzinfo=timezone.utc)
+        else:
+            self._loaded_until = scheduled_times[-1]
+
+    async def _run(self):
+        try:
+            await self._refill()
+        except Exception as e:
+            logging.error(f"Reminder dispatcher load error: {str(e)}")
+        while True:
+            try:
+                now = datetime.now(timezone.utc)
+                if self._due and self._due[0] <= now:
+                    while self._due and self._due[0] <= now:
+                        heapq.heappop(self._due)
+                    await self.drain()
+                    if not self._due and self._loaded_until < datetime.max.replace(tzinfo=timezone.utc):
+                        await self._refill()
+                    continue
+
+                timeout = (self._due[0] - now).total_seconds() if self._due else None
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Reminder dispatcher error: {str(e)}")
+                await asyncio.sleep(1)
+
+reminder_dispatcher = ReminderDispatcher()
+
+def parse_datetime(value) -> datetime:
+    """Normalise a datetime (or a legacy ISO string) to an aware UTC datetime"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+def is_timezone(name: Any) -> bool:
     try:
-        # Find all users with matching email
-        users = await db.users.find({"email": class_obj["teacher_email"]}, {"_id": 0}).to_list(10)
-        
-        for user in users:
-            prefs = user.get("preferences", {})
-            lead_time = prefs.get("lead_time_minutes", 15)
-            channels = prefs.get("channels", {"email": True})
-            
-            # Calculate reminder time
-            if isinstance(class_obj["start_datetime"], str):
-                start_time = datetime.fromisoformat(class_obj["start_datetime"].replace('Z', '+00:00'))
+        ZoneInfo(name)
+        return True
+    except (ZoneInfoNotFoundError, ValueError, TypeError):
+        return False
+
+def class_timezone(class_obj: Dict) -> ZoneInfo:
+    """The wall-clock zone a class repeats in"""
+    name = class_obj.get("timezone") or CLASS_TIMEZONE
+    return ZoneInfo(name) if is_timezone(name) else ZoneInfo("UTC")
+
+def iter_occurrences(class_obj: Dict, window_start: datetime, window_end: datetime):
+    """Lazily yield (start, end) for each occurrence starting in [window_start, window_end).
+
+    Repeats are expanded in the class's timezone: WEEKLY steps the local
+    date by 7 days and keeps the local start time, so a class stays at 09:00
+    across DST changes. ODD_WEEKS and EVEN_WEEKS keep only the weeks whose
+    ISO week number has that parity. Occurrences on `exception_dates` are
+    skipped and none start after `repeat_until`. Week parity and exception
+    dates both use the local date.
+    """
+    first_start = parse_datetime(class_obj["start_datetime"])
+    duration = parse_datetime(class_obj["end_datetime"]) - first_start
+    recurrence = class_obj.get("recurrence", "ONCE")
+    skipped = {str(d) for d in class_obj.get("exception_dates") or []}
+    if class_obj.get("repeat_until"):
+        window_end = min(window_end, parse_datetime(class_obj["repeat_until"]) + timedelta(microseconds=1))
+    tz = class_timezone(class_obj)
+    local_start = first_start.astimezone(tz)
+
+    if recurrence not in RECURRENCE_TYPES or recurrence == "ONCE":
+        if window_start <= first_start < window_end and local_start.date().isoformat() not in skipped:
+            yield first_start, first_start + duration
+        return
+
+    day, wall_time = local_start.date(), local_start.time()
+    if window_start > first_start:
+        # Jump to a week before the window; DST moves a slot by at most a few hours
+        weeks = (window_start - first_start) // timedelta(weeks=1)
+        day += timedelta(weeks=max(weeks - 1, 0))
+
+    parity = RECURRENCE_PARITY.get(recurrence)
+    while True:
+        occurrence = datetime.combine(day, wall_time, tzinfo=tz).astimezone(timezone.utc)
+        if occurrence >= window_end:
+            break
+        if occurrence >= window_start and (parity is None or day.isocalendar().week % 2 == parity):
+            if day.isoformat() not in skipped:
+                yield occurrence, occurrence + duration
+        day += timedelta(weeks=1)
+
+def class_view(class_obj: Dict) -> Dict:
+    """A stored class without the bookkeeping fields clients never read"""
+    return {k: v for k, v in class_obj.items() if k not in CLASS_BOOKKEEPING_FIELDS}
+
+async def find_occurrences(
+    teacher_email: Optional[str],
+    window_start: datetime,
+    window_end: datetime,
+    after: Optional[Tuple[datetime, str]] = None,
+    limit: Optional[int] = None
+) -> List[Dict]:
+    """Expand the classes of one teacher, or every teacher for None, into occurrences within a window.
+
+    Occurrences are sorted by (start, class id). `after` resumes strictly
+    after a previous (start, class id) key and `limit` caps the result.
+    """
+    if after:
+        window_start = max(window_start, after[0])
+    classes = await storage.classes.occurring(window_start, window_end, teacher_email)
+
+    occurrences = []
+    for class_obj in map(class_view, classes):
+        for start, end in iter_occurrences(class_obj, window_start, window_end):
+            if after and (start, class_obj["id"]) <= after:
+                continue
+            occurrences.append({**class_obj, "start_datetime": start, "end_datetime": end})
+    occurrences.sort(key=lambda o: (o["start_datetime"], o["id"]))
+    return occurrences[:limit] if limit is not None else occurrences
+
+class AgendaCache:
+    """Bounded LRU of daily agendas keyed by (teacher email, timezone, local day).
+
+    A teacher of None stands for every teacher. Each entry remembers the UTC
+    window it covers, so a class write drops only the days one of its
+    occurrences falls on; entries also expire after a TTL.
+    """
+
+    def __init__(self, max_size: int = AGENDA_CACHE_SIZE, ttl_seconds: float = AGENDA_CACHE_TTL_SECONDS):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._by_teacher: Dict[Optional[str], set] = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key: tuple) -> Optional[List[Dict]]:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                self._drop(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[3]
+
+    def put(self, key: tuple, window_start: datetime, window_end: datetime, occurrences: List[Dict]):
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, window_start, window_end, occurrences)
+        self._entries.move_to_end(key)
+        self._by_teacher.setdefault(key[0], set()).add(key)
+        while len(self._entries) > self.max_size:
+            self._drop(next(iter(self._entries)))
+
+    def _drop(self, key: tuple):
+        self._entries.pop(key, None)
+        keys = self._by_teacher.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_teacher[key[0]]
+
+    def invalidate_classes(self, class_objs: List[Dict]):
+        """Drop the cached days, for the class's teacher and for everyone, that any occurrence falls on"""
+        for class_obj in class_objs:
+            for teacher in (class_obj.get("teacher_email"), None):
+                for key in list(self._by_teacher.get(teacher, ())):
+                    _, window_start, window_end, _ = self._entries[key]
+                    if next(iter_occurrences(class_obj, window_start, window_end), None) is not None:
+                        self._drop(key)
+                        self.invalidations += 1
+
+    def invalidate_teacher(self, teacher_email: str):
+        for key in list(self._by_teacher.get(teacher_email, ())):
+            self._drop(key)
+            self.invalidations += 1
+
+    def clear(self):
+        self._entries.clear()
+        self._by_teacher.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None
+        }
+
+agenda_cache = AgendaCache()
+
+async def get_agenda(teacher_email: Optional[str], tz_name: str, window_start: datetime, window_end: datetime) -> List[Dict]:
+    """Occurrences starting in [window_start, window_end) for one teacher (or everyone if None).
+
+    Served from whole local days in `agenda_cache`; the days that are missing
+    are loaded with a single range query and cached, including empty ones.
+    """
+    try:
+        tz = ZoneInfo(tz_name)
+    except (ZoneInfoNotFoundError, ValueError):
+        tz, tz_name = ZoneInfo("UTC"), "UTC"
+    first_day = window_start.astimezone(tz).date()
+    last_day = (window_end - timedelta(microseconds=1)).astimezone(tz).date()
+    days = [first_day + timedelta(days=i) for i in range((last_day - first_day).days + 1)]
+
+    def day_bounds(day):
+        start = datetime.combine(day, datetime.min.time(), tzinfo=tz).astimezone(timezone.utc)
+        end = datetime.combine(day + timedelta(days=1), datetime.min.time(), tzinfo=tz).astimezone(timezone.utc)
+        return start, end
+
+    agenda = {day: agenda_cache.get((teacher_email, tz_name, day)) for day in days}
+    missing = [day for day, occurrences in agenda.items() if occurrences is None]
+    if missing:
+        load_start, load_end = day_bounds(missing[0])[0], day_bounds(missing[-1])[1]
+        loaded: Dict[Any, List[Dict]] = {day: [] for day in missing}
+        for occurrence in await find_occurrences(teacher_email, load_start, load_end):
+            day = occurrence["start_datetime"].astimezone(tz).date()
+            if day in loaded:
+                loaded[day].append(occurrence)
+        for day, occurrences in loaded.items():
+            agenda_cache.put((teacher_email, tz_name, day), *day_bounds(day), occurrences)
+            agenda[day] = occurrences
+
+    return [
+        occurrence
+        for day in days
+        for occurrence in agenda[day]
+        if window_start <= occurrence["start_datetime"] < window_end
+    ]
+
+def find_booking_conflicts(
+    candidates: List[Tuple[Any, Dict]],
+    existing: List[Dict],
+    window_start: datetime,
+    window_end: datetime
+) -> List[Dict]:
+    """Find room and teacher double-bookings that involve at least one candidate.
+
+    `candidates` are (row label, class) pairs. Every occurrence in the window
+    becomes an interval keyed by room and by teacher; after one sort, a
+    single sweep compares each interval only with the latest-ending one
+    before it, so a batch is checked in O(n log n) instead of pairwise.
+    Each conflicting pair is reported once, at its first overlap.
+    """
+    classes = [(label, class_obj, True) for label, class_obj in candidates]
+    classes += [(None, class_obj, False) for class_obj in existing]
+    intervals = []
+    for index, (_, class_obj, _) in enumerate(classes):
+        for start, end in iter_occurrences(class_obj, window_start, window_end):
+            intervals.append(("room", class_obj["room"], start, end, index))
+            intervals.append(("teacher", class_obj["teacher_email"], start, end, index))
+    intervals.sort(key=lambda interval: interval[:3])
+
+    def describe(index: int, start: datetime) -> Dict[str, Any]:
+        label, class_obj, is_candidate = classes[index]
+        if is_candidate:
+            return {"row": label, "start_datetime": start.isoformat()}
+        return {"class_id": class_obj["id"], "title": class_obj["title"], "start_datetime": start.isoformat()}
+
+    conflicts = []
+    reported = set()
+    resource = None
+    latest_end, holder, holder_start = None, None, None
+    for kind, value, start, end, index in intervals:
+        if (kind, value) != resource:
+            resource, latest_end, holder, holder_start = (kind, value), end, index, start
+            continue
+        pair = (kind, min(index, holder), max(index, holder))
+        if start < latest_end and index != holder and pair not in reported:
+            reported.add(pair)
+            for this, this_start, other, other_start in ((index, start, holder, holder_start), (holder, holder_start, index, start)):
+                if classes[this][2]:
+                    conflicts.append({
+                        "row": classes[this][0],
+                        "resource": kind,
+                        "value": value,
+                        "start_datetime": this_start.isoformat(),
+                        "conflicts_with": describe(other, other_start)
+                    })
+        if end > latest_end:
+            latest_end, holder, holder_start = end, index, start
+    return conflicts
+
+async def check_booking_conflicts(candidates: List[Tuple[Any, Dict]], exclude_id: Optional[str] = None) -> List[Dict]:
+    """Check candidate classes against each other and against stored classes sharing a room or teacher"""
+    if not candidates:
+        return []
+
+    def series_end(class_obj: Dict) -> datetime:
+        start = parse_datetime(class_obj["start_datetime"])
+        end = parse_datetime(class_obj["end_datetime"])
+        if class_obj.get("recurrence", "ONCE") == "ONCE":
+            return end
+        last_start = start + timedelta(weeks=CONFLICT_CHECK_WEEKS)
+        if class_obj.get("repeat_until"):
+            last_start = min(last_start, parse_datetime(class_obj["repeat_until"]))
+        # A day late as well, since DST can move the last local slot past it
+        return last_start + (end - start) + timedelta(days=1)
+
+    # Start a day early so occurrences already running at the first start are seen
+    window_start = min(parse_datetime(c["start_datetime"]) for _, c in candidates) - timedelta(days=1)
+    window_end = max(series_end(c) for _, c in candidates)
+    existing = await storage.classes.overlapping(
+        window_start,
+        window_end,
+        list({c["room"] for _, c in candidates}),
+        list({c["teacher_email"] for _, c in candidates}),
+        exclude_id
+    )
+    return find_booking_conflicts(candidates, existing, window_start, window_end)
+
+def booking_conflict_errors(conflicts: List[Dict]) -> List[Dict]:
+    """Turn a conflict report into per-row upload errors"""
+    errors: Dict[Any, List[str]] = {}
+    for conflict in conflicts:
+        other = conflict["conflicts_with"]
+        target = f"row {other['row']}" if "row" in other else f"class '{other['title']}' ({other['class_id']})"
+        errors.setdefault(conflict["row"], []).append(
+            f"{conflict['resource']} {conflict['value']} is double-booked with {target} at {conflict['start_datetime']}"
+        )
+    return [{"row": row, "errors": messages} for row, messages in errors.items()]
+
+async def reject_booking_conflicts(classes: "pd.DataFrame") -> Tuple["pd.DataFrame", List[Dict], List[Dict]]:
+    """Drop validated upload rows that double-book a room or teacher.
+
+    Returns the remaining rows, the per-row errors and the conflict report.
+    """
+    conflicts = await check_booking_conflicts(list(zip(classes.index, classes.to_dict("records"))))
+    for conflict in conflicts:
+        conflict["row"] = int(conflict["row"])
+        if "row" in conflict["conflicts_with"]:
+            conflict["conflicts_with"]["row"] = int(conflict["conflicts_with"]["row"])
+    rejected = {conflict["row"] for conflict in conflicts}
+    return classes.drop(index=list(rejected)), booking_conflict_errors(conflicts), conflicts
+
+def quiet_hours_intervals(user: Dict, window_start: datetime, window_end: datetime) -> Tuple[List[float], List[float]]:
+    """Return the user's quiet hours overlapping a window as sorted UTC [start, end) epoch seconds.
+
+    Each local day's window is resolved in the user's timezone, so the UTC
+    intervals shift correctly across DST changes; a window whose end is not
+    after its start runs past midnight.
+    """
+    empty = [], []
+    quiet = user.get("preferences", {}).get("quiet_hours") or {}
+    if not quiet.get("enabled"):
+        return empty
+    try:
+        tz = ZoneInfo(user.get("timezone") or "UTC")
+        start_time = datetime.strptime(quiet.get("start", "22:00"), "%H:%M").time()
+        end_time = datetime.strptime(quiet.get("end", "07:00"), "%H:%M").time()
+    except (ZoneInfoNotFoundError, ValueError) as e:
+        logging.warning(f"Ignoring invalid quiet hours for user {user.get('id')}: {str(e)}")
+        return empty
+    if start_time == end_time:
+        return empty
+
+    starts, ends = [], []
+    # Start a day early to catch a window that began the previous evening
+    day = window_start.astimezone(tz).date() - timedelta(days=1)
+    last_day = window_end.astimezone(tz).date()
+    while day <= last_day:
+        end_day = day + timedelta(days=1) if end_time < start_time else day
+        starts.append(datetime.combine(day, start_time, tzinfo=tz).timestamp())
+        ends.append(datetime.combine(end_day, end_time, tzinfo=tz).timestamp())
+        day += timedelta(days=1)
+    return starts, ends
+
+def enforce_quiet_hours(
+    reminders: List[Dict],
+    users_by_id: Dict[str, Dict],
+    send_times: List[datetime]
+) -> List[Optional[datetime]]:
+    """Decide when each reminder may go out given its user's quiet hours.
+
+    A send time inside quiet hours is deferred to the end of that window;
+    if that is no longer before the occurrence starts the reminder is
+    suppressed (None). Legacy reminders without `occurrence_start` are only
+    deferred, never suppressed. Intervals are built once per user and each
+    of that user's reminders is located among them by bisection.
+    """
+    results: List[Optional[datetime]] = list(send_times)
+    by_user: Dict[str, List[int]] = {}
+    for i, reminder in enumerate(reminders):
+        by_user.setdefault(reminder["user_id"], []).append(i)
+
+    for user_id, indexes in by_user.items():
+        user = users_by_id.get(user_id)
+        if not user:
+            continue
+        starts, ends = quiet_hours_intervals(
+            user,
+            min(send_times[i] for i in indexes),
+            max(send_times[i] for i in indexes)
+        )
+        if not starts:
+            continue
+
+        for i in indexes:
+            send_at = send_times[i].timestamp()
+            window = max(bisect.bisect_right(starts, send_at) - 1, 0)
+            if not starts[window] <= send_at < ends[window]:
+                continue
+            occurrence_start = reminders[i].get("occurrence_start")
+            if occurrence_start and ends[window] >= parse_datetime(occurrence_start).timestamp():
+                results[i] = None
             else:
-                start_time = class_obj["start_datetime"]
-            
-            reminder_time = start_time - timedelta(minutes=lead_time)
-            
-            # Only schedule future reminders
-            if reminder_time > datetime.now(timezone.utc):
+                results[i] = datetime.fromtimestamp(ends[window], tz=timezone.utc)
+    return results
+
+async def schedule_reminders_for_classes(
+    class_objs: List[Dict],
+    window_start: Optional[datetime] = None,
+    window_end: Optional[datetime] = None,
+    users: Optional[List[Dict]] = None,
+    only_channels: Optional[set] = None
+) -> int:
+    """Schedule reminders for every occurrence of a batch of classes in a window.
+
+    Uses one user lookup and bulk inserts. The window defaults to now up to
+    the reminder horizon; later occurrences of repeating classes are picked
+    up by extend_reminder_horizon, while one-off classes ignore the window
+    end. Pass `users` to skip the lookup and schedule for just those users,
+    and `only_channels` to restrict the channels.
+    """
+    emails = list({c["teacher_email"] for c in class_objs})
+    if not emails:
+        return 0
+
+    users_by_email: Dict[str, List[Dict]] = {}
+    if users is None:
+        users = await storage.users.find_by_emails(emails)
+    for user in users:
+        users_by_email.setdefault(user["email"], []).append(user)
+
+    now = datetime.now(timezone.utc)
+    window_start = max(window_start or now, now)
+    window_end = window_end or now + REMINDER_HORIZON
+    reminders = []
+    for class_obj in class_objs:
+        teachers = users_by_email.get(class_obj["teacher_email"], [])
+        if not teachers:
+            continue
+        class_window_end = window_end if class_obj.get("recurrence") in REPEATING_RECURRENCES else UNBOUNDED
+        for start_time, _ in iter_occurrences(class_obj, window_start, class_window_end):
+            for user in teachers:
+                prefs = user.get("preferences", {})
+                lead_time = prefs.get("lead_time_minutes", 15)
+                channels = prefs.get("channels", {"email": True})
+
+                reminder_time = start_time - timedelta(minutes=lead_time)
+
+                # Only schedule future reminders
+                if reminder_time <= now:
+                    continue
                 for channel, enabled in channels.items():
-                    if enabled and channel == "email":  # Currently only email supported
-                        reminder = {
+                    if only_channels is not None and channel not in only_channels:
+                        continue
+                    if enabled and channel in SUPPORTED_CHANNELS:
+                        reminders.append({
                             "id": str(uuid.uuid4()),
                             "class_id": class_obj["id"],
                             "user_id": user["id"],
-                            "scheduled_time": reminder_time.isoformat(),
+                            "scheduled_time": reminder_time,
+                            "occurrence_start": start_time,
                             "status": "pending",
                             "channel": channel,
                             "sent_at": None,
                             "error": None
-                        }
-                        await db.reminders.insert_one(reminder)
+                        })
+
+    # Defer reminders that would land in the teacher's quiet hours; ones that
+    # cannot go out before class are kept as suppressed so a later
+    # preference change can revive them
+    users_by_id = {u["id"]: u for u in users}
+    send_times = enforce_quiet_hours(reminders, users_by_id, [r["scheduled_time"] for r in reminders])
+    for reminder, send_time in zip(reminders, send_times):
+        if send_time is None:
+            reminder["status"] = "suppressed"
+        else:
+            reminder["scheduled_time"] = send_time
+
+    for i in range(0, len(reminders), UPLOAD_BATCH_SIZE):
+        await storage.reminders.insert_many(reminders[i:i + UPLOAD_BATCH_SIZE])
+    reminder_dispatcher.notify([parse_datetime(r["scheduled_time"]) for r in reminders])
+    return len(reminders)
+
+async def schedule_in_materialized_window(class_objs: List[Dict], **kwargs) -> int:
+    """Schedule reminders from now up to each class's own materialized_until mark"""
+    groups: Dict[Any, List[Dict]] = {}
+    for class_obj in class_objs:
+        groups.setdefault(class_obj.get("materialized_until"), []).append(class_obj)
+    created = 0
+    for materialized_until, group in groups.items():
+        window_end = parse_datetime(materialized_until) if materialized_until else None
+        created += await schedule_reminders_for_classes(group, window_end=window_end, **kwargs)
+    return created
+
+async def reschedule_user_reminders(user: Dict, old_preferences: Dict) -> int:
+    """Bring a user's pending future reminders in line with their new preferences.
+
+    Touches only that user's reminders: pending and suppressed rows are
+    re-timed for the new lead time, timezone and quiet hours or dropped for
+    disabled channels in one bulk write, and rows are generated only for
+    channels that were just enabled.
+    """
+    prefs = user.get("preferences", {})
+    lead_time = timedelta(minutes=prefs.get("lead_time_minutes", 15))
+    enabled = {c for c, on in prefs.get("channels", {"email": True}).items() if on and c in SUPPORTED_CHANNELS}
+    was_enabled = {c for c, on in old_preferences.get("channels", {"email": True}).items() if on and c in SUPPORTED_CHANNELS}
+    now = datetime.now(timezone.utc)
+
+    pending = await storage.reminders.waiting_for_user(user["id"], now)
+
+    deleted = [r["id"] for r in pending if r["channel"] not in enabled]
+    suppressed = []
+    retimed: Dict[str, datetime] = {}
+    kept = [r for r in pending if r["channel"] in enabled]
+    send_times = enforce_quiet_hours(
+        kept,
+        {user["id"]: user},
+        [parse_datetime(r["occurrence_start"]) - lead_time for r in kept]
+    )
+    for reminder, scheduled_time in zip(kept, send_times):
+        if scheduled_time is None:
+            if reminder["status"] != "suppressed":
+                suppressed.append(reminder["id"])
+        elif reminder["status"] == "suppressed" or scheduled_time != parse_datetime(reminder["scheduled_time"]):
+            retimed[reminder["id"]] = scheduled_time
+    changed = len(deleted) + len(suppressed) + len(retimed)
+    if changed:
+        await storage.reminders.update_waiting(deleted, suppressed, retimed)
+        reminder_dispatcher.notify(list(retimed.values()))
+
+    created = 0
+    added = enabled - was_enabled
+    if added:
+        classes = await storage.classes.occurring(now, UNBOUNDED, user["email"])
+        created = await schedule_in_materialized_window(classes, users=[user], only_channels=added)
+    return changed + created
+
+async def reschedule_class_reminders(class_obj: Dict) -> int:
+    """Replace a class's waiting reminders after its time, recurrence or teacher changed"""
+    # Suppressed rows go too, or a later preference change would revive them for the old time
+    deleted = await storage.reminders.delete_waiting(class_obj["id"])
+    created = await schedule_in_materialized_window([class_obj])
+    return deleted + created
+
+async def extend_reminder_horizon():
+    """Background job to materialize reminders for recurring classes up to the rolling horizon"""
+    try:
+        if not await acquire_job_lease("extend_reminder_horizon", 30 * 60):
+            return
+        horizon_end = datetime.now(timezone.utc) + REMINDER_HORIZON
+        # Each batch is marked materialized, so the next call returns the classes after it
+        while batch := await storage.classes.behind_horizon(horizon_end, UPLOAD_BATCH_SIZE):
+            # Classes in a batch usually share the same materialized_until
+            groups: Dict[Optional[datetime], List[Dict]] = {}
+            for class_obj in batch:
+                groups.setdefault(class_obj.get("materialized_until"), []).append(class_obj)
+            for materialized_until, group in groups.items():
+                window_start = parse_datetime(materialized_until) if materialized_until else None
+                await schedule_reminders_for_classes(group, window_start, horizon_end)
+            await storage.classes.set_materialized_until([c["id"] for c in batch], horizon_end)
+    except Exception as e:
+        logging.error(f"Reminder horizon error: {str(e)}")
+
+async def schedule_class_reminders(class_obj: Dict):
+    """Schedule reminders for a class"""
+    try:
+        await schedule_reminders_for_classes([class_obj], window_end=parse_datetime(class_obj["materialized_until"]))
     except Exception as e:
         logging.error(f"Schedule reminder error: {str(e)}")
 
+def validate_timetable_frame(df: "pd.DataFrame", first_row: int = 2):
+    """Validate and normalise an uploaded timetable in vectorized form.
+
+    Returns the valid rows as a DataFrame of class fields plus a list of
+    per-row errors keyed by the spreadsheet row number, where `first_row`
+    is the number of the frame's first row (the header is row 1).
+    """
+    import pandas as pd
+
+    df = df.reset_index(drop=True)
+    errors = pd.Series([[] for _ in range(len(df))], dtype=object)
+
+    def flag(mask: pd.Series, message: str):
+        for idx in mask[mask].index:
+            errors[idx].append(message)
+
+    title = df['class_title'].astype("string").str.strip()
+    room = df['room'].astype("string").str.strip()
+    teacher_email = df['teacher_email'].astype("string").str.strip()
+    start = pd.to_datetime(df['start_datetime'], errors="coerce", utc=True, format="mixed")
+    end = pd.to_datetime(df['end_datetime'], errors="coerce", utc=True, format="mixed")
+    if 'recurrence' in df.columns:
+        recurrence = df['recurrence'].astype("string").str.strip().str.upper().fillna("ONCE")
+    else:
+        recurrence = pd.Series("ONCE", index=df.index, dtype="string")
+    if 'repeat_until' in df.columns:
+        repeat_until_raw = df['repeat_until'].astype("string").str.strip().replace("", pd.NA)
+        repeat_until = pd.to_datetime(repeat_until_raw, errors="coerce", utc=True, format="mixed")
+    else:
+        repeat_until_raw = pd.Series(pd.NA, index=df.index, dtype="string")
+        repeat_until = pd.Series(pd.NaT, index=df.index, dtype="datetime64[ns, UTC]")
+    if 'timezone' in df.columns:
+        tz_name = df['timezone'].astype("string").str.strip().replace("", pd.NA).fillna(CLASS_TIMEZONE)
+    else:
+        tz_name = pd.Series(CLASS_TIMEZONE, index=df.index, dtype="string")
+
+    flag(title.fillna("").eq(""), "class_title is required")
+    flag(room.fillna("").eq(""), "room is required")
+    flag(~teacher_email.fillna("").str.match(EMAIL_PATTERN), "teacher_email is invalid")
+    flag(start.isna(), "start_datetime is invalid")
+    flag(end.isna(), "end_datetime is invalid")
+    flag(start.notna() & end.notna() & (end <= start), "end_datetime must be after start_datetime")
+    flag(~recurrence.isin(RECURRENCE_TYPES), "recurrence must be one of ONCE, WEEKLY, ODD_WEEKS, EVEN_WEEKS")
+    flag(repeat_until_raw.notna() & repeat_until.isna(), "repeat_until is invalid")
+    flag(~tz_name.isin([name for name in tz_name.unique() if is_timezone(name)]), "timezone is not a known IANA timezone")
+
+    valid = errors.map(len).eq(0)
+    row_errors = [
+        {"row": int(idx) + first_row, "errors": errors[idx]}
+        for idx in valid[~valid].index
+    ]
+
+    def to_datetimes(series: pd.Series) -> pd.Series:
+        # Plain aware datetimes (None for NaT) so they are stored as BSON dates
+        return series.astype(object).where(series.notna(), None)
+    
+    classes = pd.DataFrame({
+        "title": title[valid],
+        "room": room[valid],
+        "teacher_email": teacher_email[valid],
+        "start_datetime": to_datetimes(start[valid]),
+        "end_datetime": to_datetimes(end[valid]),
+        "recurrence": recurrence[valid],
+        "repeat_until": to_datetimes(repeat_until[valid]),
+        "timezone": tz_name[valid],
+    })
+    # Keep the source row number so write errors can be reported per row
+    classes.index = classes.index + first_row
+    return classes, row_errors
+
+async def persist_timetable_classes(classes: "pd.DataFrame", horizon_end: datetime):
+    """Insert validated classes in unordered batches so one bad row does not abort the rest.
+
+    Returns the inserted class documents and the per-row write errors.
+    """
+    created_at = datetime.now(timezone.utc)
+    rows = classes.index.tolist()
+    class_docs = classes.to_dict("records")
+    for doc in class_docs:
+        doc["id"] = str(uuid.uuid4())
+        doc["exception_dates"] = []
+        doc["materialized_until"] = horizon_end
+        doc["created_at"] = created_at
+
+    inserted = []
+    write_errors = []
+    for i in range(0, len(class_docs), UPLOAD_BATCH_SIZE):
+        batch = class_docs[i:i + UPLOAD_BATCH_SIZE]
+        failed = set()
+        for index, error in await storage.classes.insert_many(batch):
+            failed.add(index)
+            write_errors.append({"row": rows[i + index], "errors": [error]})
+        inserted.extend(doc for j, doc in enumerate(batch) if j not in failed)
+    agenda_cache.invalidate_classes(inserted)
+    return inserted, write_errors
+
+def read_timetable_header(path: str, filename: str) -> List[str]:
+    """Read only the header row of a CSV or .xlsx timetable"""
+    if filename.endswith('.csv'):
+        import pandas as pd
+        return [str(col) for col in pd.read_csv(path, dtype=str, nrows=0).columns]
+    from openpyxl import load_workbook
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        header = next(workbook.active.iter_rows(max_row=1, values_only=True), ())
+        return [str(col).strip() for col in header if col is not None]
+    finally:
+        workbook.close()
+
+def iter_timetable_chunks(path: str, filename: str):
+    """Yield DataFrames of at most UPLOAD_CHUNK_ROWS rows from a CSV or .xlsx timetable"""
+    import pandas as pd
+
+    if filename.endswith('.csv'):
+        with pd.read_csv(path, dtype=str, chunksize=UPLOAD_CHUNK_ROWS) as reader:
+            yield from reader
+        return
+
+    from openpyxl import load_workbook
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [str(col).strip() if col is not None else "" for col in next(rows, ())]
+        chunk = []
+        for row in rows:
+            chunk.append(row[:len(header)])
+            if len(chunk) >= UPLOAD_CHUNK_ROWS:
+                yield pd.DataFrame(chunk, columns=header)
+                chunk = []
+        if chunk:
+            yield pd.DataFrame(chunk, columns=header)
+    finally:
+        workbook.close()
+
+async def save_upload_job(job: Dict[str, Any]):
+    """Write an import job's progress to `upload_jobs` so any worker can serve polls for it"""
+    await storage.upload_jobs.save(job)
+
+async def run_timetable_import_job(job: Dict[str, Any], path: str, filename: str):
+    """Validate and persist a spooled timetable one chunk at a time"""
+    job["status"] = "running"
+    await save_upload_job(job)
+    chunks = iter_timetable_chunks(path, filename)
+    first_row = 2
+    try:
+        while True:
+            # File reads and parsing happen off the event loop
+            df = await asyncio.to_thread(next, chunks, None)
+            if df is None:
+                break
+
+            classes, row_errors = validate_timetable_frame(df, first_row)
+            # Earlier chunks are already stored, so they are checked as existing classes
+            classes, conflict_errors, conflicts = await reject_booking_conflicts(classes)
+            row_errors.extend(conflict_errors)
+            job["conflict_count"] += len(conflicts)
+            horizon_end = datetime.now(timezone.utc) + REMINDER_HORIZON
+            inserted, write_errors = await persist_timetable_classes(classes, horizon_end)
+            job["reminders_created"] += await schedule_reminders_for_classes(inserted, window_end=horizon_end)
+
+            first_row += len(df)
+            job["rows_processed"] += len(df)
+            job["classes_created"] += len(inserted)
+            job["chunks_processed"] += 1
+            chunk_errors = sorted(row_errors + write_errors, key=lambda e: e["row"])
+            job["error_count"] += len(chunk_errors)
+            room = UPLOAD_JOB_MAX_ERRORS - len(job["errors"])
+            job["errors"].extend(chunk_errors[:max(room, 0)])
+            await save_upload_job(job)
+        job["status"] = "completed"
+    except Exception as e:
+        logging.error(f"Upload job {job['id']} failed: {str(e)}")
+        job["status"] = "failed"
+        job["error"] = str(e)
+    finally:
+        chunks.close()
+        os.unlink(path)
+        job["finished_at"] = datetime.now(timezone.utc)
+        await save_upload_job(job)
+
+async def start_timetable_import_job(file: UploadFile, background_tasks: BackgroundTasks) -> Dict[str, Any]:
+    """Spool an upload to disk in fixed-size reads and queue it for chunked import"""
+    if not file.filename.endswith(('.csv', '.xlsx')):
+        raise HTTPException(status_code=400, detail="Streaming upload supports CSV and .xlsx files only")
+
+    suffix = Path(file.filename).suffix
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as spool:
+        while chunk := await file.read(UPLOAD_READ_BYTES):
+            spool.write(chunk)
+        path = spool.name
+
+    try:
+        header = await asyncio.to_thread(read_timetable_header, path, file.filename)
+        missing = [col for col in REQUIRED_TIMETABLE_COLUMNS if col not in header]
+        if missing:
+            raise HTTPException(status_code=400, detail=f"Missing columns: {missing}")
+    except Exception as e:
+        os.unlink(path)
+        if isinstance(e, HTTPException):
+            raise
+        raise HTTPException(status_code=400, detail=f"Could not read file: {str(e)}")
+
+    job = {
+        "id": str(uuid.uuid4()),
+        "filename": file.filename,
+        "status": "queued",
+        "rows_processed": 0,
+        "chunks_processed": 0,
+        "classes_created": 0,
+        "reminders_created": 0,
+        "conflict_count": 0,
+        "error_count": 0,
+        "errors": [],
+        "error": None,
+        "worker": WORKER_ID,
+        "created_at": datetime.now(timezone.utc),
+        "finished_at": None
+    }
+    # Stored rather than kept in memory: polls may reach any worker
+    await storage.upload_jobs.insert(job)
+    background_tasks.add_task(run_timetable_import_job, job, path, file.filename)
+    return job
+
+# --- Delivery Statistics ---
+async def rollup_logs():
+    """Background job compacting each completed hour of raw logs into hourly rollups.
+
+    Resumes after the newest rolled-up hour and replaces rollups by (hour,
+    channel, status), so reruns are harmless; the raw logs then expire.
+    Each rollup holds the count, lag sum and max, and a sparse histogram of
+    lag over LAG_BUCKETS, so percentiles survive once the raw logs are gone.
+    """
+    try:
+        if not await acquire_job_lease("rollup_logs", 30 * 60):
+            return
+        current_hour = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+        latest = await storage.logs.last_rollup_hour()
+        start = parse_datetime(latest) + timedelta(hours=1) if latest else None
+        await storage.logs.roll_up(start, current_hour)
+    except Exception as e:
+        logging.error(f"Log rollup error: {str(e)}")
+
+def lag_percentile(histogram: Dict[int, int], total: int, percentile: float, lag_max: Optional[float]) -> Optional[float]:
+    """Estimate a lag percentile from the histogram.
+
+    Lags are assumed spread evenly within the bucket holding the rank, so
+    the estimate is interpolated between the bucket's bounds; the last
+    bucket and any bucket above the observed maximum end at `lag_max`.
+    """
+    if not total:
+        return None
+    rank = total * percentile / 100
+    seen = 0
+    for bucket in sorted(histogram):
+        count = histogram[bucket]
+        if seen + count >= rank and count:
+            lower = LAG_BUCKETS[bucket - 1] if bucket > 0 else 0
+            upper = LAG_BUCKETS[bucket] if bucket < len(LAG_BUCKETS) else lag_max
+            if lag_max is not None:
+                upper = min(upper, lag_max)
+                lower = min(lower, upper)
+            return round(lower + (upper - lower) * (rank - seen) / count, 3)
+        seen += count
+    return lag_max
+
+async def get_delivery_stats(start: datetime, end: datetime, bucket: str) -> List[Dict[str, Any]]:
+    """Counts per status and lag percentiles per channel, by hour or day.
+
+    Hours already rolled up are read from the rollups; newer hours are
+    summarised from the raw logs the same way.
+    """
+    start = start.replace(minute=0, second=0, microsecond=0)
+    latest = await storage.logs.last_rollup_hour()
+    watermark = parse_datetime(latest) + timedelta(hours=1) if latest else start
+    watermark = min(max(watermark, start), end)
+
+    summaries = await storage.logs.rollups(start, watermark)
+    summaries += await storage.logs.summarise(watermark, end)
+
+    periods: Dict[Tuple[datetime, str], Dict[str, Any]] = {}
+    for summary in summaries:
+        hour = parse_datetime(summary["hour"])
+        period = hour if bucket == "hour" else hour.replace(hour=0)
+        entry = periods.setdefault((period, summary["channel"]), {
+            "counts": {}, "lag_sum": 0.0, "lag_max": None, "lag_count": 0, "histogram": {}
+        })
+        entry["counts"][summary["status"]] = entry["counts"].get(summary["status"], 0) + summary["count"]
+        if summary["status"] != "sent":
+            continue
+        # Lag is reported for delivered reminders only
+        entry["lag_sum"] += summary["lag_sum"]
+        if summary.get("lag_max") is not None:
+            entry["lag_max"] = max(entry["lag_max"] or 0, summary["lag_max"])
+        for item in summary["lag_histogram"]:
+            if item["bucket"] is not None:
+                entry["histogram"][item["bucket"]] = entry["histogram"].get(item["bucket"], 0) + item["count"]
+                entry["lag_count"] += item["count"]
+
+    series = []
+    for (period, channel), entry in sorted(periods.items()):
+        lag = {f"p{p}": lag_percentile(entry["histogram"], entry["lag_count"], p, entry["lag_max"]) for p in STATS_PERCENTILES}
+        lag["mean"] = round(entry["lag_sum"] / entry["lag_count"], 3) if entry["lag_count"] else None
+        lag["max"] = entry["lag_max"]
+        series.append({"period": period, "channel": channel, "counts": entry["counts"], "lag_seconds": lag})
+    return series
+
+# --- Pagination ---
+def encode_cursor(values: List[Any]) -> str:
+    """Pack the sort key of the last returned row into an opaque token"""
+    packed = [{"d": v.isoformat()} if isinstance(v, datetime) else v for v in values]
+    return base64.urlsafe_b64encode(json.dumps(packed).encode()).decode()
+
+def decode_cursor(cursor: str) -> List[Any]:
+    try:
+        packed = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return [parse_datetime(v["d"]) if isinstance(v, dict) else v for v in packed]
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+async def paginate(
+    fetch: Callable[[int, Optional[List[Any]]], Any],
+    key_fields: List[str],
+    limit: int,
+    cursor: Optional[str],
+    response: Response
+) -> List[Dict]:
+    """Return one keyset page and put the token for the next one in the X-Next-Cursor header.
+
+    `fetch(limit, after)` is a repository's paged read and `key_fields` its
+    sort key, which ends in a unique field so every page costs the same
+    whatever its position.
+    """
+    after = decode_cursor(cursor) if cursor else None
+    # Fetch one extra row to learn whether another page exists
+    rows = await fetch(limit + 1, after)
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor([rows[-1][field] for field in key_fields])
+    return rows
+
+# --- JSON Responses ---
+def json_default(value: Any) -> Any:
+    """Encode the few types orjson does not handle natively"""
+    if isinstance(value, datetime):
+        # datetime subclasses such as pandas Timestamps
+        return value.isoformat()
+    if isinstance(value, BaseModel):
+        # As FastAPI encodes models, so datetimes keep Pydantic's formatting
+        return value.model_dump(mode="json")
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    return str(value)
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=json_default, option=orjson.OPT_NON_STR_KEYS)
+
+def fast_json(content: Any, response: Optional[Response] = None) -> FastJSONResponse:
+    """Encode documents straight to JSON bytes for the hot read endpoints.
+
+    Returning a Response skips FastAPI's jsonable_encoder walk, so content
+    must already be JSON-shaped: projected documents without _id. Headers set
+    on the injected `response`, like the next-page cursor, are carried over.
+    """
+    return FastJSONResponse(content, headers=dict(response.headers) if response is not None else None)
+
+# --- Exports ---
+def export_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, list):
+        return ";".join(str(v) for v in value)
+    return value
+
+async def iter_export(columns: List[str], docs: AsyncIterator[Dict], fmt: str):
+    """Yield NDJSON lines or CSV rows straight from the stored documents, a batch at a time"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if fmt == "csv":
+        writer.writerow(columns)
+
+    rows = 0
+    async for doc in docs:
+        if fmt == "csv":
+            writer.writerow([export_value(doc.get(column)) for column in columns])
+        else:
+            buffer.write(json.dumps(doc, default=export_value))
+            buffer.write("\n")
+        rows += 1
+        if rows % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+def export_response(collection: str, start: Optional[datetime], end: Optional[datetime], fmt: str):
+    if fmt not in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail="format must be ndjson or csv")
+    start = parse_datetime(start) if start else None
+    end = parse_datetime(end) if end else None
+    docs = getattr(storage, collection).iter_range(start, end, EXPORT_BATCH_SIZE)
+    
+    media_type = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        iter_export(EXPORT_COLUMNS[collection], docs, fmt),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{collection}.{fmt}"'}
+    )
+
+# --- Import Time ---
+LAZY_MODULES = ("pandas", "numpy", "openpyxl")
+
+# Runs in a fresh interpreter so the numbers are a real cold start
+IMPORT_PROBE = """
+import json, resource, sys, time
+started = time.perf_counter()
+import server
+boot_ms = (time.perf_counter() - started) * 1000
+boot_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+loaded = sorted(name for name in server.LAZY_MODULES if name in sys.modules)
+started = time.perf_counter()
+import pandas, openpyxl
+print(json.dumps({
+    "boot_ms": round(boot_ms, 1),
+    "boot_max_rss_mb": round(boot_rss / 1024, 1),
+    "lazy_modules_loaded_at_boot": loaded,
+    "upload_dependencies_ms": round((time.perf_counter() - started) * 1000, 1),
+    "max_rss_with_upload_dependencies_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+}))
+"""
+
+def parse_import_times(stderr: str) -> List[Dict[str, Any]]:
+    """Parse `python -X importtime` output into (module, depth, self, cumulative) entries in output order"""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        entries.append({
+            "module": name.strip(),
+            # One separator space, then two spaces per nesting level
+            "depth": (len(name) - len(name.lstrip()) - 1) // 2,
+            "self_ms": int(self_us) / 1000,
+            "cumulative_ms": int(cumulative_us) / 1000
+        })
+    return entries
+
+def import_time_report(top: int = 15) -> Dict[str, Any]:
+    """Cold-start import cost of the server, its slowest direct imports and the lazily loaded upload stack"""
+    import subprocess
+    import sys
+
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", IMPORT_PROBE],
+        cwd=ROOT_DIR, capture_output=True, text=True, check=True
+    )
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    entries = parse_import_times(result.stderr)
+    # importtime lists a module after everything it imported
+    position = next(i for i, e in enumerate(entries) if e["module"] == "server" and e["depth"] == 0)
+    direct = []
+    for entry in reversed(entries[:position]):
+        if entry["depth"] == 0:
+            break
+        if entry["depth"] == 1:
+            direct.append(entry)
+    server_entry = entries[position]
+    report.update({
+        "server_import_ms": round(server_entry["cumulative_ms"], 1),
+        "server_module_body_ms": round(server_entry["self_ms"], 1),
+        "slowest_imports": [
+            {"module": e["module"], "cumulative_ms": round(e["cumulative_ms"], 1)}
+            for e in sorted(direct, key=lambda e: e["cumulative_ms"], reverse=True)[:top]
+        ]
+    })
+    return report
+
 # --- Auth Routes ---
 @api_router.post("/auth/register")
 async def register(user_data: UserCreate):
     # Check if user exists
-    existing = await db.users.find_one({"email": user_data.email}, {"_id": 0})
+    existing = await storage.users.find_by_email(user_data.email)
     if existing:
         raise HTTPException(status_code=400, detail="Email already registered")
     
     # Hash password and create user
-    hashed_pw = hash_password(user_data.password)
+    hashed_pw = await password_hasher.hash(user_data.password)
     user = User(
         name=user_data.name,
         email=user_data.email,
@@ -269,22 +2061,31 @@ async def register(user_data: UserCreate):
     
     user_dict = user.model_dump()
     user_dict["password"] = hashed_pw
-    user_dict["created_at"] = user_dict["created_at"].isoformat()
     
-    await db.users.insert_one(user_dict)
+    try:
+        await storage.users.insert(user_dict)
+    except DuplicateError:
+        # Lost a race with a concurrent registration for the same email
+        raise HTTPException(status_code=400, detail="Email already registered")
     
     token = create_token(user.id, user.email, user.role)
     return {"token": token, "user": user.model_dump()}
 
 @api_router.post("/auth/login")
 async def login(credentials: UserLogin):
-    user = await db.users.find_one({"email": credentials.email}, {"_id": 0})
-    if not user or not verify_password(credentials.password, user["password"]):
+    user = await storage.users.find_by_email(credentials.email)
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+    valid, new_hash = await password_hasher.verify_and_update(credentials.password, user["password"])
+    if not valid:
         raise HTTPException(status_code=401, detail="Invalid credentials")
+    if new_hash:
+        # The cost factor changed since this hash was made; upgrade it transparently
+        await storage.users.set_password(user["id"], user["password"], new_hash)
     
     token = create_token(user["id"], user["email"], user["role"])
-    user_data = User(**user)
-    return {"token": token, "user": user_data.model_dump()}
+    user_data = User.model_construct(**user)
+    return fast_json({"token": token, "user": user_data.model_dump()})
 
 @api_router.get("/auth/me")
 async def get_me(current_user: User = Depends(get_current_user)):
@@ -292,92 +2093,270 @@ async def get_me(current_user: User = Depends(get_current_user)):
 
 # --- Admin Routes ---
 @api_router.post("/admin/timetables/upload")
-async def upload_timetable(file: UploadFile = File(...), current_user: User = Depends(get_current_user)):
+async def upload_timetable(
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    stream: bool = False,
+    current_user: User = Depends(get_current_user)
+):
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
     
+    # Large files: import chunk by chunk in the background and poll the job
+    if stream:
+        job = await start_timetable_import_job(file, background_tasks)
+        return {"success": True, "job_id": job["id"], "status": job["status"]}
+    
+    timings: Dict[str, float] = {}
+    stage_start = time.perf_counter()
+
+    def mark(stage: str):
+        nonlocal stage_start
+        now = time.perf_counter()
+        timings[stage] = round((now - stage_start) * 1000, 2)
+        stage_start = now
+
     try:
+        # The first upload in a process loads pandas; keep that off the event loop
+        pd = await asyncio.to_thread(importlib.import_module, "pandas")
+        mark("import_ms")
         contents = await file.read()
         
         # Parse CSV or Excel
         if file.filename.endswith('.csv'):
-            df = pd.read_csv(io.BytesIO(contents))
+            df = pd.read_csv(io.BytesIO(contents), dtype=str)
         elif file.filename.endswith(('.xlsx', '.xls')):
             df = pd.read_excel(io.BytesIO(contents))
         else:
             raise HTTPException(status_code=400, detail="Only CSV and Excel files supported")
+        mark("parse_ms")
         
         # Validate columns
-        required_cols = ['class_title', 'room', 'teacher_email', 'start_datetime', 'end_datetime']
-        missing = [col for col in required_cols if col not in df.columns]
+        missing = [col for col in REQUIRED_TIMETABLE_COLUMNS if col not in df.columns]
         if missing:
             raise HTTPException(status_code=400, detail=f"Missing columns: {missing}")
         
-        # Create classes
-        classes_created = 0
-        for _, row in df.iterrows():
-            class_obj = Class(
-                title=row['class_title'],
-                room=row['room'],
-                teacher_email=row['teacher_email'],
-                start_datetime=pd.to_datetime(row['start_datetime']),
-                end_datetime=pd.to_datetime(row['end_datetime']),
-                recurrence=row.get('recurrence', 'ONCE')
-            )
-            
-            class_dict = class_obj.model_dump()
-            class_dict["start_datetime"] = class_dict["start_datetime"].isoformat()
-            class_dict["end_datetime"] = class_dict["end_datetime"].isoformat()
-            class_dict["created_at"] = class_dict["created_at"].isoformat()
-            
-            await db.classes.insert_one(class_dict)
-            
-            # Schedule reminders
-            await schedule_class_reminders(class_dict)
-            
-            classes_created += 1
+        classes, row_errors = validate_timetable_frame(df)
+        mark("validate_ms")
+        
+        classes, conflict_errors, conflicts = await reject_booking_conflicts(classes)
+        row_errors.extend(conflict_errors)
+        mark("conflicts_ms")
+        
+        horizon_end = datetime.now(timezone.utc) + REMINDER_HORIZON
+        inserted, write_errors = await persist_timetable_classes(classes, horizon_end)
+        row_errors.extend(write_errors)
+        mark("insert_classes_ms")
         
-        return {"success": True, "classes_created": classes_created}
+        # Schedule reminders
+        reminders_created = 0
+        try:
+            reminders_created = await schedule_reminders_for_classes(inserted, window_end=horizon_end)
+        except Exception as e:
+            logging.error(f"Schedule reminder error: {str(e)}")
+        mark("schedule_reminders_ms")
+        
+        row_errors.sort(key=lambda e: e["row"])
+        return {
+            "success": True,
+            "rows_total": len(df),
+            "classes_created": len(inserted),
+            "reminders_created": reminders_created,
+            "errors": row_errors,
+            "conflicts": conflicts,
+            "timings": timings
+        }
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Upload error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@api_router.get("/admin/timetables/jobs/{job_id}")
+async def get_upload_job(job_id: str, current_user: User = Depends(get_current_user)):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    job = await storage.upload_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Upload job not found")
+    return job
+
 @api_router.post("/admin/classes")
 async def create_class(class_data: Class, current_user: User = Depends(get_current_user)):
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
     
+    if class_data.recurrence not in RECURRENCE_TYPES:
+        raise HTTPException(status_code=400, detail="recurrence must be one of ONCE, WEEKLY, ODD_WEEKS, EVEN_WEEKS")
+    if not is_timezone(class_data.timezone):
+        raise HTTPException(status_code=400, detail=f"Unknown timezone: {class_data.timezone}")
+    
     class_dict = class_data.model_dump()
-    class_dict["start_datetime"] = class_dict["start_datetime"].isoformat()
-    class_dict["end_datetime"] = class_dict["end_datetime"].isoformat()
-    class_dict["created_at"] = class_dict["created_at"].isoformat()
+    class_dict["start_datetime"] = parse_datetime(class_dict["start_datetime"])
+    class_dict["end_datetime"] = parse_datetime(class_dict["end_datetime"])
+    if class_dict["repeat_until"]:
+        class_dict["repeat_until"] = parse_datetime(class_dict["repeat_until"])
+    class_dict["exception_dates"] = [d.isoformat() for d in class_dict["exception_dates"]]
+    class_dict["materialized_until"] = datetime.now(timezone.utc) + REMINDER_HORIZON
     
-    await db.classes.insert_one(class_dict)
+    conflicts = await check_booking_conflicts([(None, class_dict)])
+    if conflicts:
+        raise HTTPException(status_code=409, detail={"message": "Room or teacher is double-booked", "conflicts": conflicts})
+    
+    await storage.classes.insert(class_dict)
+    agenda_cache.invalidate_classes([class_dict])
     await schedule_class_reminders(class_dict)
     
     return {"success": True, "class": class_data.model_dump()}
 
+@api_router.put("/admin/classes/{class_id}")
+async def update_class(class_id: str, changes: ClassUpdate, current_user: User = Depends(get_current_user)):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    update_data = changes.model_dump(exclude_unset=True)
+    # Only repeat_until may be cleared; every other field is required on a class
+    cleared = [field for field, value in update_data.items() if value is None and field != "repeat_until"]
+    if cleared:
+        raise HTTPException(status_code=422, detail=f"{', '.join(cleared)} cannot be null")
+    if "recurrence" in update_data and update_data["recurrence"] not in RECURRENCE_TYPES:
+        raise HTTPException(status_code=400, detail="recurrence must be one of ONCE, WEEKLY, ODD_WEEKS, EVEN_WEEKS")
+    if "timezone" in update_data and not is_timezone(update_data["timezone"]):
+        raise HTTPException(status_code=400, detail=f"Unknown timezone: {update_data['timezone']}")
+    for field in ("start_datetime", "end_datetime", "repeat_until"):
+        if update_data.get(field):
+            update_data[field] = parse_datetime(update_data[field])
+    if not update_data:
+        raise HTTPException(status_code=400, detail="No changes given")
+    
+    existing = await storage.classes.get(class_id)
+    if not existing:
+        raise HTTPException(status_code=404, detail="Class not found")
+    class_obj = {**existing, **update_data}
+    if parse_datetime(class_obj["end_datetime"]) <= parse_datetime(class_obj["start_datetime"]):
+        raise HTTPException(status_code=400, detail="end_datetime must be after start_datetime")
+    if update_data.keys() & {"room", "teacher_email", "start_datetime", "end_datetime", "recurrence", "repeat_until", "timezone"}:
+        conflicts = await check_booking_conflicts([(None, class_obj)], exclude_id=class_id)
+        if conflicts:
+            raise HTTPException(status_code=409, detail={"message": "Room or teacher is double-booked", "conflicts": conflicts})
+    
+    await storage.classes.update(class_id, update_data)
+    agenda_cache.invalidate_classes([existing, class_obj])
+    
+    # Title and room are read at send time; anything else invalidates the schedule
+    rescheduled = 0
+    if update_data.keys() & {"teacher_email", "start_datetime", "end_datetime", "recurrence", "repeat_until", "timezone"}:
+        rescheduled = await reschedule_class_reminders(class_obj)
+    
+    return {"success": True, "class": class_obj, "reminders_rescheduled": rescheduled}
+
+@api_router.post("/admin/classes/{class_id}/exceptions")
+async def cancel_class_occurrence(class_id: str, exception: ClassException, current_user: User = Depends(get_current_user)):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    existing = await storage.classes.add_exception_date(class_id, exception.date.isoformat())
+    if existing is None:
+        raise HTTPException(status_code=404, detail="Class not found")
+    # The pre-update document still yields the cancelled occurrence
+    agenda_cache.invalidate_classes([existing])
+    
+    # Drop reminders already materialized for the cancelled occurrence, on its local day
+    tz = class_timezone(existing)
+    day_start = datetime.combine(exception.date, datetime.min.time(), tzinfo=tz).astimezone(timezone.utc)
+    day_end = datetime.combine(exception.date + timedelta(days=1), datetime.min.time(), tzinfo=tz).astimezone(timezone.utc)
+    deleted = await storage.reminders.delete_waiting(class_id, day_start, day_end)
+    
+    return {"success": True, "reminders_cancelled": deleted}
+
 @api_router.get("/admin/upcoming")
-async def get_upcoming_classes(hours: int = 24, current_user: User = Depends(get_current_user)):
+async def get_upcoming_classes(
+    response: Response,
+    hours: int = 24,
+    limit: int = Query(MAX_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
     
     now = datetime.now(timezone.utc)
     future = now + timedelta(hours=hours)
+    after = None
+    if cursor:
+        after = tuple(decode_cursor(cursor))
+        if len(after) != 2 or not isinstance(after[0], datetime):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
     
-    classes = await db.classes.find({
-        "start_datetime": {"$gte": now.isoformat(), "$lte": future.isoformat()}
-    }, {"_id": 0}).to_list(1000)
+    classes = await get_agenda(None, "UTC", now, future)
+    if after:
+        classes = [c for c in classes if (c["start_datetime"], c["id"]) > after]
+    classes = classes[:limit + 1]
+    if len(classes) > limit:
+        classes = classes[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor([classes[-1]["start_datetime"], classes[-1]["id"]])
     
-    return classes
+    return fast_json(classes, response)
 
 @api_router.get("/admin/logs")
-async def get_logs(limit: int = 100, current_user: User = Depends(get_current_user)):
+async def get_logs(
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    logs = await paginate(storage.logs.page, ["timestamp", "id"], limit, cursor, response)
+    return fast_json(logs, response)
+
+@api_router.get("/admin/stats")
+async def get_stats(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    bucket: str = "hour",
+    current_user: User = Depends(get_current_user)
+):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    if bucket not in ("hour", "day"):
+        raise HTTPException(status_code=400, detail="bucket must be hour or day")
+    
+    end = parse_datetime(end) if end else datetime.now(timezone.utc)
+    start = parse_datetime(start) if start else end - timedelta(days=1)
+    series = await get_delivery_stats(start, end, bucket)
+    totals: Dict[str, Dict[str, int]] = {}
+    for point in series:
+        channel_totals = totals.setdefault(point["channel"], {})
+        for status, count in point["counts"].items():
+            channel_totals[status] = channel_totals.get(status, 0) + count
+    return {"start": start, "end": end, "bucket": bucket, "totals": totals, "series": series}
+
+@api_router.get("/admin/export/logs")
+async def export_logs(
+    format: str = "ndjson",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    current_user: User = Depends(get_current_user)
+):
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    logs = await db.logs.find({}, {"_id": 0}).sort("timestamp", -1).to_list(limit)
-    return logs
+    return export_response("logs", start, end, format)
+
+@api_router.get("/admin/export/classes")
+async def export_classes(
+    format: str = "ndjson",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    current_user: User = Depends(get_current_user)
+):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    return export_response("classes", start, end, format)
 
 @api_router.post("/admin/test-reminder")
 async def test_reminder(user_email: str, current_user: User = Depends(get_current_user)):
@@ -391,40 +2370,141 @@ async def test_reminder(user_email: str, current_user: User = Depends(get_curren
         "lead_time": 15
     }
     
-    success = await send_email_reminder(user_email, test_class)
-    return {"success": success}
+    error = await send_email_reminder(user_email, test_class)
+    return {"success": error is None, "error": str(error) if error else None}
+
+@api_router.get("/admin/scheduler")
+async def get_scheduler_status(current_user: User = Depends(get_current_user)):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    next_due = reminder_dispatcher.next_due
+    return {
+        "running": reminder_dispatcher.running,
+        "next_due": next_due.isoformat() if next_due else None,
+        "batch_size": reminder_dispatcher.batch_size,
+        "last_drain": reminder_dispatcher.last_drain,
+        "backlog": await get_reminder_backlog()
+    }
+
+@api_router.get("/admin/reminders/retries")
+async def get_retry_queue(
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    reminders = await paginate(storage.reminders.page_retrying, ["scheduled_time", "id"], limit, cursor, response)
+    return fast_json(reminders, response)
+
+@api_router.get("/admin/dead-letters")
+async def get_dead_letters(
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    dead_letters = await paginate(storage.dead_letters.page, ["dead_lettered_at", "id"], limit, cursor, response)
+    return fast_json(dead_letters, response)
+
+@api_router.post("/admin/dead-letters/{reminder_id}/requeue")
+async def requeue_dead_letter(reminder_id: str, current_user: User = Depends(get_current_user)):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    dead_letter = await storage.dead_letters.get(reminder_id)
+    if not dead_letter:
+        raise HTTPException(status_code=404, detail="Dead letter not found")
+    now = datetime.now(timezone.utc)
+    if not dead_letter.get("occurrence_start"):
+        raise HTTPException(status_code=409, detail="Cannot requeue a legacy reminder without an occurrence start")
+    if parse_datetime(dead_letter["occurrence_start"]) <= now:
+        raise HTTPException(status_code=409, detail="Class has already started")
+    
+    # A fresh attempt budget, sent as soon as the dispatcher wakes
+    if not await storage.reminders.requeue(reminder_id, now, dead_letter["scheduled_time"]):
+        raise HTTPException(status_code=409, detail="Reminder no longer exists or is not failed")
+    await storage.dead_letters.delete(reminder_id)
+    reminder_dispatcher.notify([now])
+    return {"success": True}
+
+@api_router.get("/admin/diagnostics/indexes")
+async def get_index_diagnostics(current_user: User = Depends(get_current_user)):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    report = await storage.explain_queries()
+    return {
+        "queries": report,
+        "collection_scans": [r["query"] for r in report if r["collection_scan"]]
+    }
 
 @api_router.get("/admin/users")
-async def get_all_users(current_user: User = Depends(get_current_user)):
+async def get_all_users(
+    response: Response,
+    limit: int = Query(MAX_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    users = await db.users.find({}, {"_id": 0, "password": 0}).to_list(1000)
-    return users
+    users = await paginate(storage.users.page, ["created_at", "id"], limit, cursor, response)
+    return fast_json(users, response)
 
 # --- Staff Routes ---
 @api_router.get("/users/me/timetable")
-async def get_my_timetable(current_user: User = Depends(get_current_user)):
-    classes = await db.classes.find(
-        {"teacher_email": current_user.email},
-        {"_id": 0}
-    ).to_list(1000)
-    return classes
+async def get_my_timetable(
+    response: Response,
+    limit: int = Query(MAX_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    classes = await paginate(
+        lambda limit, after: storage.classes.page_for_teacher(current_user.email, limit, after),
+        ["start_datetime", "id"],
+        limit,
+        cursor,
+        response
+    )
+    return fast_json([class_view(c) for c in classes], response)
 
 @api_router.put("/users/me/preferences")
 async def update_preferences(prefs: PreferencesUpdate, current_user: User = Depends(get_current_user)):
     update_data = {}
+    if prefs.timezone is not None:
+        try:
+            ZoneInfo(prefs.timezone)
+        except (ZoneInfoNotFoundError, ValueError):
+            raise HTTPException(status_code=400, detail=f"Unknown timezone: {prefs.timezone}")
     if prefs.lead_time_minutes is not None:
-        update_data["preferences.lead_time_minutes"] = prefs.lead_time_minutes
+        update_data["lead_time_minutes"] = prefs.lead_time_minutes
     if prefs.channels is not None:
-        update_data["preferences.channels"] = prefs.channels
+        update_data["channels"] = prefs.channels
     if prefs.quiet_hours is not None:
-        update_data["preferences.quiet_hours"] = prefs.quiet_hours
+        for key in ("start", "end"):
+            try:
+                datetime.strptime(prefs.quiet_hours.get(key, "00:00"), "%H:%M")
+            except (TypeError, ValueError):
+                raise HTTPException(status_code=400, detail=f"Quiet hours {key} must be HH:MM")
+        update_data["quiet_hours"] = prefs.quiet_hours
     
-    await db.users.update_one(
-        {"id": current_user.id},
-        {"$set": update_data}
-    )
+    if prefs.timezone is None and not update_data:
+        return {"success": True}
+    
+    user = await storage.users.update_preferences(current_user.id, prefs.timezone, update_data)
+    user_cache.invalidate(current_user.id)
+    if prefs.timezone is not None:
+        # Agenda days are local to the teacher
+        agenda_cache.invalidate_teacher(current_user.email)
+    
+    await reschedule_user_reminders(user, current_user.preferences)
     
     return {"success": True}
 
@@ -433,17 +2513,27 @@ async def get_my_upcoming_classes(days: int = 7, current_user: User = Depends(ge
     now = datetime.now(timezone.utc)
     future = now + timedelta(days=days)
     
-    classes = await db.classes.find({
-        "teacher_email": current_user.email,
-        "start_datetime": {"$gte": now.isoformat(), "$lte": future.isoformat()}
-    }, {"_id": 0}).to_list(1000)
+    classes = await get_agenda(current_user.email, current_user.timezone, now, future)
     
-    return classes
+    return fast_json(classes)
 
 # --- Health Check ---
 @api_router.get("/health")
 async def health_check():
-    return {"status": "healthy", "scheduler": scheduler.running}
+    return {
+        "status": "healthy",
+        "storage": STORAGE_BACKEND,
+        "scheduler": scheduler.running,
+        "dispatcher": reminder_dispatcher.running,
+        "mail": get_mail_transport().stats(),
+        "user_cache": user_cache.stats(),
+        "agenda_cache": agenda_cache.stats(),
+        "password_hasher": password_hasher.stats()
+    }
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
 
 # Include router
 app.include_router(api_router)
@@ -454,7 +2544,9 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
+app.add_middleware(RequestMetricsMiddleware)
 
 # Configure logging
 logging.basicConfig(
@@ -465,12 +2557,52 @@ logger = logging.getLogger(__name__)
 
 @app.on_event("startup")
 async def startup_event():
-    # Start scheduler
-    scheduler.add_job(process_reminders, 'interval', minutes=5)
+    await storage.ensure_indexes()
+    
+    # Reminders are dispatched on time by the dispatcher; the scheduler only reconciles
+    reminder_dispatcher.start()
+    scheduler.add_job(reminder_dispatcher.reconcile, 'interval', minutes=RECONCILE_INTERVAL_MINUTES)
+    scheduler.add_job(extend_reminder_horizon, 'interval', hours=1, next_run_time=datetime.now(timezone.utc))
+    scheduler.add_job(rollup_logs, 'interval', hours=1, next_run_time=datetime.now(timezone.utc))
     scheduler.start()
     logger.info("Scheduler started")
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
     scheduler.shutdown()
-    client.close()
+    await reminder_dispatcher.stop()
+    await get_mail_transport().close()
+    password_hasher.shutdown()
+    storage.close()
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Timetable reminder maintenance commands")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("ensure-indexes", help="Create all declared indexes")
+    commands.add_parser("explain", help="Explain hot queries and flag collection scans")
+    importtime = commands.add_parser("importtime", help="Report cold-start import time and memory")
+    importtime.add_argument("--top", type=int, default=15)
+    migrate = commands.add_parser("migrate-dates", help="Convert ISO-string datetimes to BSON dates")
+    migrate.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    if args.command == "importtime":
+        # Measured in a child interpreter; needs no database connection
+        print(json.dumps(import_time_report(args.top), indent=2))
+        raise SystemExit(0)
+
+    async def run_command():
+        if args.command == "ensure-indexes":
+            await storage.ensure_indexes()
+            print("Indexes ensured")
+        elif args.command == "explain":
+            report = await storage.explain_queries()
+            print(json.dumps(report, indent=2))
+            if any(r["collection_scan"] for r in report):
+                raise SystemExit(1)
+        elif args.command == "migrate-dates":
+            print(json.dumps(await storage.migrate_datetimes(args.batch_size), indent=2))
+
+    asyncio.run(run_command())
@@ -0,0 +1,269 @@
+"""Repositories: the only way the server reads and writes its data.
+
+Each repository exposes the handful of queries its callers need, such as
+`ReminderRepo.claim_due`, `ClassRepo.overlapping` or `LogRepo.page`, rather
+than a general query language. storage_mongo.py implements them on Motor
+and storage_memory.py on plain dicts; STORAGE_BACKEND picks one.
+
+Documents are plain dicts with aware UTC datetimes. Reads never return
+`_id`, and user reads leave out the password hash unless the method says
+otherwise. Paged reads take `limit` and `after`, the sort key values of the
+last row already returned, and return the rows strictly after it.
+"""
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Tuple
+
+REPEATING_RECURRENCES = ["EVEN_WEEKS", "ODD_WEEKS", "WEEKLY"]
+# Reminders that may still be sent or revived
+WAITING_STATUSES = ["pending", "suppressed"]
+# Upper bounds in seconds of the delivery lag histogram; one more bucket holds the rest
+LAG_BUCKETS = [1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600]
+
+COLLECTIONS = ("users", "classes", "reminders", "dead_letters", "logs", "upload_jobs", "job_leases")
+
+
+class DuplicateError(Exception):
+    """A write collided with an existing id or unique field"""
+
+
+class Repo:
+    async def clear(self):
+        """Delete every document; for benchmarks and tests"""
+        raise NotImplementedError
+
+
+class UserRepo(Repo):
+    async def get(self, user_id: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    async def find_by_email(self, email: str) -> Optional[Dict]:
+        """The user with this email, including the password hash"""
+        raise NotImplementedError
+
+    async def find_by_ids(self, user_ids: List[str]) -> List[Dict]:
+        raise NotImplementedError
+
+    async def find_by_emails(self, emails: List[str]) -> List[Dict]:
+        raise NotImplementedError
+
+    async def insert(self, user: Dict):
+        """Store a new user; raises DuplicateError if the id or email is taken"""
+        raise NotImplementedError
+
+    async def set_password(self, user_id: str, old_hash: str, new_hash: str) -> bool:
+        """Replace the hash only if it is still `old_hash`"""
+        raise NotImplementedError
+
+    async def update_preferences(self, user_id: str, timezone: Optional[str], preferences: Dict[str, Any]) -> Optional[Dict]:
+        """Set the timezone (unless None) and the given preference keys; returns the updated user"""
+        raise NotImplementedError
+
+    async def page(self, limit: int, after: Optional[List[Any]] = None) -> List[Dict]:
+        """Users by (created_at, id)"""
+        raise NotImplementedError
+
+
+class ClassRepo(Repo):
+    async def get(self, class_id: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    async def find_by_ids(self, class_ids: List[str]) -> List[Dict]:
+        raise NotImplementedError
+
+    async def insert(self, class_obj: Dict):
+        raise NotImplementedError
+
+    async def insert_many(self, class_objs: List[Dict]) -> List[Tuple[int, str]]:
+        """Store a batch, skipping the rows that fail; returns (position, error) for each"""
+        raise NotImplementedError
+
+    async def update(self, class_id: str, changes: Dict[str, Any]) -> bool:
+        raise NotImplementedError
+
+    async def add_exception_date(self, class_id: str, day: str) -> Optional[Dict]:
+        """Add an ISO date to exception_dates; returns the class as it was before"""
+        raise NotImplementedError
+
+    async def occurring(self, window_start: datetime, window_end: datetime, teacher_email: Optional[str] = None) -> List[Dict]:
+        """One-off classes starting in the window and repeating classes started before its end"""
+        raise NotImplementedError
+
+    async def overlapping(
+        self,
+        window_start: datetime,
+        window_end: datetime,
+        rooms: List[str],
+        teachers: List[str],
+        exclude_id: Optional[str] = None
+    ) -> List[Dict]:
+        """Classes that may occur in the window in one of `rooms` or taught by one of `teachers`"""
+        raise NotImplementedError
+
+    async def behind_horizon(self, horizon_end: datetime, limit: int) -> List[Dict]:
+        """Repeating classes whose reminders are materialized short of `horizon_end`, least advanced first"""
+        raise NotImplementedError
+
+    async def set_materialized_until(self, class_ids: List[str], until: datetime):
+        raise NotImplementedError
+
+    async def page_for_teacher(self, teacher_email: str, limit: int, after: Optional[List[Any]] = None) -> List[Dict]:
+        """A teacher's classes by (start_datetime, id)"""
+        raise NotImplementedError
+
+    def iter_range(self, start: Optional[datetime], end: Optional[datetime], batch_size: int) -> AsyncIterator[Dict]:
+        """Classes starting in [start, end) by (start_datetime, id), read `batch_size` at a time"""
+        raise NotImplementedError
+
+
+class ReminderRepo(Repo):
+    async def claim_due(self, now: datetime, limit: int, worker: str, claim_token: str, lease_expires_at: datetime) -> List[Dict]:
+        """Move up to `limit` pending reminders due by `now` to processing under `claim_token`.
+
+        Returns only the reminders this call won, earliest first; concurrent
+        claims never share a reminder.
+        """
+        raise NotImplementedError
+
+    async def renew_lease(self, claim_token: str, lease_expires_at: datetime) -> int:
+        """Extend the lease of the reminders still processing under a claim; returns how many"""
+        raise NotImplementedError
+
+    async def release_expired(self, now: datetime) -> int:
+        """Return processing reminders whose lease lapsed to pending"""
+        raise NotImplementedError
+
+    async def record_outcomes(self, claim_token: str, outcomes: Dict[str, Dict[str, Any]]):
+        """Set each reminder's outcome fields and release it, if it is still held under `claim_token`"""
+        raise NotImplementedError
+
+    async def insert_many(self, reminders: List[Dict]):
+        raise NotImplementedError
+
+    async def backlog(self, now: datetime) -> Dict[str, Any]:
+        """Overdue pending count, the oldest overdue scheduled_time and the retrying count"""
+        raise NotImplementedError
+
+    async def next_pending_times(self, limit: int) -> List[datetime]:
+        """The earliest `limit` scheduled times of pending reminders, in order"""
+        raise NotImplementedError
+
+    async def waiting_for_user(self, user_id: str, occurring_after: datetime) -> List[Dict]:
+        """A user's pending and suppressed reminders for occurrences after a time"""
+        raise NotImplementedError
+
+    async def update_waiting(self, delete: List[str], suppress: List[str], retime: Dict[str, datetime]):
+        """Delete, suppress or re-time (as pending) reminders, each only if still waiting"""
+        raise NotImplementedError
+
+    async def delete_waiting(self, class_id: str, start: Optional[datetime] = None, end: Optional[datetime] = None) -> int:
+        """Delete a class's waiting reminders, optionally only for occurrences in [start, end)"""
+        raise NotImplementedError
+
+    async def page_retrying(self, limit: int, after: Optional[List[Any]] = None) -> List[Dict]:
+        """Pending reminders that failed at least once, by (scheduled_time, id), without lease fields"""
+        raise NotImplementedError
+
+    async def requeue(self, reminder_id: str, now: datetime, first_scheduled_time: datetime) -> bool:
+        """Make a failed reminder pending again with a fresh attempt budget"""
+        raise NotImplementedError
+
+
+class DeadLetterRepo(Repo):
+    async def upsert_many(self, dead_letters: List[Dict]):
+        """Store dead letters by id, replacing the fields of any already there"""
+        raise NotImplementedError
+
+    async def get(self, reminder_id: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    async def delete(self, reminder_id: str):
+        raise NotImplementedError
+
+    async def count(self) -> int:
+        raise NotImplementedError
+
+    async def page(self, limit: int, after: Optional[List[Any]] = None) -> List[Dict]:
+        """Newest first, by (dead_lettered_at, id) descending"""
+        raise NotImplementedError
+
+
+class LogRepo(Repo):
+    """Delivery logs and their hourly rollups.
+
+    A summary covers one hour, channel and status: `count`, `lag_sum`,
+    `lag_max` and `lag_histogram`, a list of {bucket, count} where bucket is
+    the number of LAG_BUCKETS bounds below the lag (None without a lag).
+    """
+
+    async def insert_many(self, logs: List[Dict]):
+        raise NotImplementedError
+
+    async def page(self, limit: int, after: Optional[List[Any]] = None) -> List[Dict]:
+        """Newest first, by (timestamp, id) descending"""
+        raise NotImplementedError
+
+    def iter_range(self, start: Optional[datetime], end: Optional[datetime], batch_size: int) -> AsyncIterator[Dict]:
+        """Logs timestamped in [start, end) by (timestamp, id), read `batch_size` at a time"""
+        raise NotImplementedError
+
+    async def summarise(self, start: datetime, end: datetime) -> List[Dict]:
+        """Hourly summaries of the raw logs timestamped in [start, end)"""
+        raise NotImplementedError
+
+    async def roll_up(self, start: Optional[datetime], end: datetime):
+        """Store the summaries of [start, end) as rollups, replacing any for the same hours"""
+        raise NotImplementedError
+
+    async def last_rollup_hour(self) -> Optional[datetime]:
+        raise NotImplementedError
+
+    async def rollups(self, start: datetime, end: datetime) -> List[Dict]:
+        """Stored summaries for the hours in [start, end)"""
+        raise NotImplementedError
+
+
+class UploadJobRepo(Repo):
+    async def insert(self, job: Dict):
+        raise NotImplementedError
+
+    async def save(self, job: Dict):
+        """Overwrite a job's progress fields"""
+        raise NotImplementedError
+
+    async def get(self, job_id: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+
+class JobLeaseRepo(Repo):
+    async def acquire(self, name: str, holder: str, now: datetime, expires_at: datetime) -> bool:
+        """Take or extend the lease on a periodic job unless another holder has it until after `now`"""
+        raise NotImplementedError
+
+
+class Storage:
+    """One database: a repository per collection and the maintenance commands"""
+
+    users: UserRepo
+    classes: ClassRepo
+    reminders: ReminderRepo
+    dead_letters: DeadLetterRepo
+    logs: LogRepo
+    upload_jobs: UploadJobRepo
+    job_leases: JobLeaseRepo
+
+    async def ensure_indexes(self):
+        pass
+
+    async def explain_queries(self) -> List[Dict[str, Any]]:
+        """Plans of the hot queries; empty where there is no query planner"""
+        return []
+
+    async def migrate_datetimes(self, batch_size: int = 1000) -> Dict[str, int]:
+        return {}
+
+    async def clear(self, names: Iterable[str] = COLLECTIONS):
+        for name in names:
+            await getattr(self, name).clear()
+
+    def close(self):
+        pass
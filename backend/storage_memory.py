@@ -0,0 +1,571 @@
+"""Dict-backed repositories, selected with STORAGE_BACKEND=memory.
+
+The app starts in milliseconds and runs, or is load-tested, with no MongoDB
+at all; data lives only as long as the process. Each repository keeps its
+documents in `docs`, keyed by id, plus the sorted (key..., id) lists its
+queries bisect, so due reminders, occurrence windows and pages are found
+without scanning. Datetimes are stored as Mongo reads them back: aware UTC,
+truncated to milliseconds. Retention is enforced on write, in place of TTL
+indexes.
+"""
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from storage import (
+    LAG_BUCKETS, REPEATING_RECURRENCES, WAITING_STATUSES, ClassRepo, DeadLetterRepo, DuplicateError, JobLeaseRepo,
+    LogRepo, ReminderRepo, Repo, Storage, UploadJobRepo, UserRepo
+)
+
+LEASE_FIELDS = ("claim_token", "lease_expires_at")
+
+
+def clone(value: Any) -> Any:
+    """Copy the mutable parts of a document; scalars are shared"""
+    if isinstance(value, dict):
+        return {k: clone(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [clone(v) for v in value]
+    return value
+
+
+def to_stored(value: Any) -> Any:
+    """Copy a value as MongoDB would store it.
+
+    Datetimes (including subclasses such as pandas Timestamps) become plain
+    aware UTC datetimes truncated to milliseconds, as the driver reads BSON
+    dates back.
+    """
+    if isinstance(value, dict):
+        return {k: to_stored(v) for k, v in value.items() if k != "_id"}
+    if isinstance(value, (list, tuple)):
+        return [to_stored(v) for v in value]
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        value = value.astimezone(timezone.utc)
+        return datetime(value.year, value.month, value.day, value.hour, value.minute, value.second,
+                        value.microsecond // 1000 * 1000, tzinfo=timezone.utc)
+    return value
+
+
+class SortedIndex:
+    """Sorted (field values..., id) tuples of the documents that have every field set.
+
+    Lookups take key prefixes: `scan` returns the entries between two
+    prefixes and `page` the entries after a full key, both by bisection.
+    """
+
+    def __init__(self, *fields: str, where: Optional[Callable[[Dict], bool]] = None):
+        self.fields = fields
+        self.where = where
+        self.entries: List[Tuple] = []
+
+    def key(self, doc: Dict) -> Optional[Tuple]:
+        values = tuple(doc.get(field) for field in self.fields)
+        if None in values or (self.where is not None and not self.where(doc)):
+            return None
+        return values + (doc["id"],)
+
+    def add(self, doc: Dict):
+        key = self.key(doc)
+        if key is not None:
+            insort(self.entries, key)
+
+    def remove(self, doc: Dict):
+        key = self.key(doc)
+        if key is not None:
+            i = bisect_left(self.entries, key)
+            if i < len(self.entries) and self.entries[i] == key:
+                del self.entries[i]
+
+    def clear(self):
+        self.entries.clear()
+
+    def _left(self, prefix: Tuple) -> int:
+        return bisect_left(self.entries, prefix, key=lambda e: e[:len(prefix)])
+
+    def _right(self, prefix: Tuple) -> int:
+        return bisect_right(self.entries, prefix, key=lambda e: e[:len(prefix)])
+
+    def scan(self, start: Tuple = (), stop: Optional[Tuple] = None, inclusive: bool = False) -> List[Tuple]:
+        """Entries from the `start` prefix up to the `stop` prefix, excluded unless `inclusive`"""
+        j = len(self.entries) if stop is None else self._right(stop) if inclusive else self._left(stop)
+        return self.entries[self._left(start):j]
+
+    def page(self, prefix: Tuple, after: Optional[Sequence[Any]], limit: int, descending: bool = False) -> List[Tuple]:
+        """Up to `limit` entries under `prefix` strictly after the full key `after`"""
+        first, last = self._left(prefix), self._right(prefix)
+        if descending:
+            j = self._left(prefix + tuple(after)) if after is not None else last
+            return self.entries[max(first, j - limit):j][::-1]
+        i = self._right(prefix + tuple(after)) if after is not None else first
+        return self.entries[i:min(last, i + limit)]
+
+
+class GroupIndex:
+    """Document ids grouped by the value of one field"""
+
+    def __init__(self, field: str):
+        self.field = field
+        self.groups: Dict[Any, Set[str]] = {}
+
+    def add(self, doc: Dict):
+        if doc.get(self.field) is not None:
+            self.groups.setdefault(doc[self.field], set()).add(doc["id"])
+
+    def remove(self, doc: Dict):
+        ids = self.groups.get(doc.get(self.field))
+        if ids is not None:
+            ids.discard(doc["id"])
+            if not ids:
+                del self.groups[doc[self.field]]
+
+    def clear(self):
+        self.groups.clear()
+
+    def get(self, value: Any) -> Set[str]:
+        return set(self.groups.get(value, ()))
+
+
+class MemoryRepo(Repo):
+    """Documents by id, with every index kept in step on each write"""
+
+    def __init__(self, *indexes):
+        self.docs: Dict[str, Dict] = {}
+        self.indexes = indexes
+
+    async def clear(self):
+        self.docs.clear()
+        for index in self.indexes:
+            index.clear()
+
+    def _insert(self, doc: Dict) -> Dict:
+        doc = to_stored(doc)
+        if doc["id"] in self.docs:
+            raise DuplicateError(f"Duplicate id {doc['id']}")
+        self.docs[doc["id"]] = doc
+        for index in self.indexes:
+            index.add(doc)
+        return doc
+
+    def _update(self, doc_id: str, changes: Dict[str, Any], unset: Iterable[str] = ()):
+        doc = self.docs[doc_id]
+        for index in self.indexes:
+            index.remove(doc)
+        doc.update(to_stored(changes))
+        for field in unset:
+            doc.pop(field, None)
+        for index in self.indexes:
+            index.add(doc)
+
+    def _delete(self, doc_id: str):
+        doc = self.docs.pop(doc_id)
+        for index in self.indexes:
+            index.remove(doc)
+
+    def _get(self, doc_ids: Iterable[str]) -> List[Dict]:
+        return [clone(self.docs[doc_id]) for doc_id in doc_ids if doc_id in self.docs]
+
+    def _prune(self, index: SortedIndex, before: datetime):
+        for entry in index.scan(stop=(before,)):
+            self._delete(entry[-1])
+
+
+def without(doc: Optional[Dict], fields: Iterable[str]) -> Optional[Dict]:
+    if doc is None:
+        return None
+    return {k: v for k, v in clone(doc).items() if k not in fields}
+
+
+class MemoryUserRepo(MemoryRepo, UserRepo):
+    def __init__(self):
+        self._created = SortedIndex("created_at")
+        self._by_email = GroupIndex("email")
+        super().__init__(self._created, self._by_email)
+
+    def _view(self, doc_ids: Iterable[str]) -> List[Dict]:
+        return [without(doc, ("password",)) for doc in self._get(doc_ids)]
+
+    async def get(self, user_id: str) -> Optional[Dict]:
+        return without(self.docs.get(user_id), ("password",))
+
+    async def find_by_email(self, email: str) -> Optional[Dict]:
+        users = self._get(self._by_email.get(email))
+        return users[0] if users else None
+
+    async def find_by_ids(self, user_ids: List[str]) -> List[Dict]:
+        return self._view(set(user_ids))
+
+    async def find_by_emails(self, emails: List[str]) -> List[Dict]:
+        return self._view(user_id for email in set(emails) for user_id in self._by_email.get(email))
+
+    async def insert(self, user: Dict):
+        if self._by_email.get(user["email"]):
+            raise DuplicateError(f"Duplicate email {user['email']}")
+        self._insert(user)
+
+    async def set_password(self, user_id: str, old_hash: str, new_hash: str) -> bool:
+        if self.docs.get(user_id, {}).get("password") != old_hash:
+            return False
+        self._update(user_id, {"password": new_hash})
+        return True
+
+    async def update_preferences(self, user_id: str, timezone: Optional[str], preferences: Dict[str, Any]) -> Optional[Dict]:
+        if user_id not in self.docs:
+            return None
+        changes: Dict[str, Any] = {"preferences": {**self.docs[user_id].get("preferences", {}), **preferences}}
+        if timezone is not None:
+            changes["timezone"] = timezone
+        self._update(user_id, changes)
+        return await self.get(user_id)
+
+    async def page(self, limit: int, after: Optional[List[Any]] = None) -> List[Dict]:
+        return self._view(entry[-1] for entry in self._created.page((), after, limit))
+
+
+def is_once(class_obj: Dict) -> bool:
+    return class_obj.get("recurrence") == "ONCE"
+
+
+def is_repeating(class_obj: Dict) -> bool:
+    return class_obj.get("recurrence") in REPEATING_RECURRENCES
+
+
+class MemoryClassRepo(MemoryRepo, ClassRepo):
+    def __init__(self):
+        self._starts = SortedIndex("start_datetime")
+        self._once = SortedIndex("start_datetime", where=is_once)
+        self._repeating = SortedIndex("start_datetime", where=is_repeating)
+        self._by_teacher = SortedIndex("teacher_email", "start_datetime")
+        super().__init__(self._starts, self._once, self._repeating, self._by_teacher)
+
+    async def get(self, class_id: str) -> Optional[Dict]:
+        return clone(self.docs.get(class_id))
+
+    async def find_by_ids(self, class_ids: List[str]) -> List[Dict]:
+        return self._get(set(class_ids))
+
+    async def insert(self, class_obj: Dict):
+        self._insert(class_obj)
+
+    async def insert_many(self, class_objs: List[Dict]) -> List[Tuple[int, str]]:
+        failures = []
+        for i, class_obj in enumerate(class_objs):
+            try:
+                self._insert(class_obj)
+            except DuplicateError as e:
+                failures.append((i, str(e)))
+        return failures
+
+    async def update(self, class_id: str, changes: Dict[str, Any]) -> bool:
+        if class_id not in self.docs:
+            return False
+        self._update(class_id, changes)
+        return True
+
+    async def add_exception_date(self, class_id: str, day: str) -> Optional[Dict]:
+        before = clone(self.docs.get(class_id))
+        if before is not None and day not in before.get("exception_dates", []):
+            self._update(class_id, {"exception_dates": before.get("exception_dates", []) + [day]})
+        return before
+
+    def _occurring_ids(self, window_start: datetime, window_end: datetime, teacher_email: Optional[str]) -> List[str]:
+        window_start, window_end = to_stored(window_start), to_stored(window_end)
+        if teacher_email is not None:
+            return [
+                entry[-1] for entry in self._by_teacher.scan((teacher_email,), (teacher_email, window_end))
+                if is_repeating(self.docs[entry[-1]]) or (is_once(self.docs[entry[-1]]) and entry[1] >= window_start)
+            ]
+        return [entry[-1] for entry in self._once.scan((window_start,), (window_end,)) + self._repeating.scan(stop=(window_end,))]
+
+    async def occurring(self, window_start: datetime, window_end: datetime, teacher_email: Optional[str] = None) -> List[Dict]:
+        return self._get(self._occurring_ids(window_start, window_end, teacher_email))
+
+    async def overlapping(
+        self,
+        window_start: datetime,
+        window_end: datetime,
+        rooms: List[str],
+        teachers: List[str],
+        exclude_id: Optional[str] = None
+    ) -> List[Dict]:
+        rooms, teachers = set(rooms), set(teachers)
+        return [
+            clone(self.docs[class_id]) for class_id in self._occurring_ids(window_start, window_end, None)
+            if class_id != exclude_id
+            and (self.docs[class_id].get("room") in rooms or self.docs[class_id].get("teacher_email") in teachers)
+        ]
+
+    async def behind_horizon(self, horizon_end: datetime, limit: int) -> List[Dict]:
+        horizon_end = to_stored(horizon_end)
+        behind = [self.docs[entry[-1]] for entry in self._repeating.entries]
+        behind = [c for c in behind if c.get("materialized_until") is None or c["materialized_until"] < horizon_end]
+        # Never-materialized classes sort first, as nulls do in Mongo
+        behind.sort(key=lambda c: (c.get("materialized_until") is not None, c.get("materialized_until") or horizon_end))
+        return [clone(c) for c in behind[:limit]]
+
+    async def set_materialized_until(self, class_ids: List[str], until: datetime):
+        for class_id in class_ids:
+            if class_id in self.docs:
+                self._update(class_id, {"materialized_until": until})
+
+    async def page_for_teacher(self, teacher_email: str, limit: int, after: Optional[List[Any]] = None) -> List[Dict]:
+        return self._get(entry[-1] for entry in self._by_teacher.page((teacher_email,), after, limit))
+
+    async def iter_range(self, start: Optional[datetime], end: Optional[datetime], batch_size: int):
+        entries = self._starts.scan((to_stored(start),) if start else (), (to_stored(end),) if end else None)
+        for i in range(0, len(entries), batch_size):
+            for class_obj in self._get(entry[-1] for entry in entries[i:i + batch_size]):
+                yield class_obj
+
+
+def is_pending(reminder: Dict) -> bool:
+    return reminder.get("status") == "pending"
+
+
+class MemoryReminderRepo(MemoryRepo, ReminderRepo):
+    def __init__(self):
+        self._pending = SortedIndex("scheduled_time", where=is_pending)
+        self._retrying = SortedIndex("scheduled_time", where=lambda r: is_pending(r) and (r.get("attempts") or 0) >= 1)
+        self._leases = SortedIndex("lease_expires_at", where=lambda r: r.get("status") == "processing")
+        self._by_claim = GroupIndex("claim_token")
+        self._by_class = GroupIndex("class_id")
+        self._by_user = GroupIndex("user_id")
+        super().__init__(self._pending, self._retrying, self._leases, self._by_claim, self._by_class, self._by_user)
+
+    async def claim_due(self, now: datetime, limit: int, worker: str, claim_token: str, lease_expires_at: datetime) -> List[Dict]:
+        # No await between reading and writing, so concurrent claims cannot interleave
+        due = [entry[-1] for entry in self._pending.scan(stop=(to_stored(now),), inclusive=True)[:limit]]
+        for reminder_id in due:
+            self._update(reminder_id, {
+                "status": "processing",
+                "claimed_by": worker,
+                "claim_token": claim_token,
+                "lease_expires_at": lease_expires_at
+            })
+        return self._get(due)
+
+    async def renew_lease(self, claim_token: str, lease_expires_at: datetime) -> int:
+        held = [r for r in self._by_claim.get(claim_token) if self.docs[r]["status"] == "processing"]
+        for reminder_id in held:
+            self._update(reminder_id, {"lease_expires_at": lease_expires_at})
+        return len(held)
+
+    async def release_expired(self, now: datetime) -> int:
+        expired = self._leases.scan(stop=(to_stored(now),), inclusive=True)
+        for entry in expired:
+            self._update(entry[-1], {"status": "pending"}, unset=LEASE_FIELDS)
+        return len(expired)
+
+    async def record_outcomes(self, claim_token: str, outcomes: Dict[str, Dict[str, Any]]):
+        # Only the current lease holder may record the outcome
+        for reminder_id in self._by_claim.get(claim_token) & outcomes.keys():
+            self._update(reminder_id, outcomes[reminder_id], unset=LEASE_FIELDS)
+
+    async def insert_many(self, reminders: List[Dict]):
+        for reminder in reminders:
+            self._insert(reminder)
+
+    async def backlog(self, now: datetime) -> Dict[str, Any]:
+        overdue = self._pending.scan(stop=(to_stored(now),), inclusive=True)
+        return {
+            "depth": len(overdue),
+            "oldest_scheduled_time": overdue[0][0] if overdue else None,
+            "retrying": len(self._retrying.entries)
+        }
+
+    async def next_pending_times(self, limit: int) -> List[datetime]:
+        return [entry[0] for entry in self._pending.entries[:limit]]
+
+    def _waiting(self, reminder_id: str) -> bool:
+        return reminder_id in self.docs and self.docs[reminder_id]["status"] in WAITING_STATUSES
+
+    def _occurs_in(self, reminder_id: str, start: Optional[datetime], end: Optional[datetime]) -> bool:
+        """Whether the occurrence is in [start, end); legacy rows without one never are"""
+        occurrence_start = self.docs[reminder_id].get("occurrence_start")
+        return occurrence_start is not None and (start is None or occurrence_start >= start) and (end is None or occurrence_start < end)
+
+    async def waiting_for_user(self, user_id: str, occurring_after: datetime) -> List[Dict]:
+        fields = ("id", "user_id", "channel", "status", "occurrence_start", "scheduled_time")
+        return [
+            {field: self.docs[r][field] for field in fields if field in self.docs[r]}
+            for r in self._by_user.get(user_id)
+            if self._waiting(r) and (self.docs[r].get("occurrence_start") or occurring_after) > occurring_after
+        ]
+
+    async def update_waiting(self, delete: List[str], suppress: List[str], retime: Dict[str, datetime]):
+        for reminder_id in delete:
+            if self._waiting(reminder_id):
+                self._delete(reminder_id)
+        for reminder_id in suppress:
+            if reminder_id in self.docs and is_pending(self.docs[reminder_id]):
+                self._update(reminder_id, {"status": "suppressed"})
+        for reminder_id, scheduled_time in retime.items():
+            if self._waiting(reminder_id):
+                self._update(reminder_id, {"status": "pending", "scheduled_time": scheduled_time})
+
+    async def delete_waiting(self, class_id: str, start: Optional[datetime] = None, end: Optional[datetime] = None) -> int:
+        start, end = to_stored(start), to_stored(end)
+        ranged = start is not None or end is not None
+        doomed = [
+            r for r in self._by_class.get(class_id)
+            if self._waiting(r) and (not ranged or self._occurs_in(r, start, end))
+        ]
+        for reminder_id in doomed:
+            self._delete(reminder_id)
+        return len(doomed)
+
+    async def page_retrying(self, limit: int, after: Optional[List[Any]] = None) -> List[Dict]:
+        entries = self._retrying.page((), after, limit)
+        return [without(self.docs[entry[-1]], ("claimed_by",) + LEASE_FIELDS) for entry in entries]
+
+    async def requeue(self, reminder_id: str, now: datetime, first_scheduled_time: datetime) -> bool:
+        if self.docs.get(reminder_id, {}).get("status") != "failed":
+            return False
+        self._update(reminder_id, {
+            "status": "pending",
+            "scheduled_time": now,
+            "first_scheduled_time": first_scheduled_time,
+            "attempts": 0,
+            "error": None
+        })
+        return True
+
+
+class MemoryDeadLetterRepo(MemoryRepo, DeadLetterRepo):
+    def __init__(self):
+        self._order = SortedIndex("dead_lettered_at")
+        super().__init__(self._order)
+
+    async def upsert_many(self, dead_letters: List[Dict]):
+        for dead_letter in dead_letters:
+            if dead_letter["id"] in self.docs:
+                self._update(dead_letter["id"], dead_letter)
+            else:
+                self._insert(dead_letter)
+
+    async def get(self, reminder_id: str) -> Optional[Dict]:
+        return clone(self.docs.get(reminder_id))
+
+    async def delete(self, reminder_id: str):
+        if reminder_id in self.docs:
+            self._delete(reminder_id)
+
+    async def count(self) -> int:
+        return len(self.docs)
+
+    async def page(self, limit: int, after: Optional[List[Any]] = None) -> List[Dict]:
+        return self._get(entry[-1] for entry in self._order.page((), after, limit, descending=True))
+
+
+def hour_of(timestamp: datetime) -> datetime:
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+
+def summarise_logs(logs: Iterable[Dict]) -> List[Dict]:
+    """Hourly summaries as LogRepo describes them, matching the Mongo pipeline"""
+    summaries: Dict[Tuple, Dict] = {}
+    for log in logs:
+        channel = log.get("channel") or "email"
+        key = (hour_of(log["timestamp"]), channel, log.get("status"))
+        summary = summaries.setdefault(key, {
+            "hour": key[0], "channel": channel, "status": key[2],
+            "count": 0, "lag_sum": 0, "lag_max": None, "lag_histogram": {}
+        })
+        lag = log.get("lag_seconds")
+        timed = isinstance(lag, (int, float)) and not isinstance(lag, bool)
+        # The bucket is the number of bounds below the lag
+        bucket = bisect_left(LAG_BUCKETS, lag) if timed else None
+        summary["count"] += 1
+        summary["lag_histogram"][bucket] = summary["lag_histogram"].get(bucket, 0) + 1
+        if timed:
+            summary["lag_sum"] += lag
+            summary["lag_max"] = lag if summary["lag_max"] is None else max(summary["lag_max"], lag)
+    for summary in summaries.values():
+        summary["lag_histogram"] = [{"bucket": bucket, "count": count} for bucket, count in summary["lag_histogram"].items()]
+    return list(summaries.values())
+
+
+class MemoryLogRepo(MemoryRepo, LogRepo):
+    def __init__(self, retention_days: Optional[int] = None):
+        self._order = SortedIndex("timestamp")
+        super().__init__(self._order)
+        self.retention_days = retention_days
+        self.rollup_docs: Dict[Tuple, Dict] = {}
+
+    async def clear(self):
+        await super().clear()
+        self.rollup_docs.clear()
+
+    async def insert_many(self, logs: List[Dict]):
+        for log in logs:
+            self._insert(log)
+        if self.retention_days is not None:
+            self._prune(self._order, datetime.now(timezone.utc) - timedelta(days=self.retention_days))
+
+    async def page(self, limit: int, after: Optional[List[Any]] = None) -> List[Dict]:
+        return self._get(entry[-1] for entry in self._order.page((), after, limit, descending=True))
+
+    def _range(self, start: Optional[datetime], end: Optional[datetime]) -> List[Tuple]:
+        return self._order.scan((to_stored(start),) if start else (), (to_stored(end),) if end else None)
+
+    async def iter_range(self, start: Optional[datetime], end: Optional[datetime], batch_size: int):
+        entries = self._range(start, end)
+        for i in range(0, len(entries), batch_size):
+            for log in self._get(entry[-1] for entry in entries[i:i + batch_size]):
+                yield log
+
+    async def summarise(self, start: datetime, end: datetime) -> List[Dict]:
+        return summarise_logs(self.docs[entry[-1]] for entry in self._range(start, end))
+
+    async def roll_up(self, start: Optional[datetime], end: datetime):
+        for summary in summarise_logs(self.docs[entry[-1]] for entry in self._range(start, end)):
+            self.rollup_docs[(summary["hour"], summary["channel"], summary["status"])] = summary
+
+    async def last_rollup_hour(self) -> Optional[datetime]:
+        return max((key[0] for key in self.rollup_docs), default=None)
+
+    async def rollups(self, start: datetime, end: datetime) -> List[Dict]:
+        return [clone(s) for key, s in self.rollup_docs.items() if start <= key[0] < end]
+
+
+class MemoryUploadJobRepo(MemoryRepo, UploadJobRepo):
+    def __init__(self, retention_days: Optional[int] = None):
+        self._finished = SortedIndex("finished_at")
+        super().__init__(self._finished)
+        self.retention_days = retention_days
+
+    async def insert(self, job: Dict):
+        self._insert(job)
+        if self.retention_days is not None:
+            self._prune(self._finished, datetime.now(timezone.utc) - timedelta(days=self.retention_days))
+
+    async def save(self, job: Dict):
+        if job["id"] in self.docs:
+            self._update(job["id"], job)
+
+    async def get(self, job_id: str) -> Optional[Dict]:
+        return clone(self.docs.get(job_id))
+
+
+class MemoryJobLeaseRepo(MemoryRepo, JobLeaseRepo):
+    async def acquire(self, name: str, holder: str, now: datetime, expires_at: datetime) -> bool:
+        lease = self.docs.get(name)
+        if lease is not None and lease["holder"] != holder and lease["expires_at"] > now:
+            return False
+        self.docs[name] = {"id": name, "holder": holder, "expires_at": to_stored(expires_at)}
+        return True
+
+
+class MemoryStorage(Storage):
+    """Process-local storage; without retention days, logs and finished import jobs are kept"""
+
+    def __init__(self, log_retention_days: Optional[int] = None, upload_job_retention_days: Optional[int] = None):
+        self.users = MemoryUserRepo()
+        self.classes = MemoryClassRepo()
+        self.reminders = MemoryReminderRepo()
+        self.dead_letters = MemoryDeadLetterRepo()
+        self.logs = MemoryLogRepo(log_retention_days)
+        self.upload_jobs = MemoryUploadJobRepo(upload_job_retention_days)
+        self.job_leases = MemoryJobLeaseRepo()
@@ -0,0 +1,602 @@
+"""MongoDB repositories on Motor, with the index set, query-plan diagnostics and datetime migration"""
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING, DeleteOne, IndexModel, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+
+from storage import (
+    LAG_BUCKETS, REPEATING_RECURRENCES, WAITING_STATUSES, ClassRepo, DeadLetterRepo, DuplicateError, JobLeaseRepo,
+    LogRepo, ReminderRepo, Repo, Storage, UploadJobRepo, UserRepo
+)
+
+USER_VIEW = {"_id": 0, "password": 0}
+# Lease bookkeeping is dropped from a reminder once its outcome is recorded
+LEASE_FIELDS = {"claim_token": "", "lease_expires_at": ""}
+RETRY_VIEW = {"_id": 0, "claim_token": 0, "claimed_by": 0, "lease_expires_at": 0}
+# Pending reminders that already failed at least once
+RETRY_QUEUE_QUERY = {"status": "pending", "attempts": {"$gte": 1}}
+
+USERS_ORDER = [("created_at", ASCENDING), ("id", ASCENDING)]
+CLASSES_ORDER = [("start_datetime", ASCENDING), ("id", ASCENDING)]
+RETRY_ORDER = [("scheduled_time", ASCENDING), ("id", ASCENDING)]
+DEAD_LETTERS_ORDER = [("dead_lettered_at", DESCENDING), ("id", DESCENDING)]
+LOGS_ORDER = [("timestamp", DESCENDING), ("id", DESCENDING)]
+EXPORT_LOGS_ORDER = [("timestamp", ASCENDING), ("id", ASCENDING)]
+
+
+def keyset_query(sort: List[Tuple[str, int]], values: Sequence[Any]) -> Dict:
+    """Match rows strictly after `values` in `sort` order, e.g. (a > x) or (a == x and b > y)"""
+    clauses = []
+    for i, (field, direction) in enumerate(sort):
+        clause = {f: v for (f, _), v in zip(sort[:i], values[:i])}
+        clause[field] = {"$gt" if direction == ASCENDING else "$lt": values[i]}
+        clauses.append(clause)
+    return {"$or": clauses}
+
+
+async def find_page(collection, query: Dict, projection: Dict, sort: List[Tuple[str, int]], limit: int, after: Optional[Sequence[Any]]) -> List[Dict]:
+    """One keyset page; the sort must end in a unique field and be backed by an index"""
+    if after is not None:
+        query = {"$and": [query, keyset_query(sort, after)]}
+    return await collection.find(query, projection).sort(sort).to_list(limit)
+
+
+def range_query(field: str, start: Optional[datetime], end: Optional[datetime]) -> Dict:
+    bounds: Dict[str, Any] = {}
+    if start:
+        bounds["$gte"] = start
+    if end:
+        bounds["$lt"] = end
+    return {field: bounds} if bounds else {}
+
+
+def occurrence_query(window_start: datetime, window_end: datetime) -> Dict:
+    """Match one-off classes starting in the window and repeating classes started before its end"""
+    return {"$or": [
+        {"recurrence": "ONCE", "start_datetime": {"$gte": window_start, "$lt": window_end}},
+        {"recurrence": {"$in": REPEATING_RECURRENCES}, "start_datetime": {"$lt": window_end}}
+    ]}
+
+
+def horizon_query(horizon_end: datetime) -> Dict:
+    return {
+        "recurrence": {"$in": REPEATING_RECURRENCES},
+        # Also matches classes created before materialization was tracked
+        "materialized_until": {"$not": {"$gte": horizon_end}}
+    }
+
+
+def hourly_log_summary_stages(match: Dict) -> List[Dict]:
+    """Aggregation stages summarising raw logs into one document per hour, channel and status"""
+    return [
+        {"$match": match},
+        {"$addFields": {
+            "hour": {"$dateFromParts": {
+                "year": {"$year": "$timestamp"},
+                "month": {"$month": "$timestamp"},
+                "day": {"$dayOfMonth": "$timestamp"},
+                "hour": {"$hour": "$timestamp"}
+            }},
+            "channel": {"$ifNull": ["$channel", "email"]},
+            "lag_bucket": {"$cond": [
+                {"$isNumber": "$lag_seconds"},
+                {"$size": {"$filter": {"input": LAG_BUCKETS, "cond": {"$lt": ["$$this", "$lag_seconds"]}}}},
+                None
+            ]}
+        }},
+        {"$group": {
+            "_id": {"hour": "$hour", "channel": "$channel", "status": "$status", "lag_bucket": "$lag_bucket"},
+            "count": {"$sum": 1},
+            "lag_sum": {"$sum": {"$ifNull": ["$lag_seconds", 0]}},
+            "lag_max": {"$max": "$lag_seconds"}
+        }},
+        {"$group": {
+            "_id": {"hour": "$_id.hour", "channel": "$_id.channel", "status": "$_id.status"},
+            "count": {"$sum": "$count"},
+            "lag_sum": {"$sum": "$lag_sum"},
+            "lag_max": {"$max": "$lag_max"},
+            "lag_histogram": {"$push": {"bucket": "$_id.lag_bucket", "count": "$count"}}
+        }},
+        {"$addFields": {"hour": "$_id.hour", "channel": "$_id.channel", "status": "$_id.status"}},
+    ]
+
+
+class MongoRepo(Repo):
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def clear(self):
+        await self.collection.delete_many({})
+
+
+class MongoUserRepo(MongoRepo, UserRepo):
+    async def get(self, user_id: str) -> Optional[Dict]:
+        return await self.collection.find_one({"id": user_id}, USER_VIEW)
+
+    async def find_by_email(self, email: str) -> Optional[Dict]:
+        return await self.collection.find_one({"email": email}, {"_id": 0})
+
+    async def find_by_ids(self, user_ids: List[str]) -> List[Dict]:
+        return await self.collection.find({"id": {"$in": user_ids}}, USER_VIEW).to_list(None)
+
+    async def find_by_emails(self, emails: List[str]) -> List[Dict]:
+        return await self.collection.find({"email": {"$in": emails}}, USER_VIEW).to_list(None)
+
+    async def insert(self, user: Dict):
+        try:
+            await self.collection.insert_one({**user})
+        except DuplicateKeyError as e:
+            raise DuplicateError(str(e))
+
+    async def set_password(self, user_id: str, old_hash: str, new_hash: str) -> bool:
+        result = await self.collection.update_one({"id": user_id, "password": old_hash}, {"$set": {"password": new_hash}})
+        return bool(result.modified_count)
+
+    async def update_preferences(self, user_id: str, timezone: Optional[str], preferences: Dict[str, Any]) -> Optional[Dict]:
+        changes = {f"preferences.{key}": value for key, value in preferences.items()}
+        if timezone is not None:
+            changes["timezone"] = timezone
+        return await self.collection.find_one_and_update(
+            {"id": user_id}, {"$set": changes}, projection=USER_VIEW, return_document=ReturnDocument.AFTER
+        )
+
+    async def page(self, limit: int, after: Optional[List[Any]] = None) -> List[Dict]:
+        return await find_page(self.collection, {}, USER_VIEW, USERS_ORDER, limit, after)
+
+
+class MongoClassRepo(MongoRepo, ClassRepo):
+    async def get(self, class_id: str) -> Optional[Dict]:
+        return await self.collection.find_one({"id": class_id}, {"_id": 0})
+
+    async def find_by_ids(self, class_ids: List[str]) -> List[Dict]:
+        return await self.collection.find({"id": {"$in": class_ids}}, {"_id": 0}).to_list(None)
+
+    async def insert(self, class_obj: Dict):
+        try:
+            await self.collection.insert_one({**class_obj})
+        except DuplicateKeyError as e:
+            raise DuplicateError(str(e))
+
+    async def insert_many(self, class_objs: List[Dict]) -> List[Tuple[int, str]]:
+        try:
+            # Unordered, so one bad row does not abort the rest
+            await self.collection.insert_many([{**c} for c in class_objs], ordered=False)
+        except BulkWriteError as e:
+            return [(error["index"], error.get("errmsg", "Write failed")) for error in e.details.get("writeErrors", [])]
+        return []
+
+    async def update(self, class_id: str, changes: Dict[str, Any]) -> bool:
+        result = await self.collection.update_one({"id": class_id}, {"$set": changes})
+        return bool(result.matched_count)
+
+    async def add_exception_date(self, class_id: str, day: str) -> Optional[Dict]:
+        return await self.collection.find_one_and_update(
+            {"id": class_id}, {"$addToSet": {"exception_dates": day}}, projection={"_id": 0}
+        )
+
+    async def occurring(self, window_start: datetime, window_end: datetime, teacher_email: Optional[str] = None) -> List[Dict]:
+        query = occurrence_query(window_start, window_end)
+        if teacher_email is not None:
+            query["teacher_email"] = teacher_email
+        return await self.collection.find(query, {"_id": 0}).to_list(None)
+
+    async def overlapping(
+        self,
+        window_start: datetime,
+        window_end: datetime,
+        rooms: List[str],
+        teachers: List[str],
+        exclude_id: Optional[str] = None
+    ) -> List[Dict]:
+        query: Dict[str, Any] = {"$and": [
+            occurrence_query(window_start, window_end),
+            {"$or": [{"room": {"$in": rooms}}, {"teacher_email": {"$in": teachers}}]}
+        ]}
+        if exclude_id:
+            query["id"] = {"$ne": exclude_id}
+        return await self.collection.find(query, {"_id": 0}).to_list(None)
+
+    async def behind_horizon(self, horizon_end: datetime, limit: int) -> List[Dict]:
+        return await self.collection.find(horizon_query(horizon_end), {"_id": 0}).sort("materialized_until", ASCENDING).to_list(limit)
+
+    async def set_materialized_until(self, class_ids: List[str], until: datetime):
+        await self.collection.update_many({"id": {"$in": class_ids}}, {"$set": {"materialized_until": until}})
+
+    async def page_for_teacher(self, teacher_email: str, limit: int, after: Optional[List[Any]] = None) -> List[Dict]:
+        return await find_page(self.collection, {"teacher_email": teacher_email}, {"_id": 0}, CLASSES_ORDER, limit, after)
+
+    async def iter_range(self, start: Optional[datetime], end: Optional[datetime], batch_size: int):
+        cursor = self.collection.find(range_query("start_datetime", start, end), {"_id": 0}).sort(CLASSES_ORDER).batch_size(batch_size)
+        async for class_obj in cursor:
+            yield class_obj
+
+
+class MongoReminderRepo(MongoRepo, ReminderRepo):
+    async def claim_due(self, now: datetime, limit: int, worker: str, claim_token: str, lease_expires_at: datetime) -> List[Dict]:
+        # Concurrent workers can pick the same candidates, but the conditional
+        # update lets each reminder flip to processing only once
+        due = {"status": "pending", "scheduled_time": {"$lte": now}}
+        candidates = await self.collection.find(due, {"_id": 0, "id": 1}).sort("scheduled_time", ASCENDING).to_list(limit)
+        if not candidates:
+            return []
+        await self.collection.update_many(
+            {**due, "id": {"$in": [c["id"] for c in candidates]}},
+            {"$set": {"status": "processing", "claimed_by": worker, "claim_token": claim_token, "lease_expires_at": lease_expires_at}}
+        )
+        return await self.collection.find({"claim_token": claim_token}, {"_id": 0}).sort("scheduled_time", ASCENDING).to_list(None)
+
+    async def renew_lease(self, claim_token: str, lease_expires_at: datetime) -> int:
+        result = await self.collection.update_many(
+            {"claim_token": claim_token, "status": "processing"},
+            {"$set": {"lease_expires_at": lease_expires_at}}
+        )
+        return result.matched_count
+
+    async def release_expired(self, now: datetime) -> int:
+        result = await self.collection.update_many(
+            {"status": "processing", "lease_expires_at": {"$lte": now}},
+            {"$set": {"status": "pending"}, "$unset": LEASE_FIELDS}
+        )
+        return result.modified_count
+
+    async def record_outcomes(self, claim_token: str, outcomes: Dict[str, Dict[str, Any]]):
+        if not outcomes:
+            return
+        # Only the current lease holder may record the outcome
+        await self.collection.bulk_write([
+            UpdateOne({"id": reminder_id, "claim_token": claim_token}, {"$set": fields, "$unset": LEASE_FIELDS})
+            for reminder_id, fields in outcomes.items()
+        ], ordered=False)
+
+    async def insert_many(self, reminders: List[Dict]):
+        if reminders:
+            await self.collection.insert_many([{**r} for r in reminders], ordered=False)
+
+    async def backlog(self, now: datetime) -> Dict[str, Any]:
+        overdue = {"status": "pending", "scheduled_time": {"$lte": now}}
+        oldest = await self.collection.find(overdue, {"_id": 0, "scheduled_time": 1}).sort("scheduled_time", ASCENDING).to_list(1)
+        return {
+            "depth": await self.collection.count_documents(overdue),
+            "oldest_scheduled_time": oldest[0]["scheduled_time"] if oldest else None,
+            "retrying": await self.collection.count_documents(RETRY_QUEUE_QUERY)
+        }
+
+    async def next_pending_times(self, limit: int) -> List[datetime]:
+        reminders = await self.collection.find(
+            {"status": "pending"}, {"_id": 0, "scheduled_time": 1}
+        ).sort("scheduled_time", ASCENDING).to_list(limit)
+        return [r["scheduled_time"] for r in reminders]
+
+    async def waiting_for_user(self, user_id: str, occurring_after: datetime) -> List[Dict]:
+        return await self.collection.find(
+            {"user_id": user_id, "status": {"$in": WAITING_STATUSES}, "occurrence_start": {"$gt": occurring_after}},
+            {"_id": 0, "id": 1, "user_id": 1, "channel": 1, "status": 1, "occurrence_start": 1, "scheduled_time": 1}
+        ).to_list(None)
+
+    async def update_waiting(self, delete: List[str], suppress: List[str], retime: Dict[str, datetime]):
+        waiting = {"$in": WAITING_STATUSES}
+        ops = [DeleteOne({"id": reminder_id, "status": waiting}) for reminder_id in delete]
+        ops += [UpdateOne({"id": reminder_id, "status": "pending"}, {"$set": {"status": "suppressed"}}) for reminder_id in suppress]
+        ops += [
+            UpdateOne({"id": reminder_id, "status": waiting}, {"$set": {"status": "pending", "scheduled_time": scheduled_time}})
+            for reminder_id, scheduled_time in retime.items()
+        ]
+        if ops:
+            await self.collection.bulk_write(ops, ordered=False)
+
+    async def delete_waiting(self, class_id: str, start: Optional[datetime] = None, end: Optional[datetime] = None) -> int:
+        query = {"class_id": class_id, "status": {"$in": WAITING_STATUSES}, **range_query("occurrence_start", start, end)}
+        result = await self.collection.delete_many(query)
+        return result.deleted_count
+
+    async def page_retrying(self, limit: int, after: Optional[List[Any]] = None) -> List[Dict]:
+        return await find_page(self.collection, RETRY_QUEUE_QUERY, RETRY_VIEW, RETRY_ORDER, limit, after)
+
+    async def requeue(self, reminder_id: str, now: datetime, first_scheduled_time: datetime) -> bool:
+        result = await self.collection.update_one(
+            {"id": reminder_id, "status": "failed"},
+            {"$set": {
+                "status": "pending",
+                "scheduled_time": now,
+                "first_scheduled_time": first_scheduled_time,
+                "attempts": 0,
+                "error": None
+            }}
+        )
+        return bool(result.matched_count)
+
+
+class MongoDeadLetterRepo(MongoRepo, DeadLetterRepo):
+    async def upsert_many(self, dead_letters: List[Dict]):
+        if dead_letters:
+            await self.collection.bulk_write([
+                UpdateOne({"id": d["id"]}, {"$set": {k: v for k, v in d.items() if k != "id"}}, upsert=True)
+                for d in dead_letters
+            ], ordered=False)
+
+    async def get(self, reminder_id: str) -> Optional[Dict]:
+        return await self.collection.find_one({"id": reminder_id}, {"_id": 0})
+
+    async def delete(self, reminder_id: str):
+        await self.collection.delete_one({"id": reminder_id})
+
+    async def count(self) -> int:
+        return await self.collection.count_documents({})
+
+    async def page(self, limit: int, after: Optional[List[Any]] = None) -> List[Dict]:
+        return await find_page(self.collection, {}, {"_id": 0}, DEAD_LETTERS_ORDER, limit, after)
+
+
+class MongoLogRepo(MongoRepo, LogRepo):
+    def __init__(self, collection, rollups):
+        super().__init__(collection)
+        self.rollup_collection = rollups
+
+    async def clear(self):
+        await self.collection.delete_many({})
+        await self.rollup_collection.delete_many({})
+
+    async def insert_many(self, logs: List[Dict]):
+        if logs:
+            await self.collection.insert_many([{**log} for log in logs], ordered=False)
+
+    async def page(self, limit: int, after: Optional[List[Any]] = None) -> List[Dict]:
+        return await find_page(self.collection, {}, {"_id": 0}, LOGS_ORDER, limit, after)
+
+    async def iter_range(self, start: Optional[datetime], end: Optional[datetime], batch_size: int):
+        cursor = self.collection.find(range_query("timestamp", start, end), {"_id": 0}).sort(EXPORT_LOGS_ORDER).batch_size(batch_size)
+        async for log in cursor:
+            yield log
+
+    async def summarise(self, start: datetime, end: datetime) -> List[Dict]:
+        stages = hourly_log_summary_stages({"timestamp": {"$gte": start, "$lt": end}}) + [{"$project": {"_id": 0}}]
+        return await self.collection.aggregate(stages, allowDiskUse=True).to_list(None)
+
+    async def roll_up(self, start: Optional[datetime], end: datetime):
+        # $merge writes server-side, so the summaries never leave the database
+        pipeline = hourly_log_summary_stages(range_query("timestamp", start, end)) + [
+            {"$merge": {"into": self.rollup_collection.name, "on": "_id", "whenMatched": "replace", "whenNotMatched": "insert"}}
+        ]
+        await self.collection.aggregate(pipeline, allowDiskUse=True).to_list(None)
+
+    async def last_rollup_hour(self) -> Optional[datetime]:
+        latest = await self.rollup_collection.find({}, {"hour": 1}).sort("hour", DESCENDING).to_list(1)
+        return latest[0]["hour"] if latest else None
+
+    async def rollups(self, start: datetime, end: datetime) -> List[Dict]:
+        return await self.rollup_collection.find({"hour": {"$gte": start, "$lt": end}}, {"_id": 0}).to_list(None)
+
+
+class MongoUploadJobRepo(MongoRepo, UploadJobRepo):
+    async def insert(self, job: Dict):
+        await self.collection.insert_one({**job})
+
+    async def save(self, job: Dict):
+        await self.collection.update_one({"id": job["id"]}, {"$set": {k: v for k, v in job.items() if k != "id"}})
+
+    async def get(self, job_id: str) -> Optional[Dict]:
+        return await self.collection.find_one({"id": job_id}, {"_id": 0})
+
+
+class MongoJobLeaseRepo(MongoRepo, JobLeaseRepo):
+    async def acquire(self, name: str, holder: str, now: datetime, expires_at: datetime) -> bool:
+        try:
+            await self.collection.find_one_and_update(
+                {"_id": name, "$or": [{"expires_at": {"$lte": now}}, {"holder": holder}]},
+                {"$set": {"holder": holder, "expires_at": expires_at}},
+                upsert=True
+            )
+            return True
+        except DuplicateKeyError:
+            # Another worker holds an unexpired lease
+            return False
+
+
+# Fields that databases written by older versions hold as ISO strings
+DATETIME_FIELDS = {
+    "users": ["created_at"],
+    "classes": ["start_datetime", "end_datetime", "repeat_until", "materialized_until", "created_at"],
+    "reminders": ["scheduled_time", "occurrence_start", "sent_at"],
+    "logs": ["timestamp"],
+}
+
+
+def parse_legacy_datetime(value: str) -> datetime:
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    return parsed.replace(tzinfo=timezone.utc) if parsed.tzinfo is None else parsed.astimezone(timezone.utc)
+
+
+class MongoStorage(Storage):
+    def __init__(
+        self,
+        url: str,
+        db_name: str,
+        log_retention_days: int,
+        upload_job_retention_days: int,
+        event_listeners: Sequence[Any] = ()
+    ):
+        # Datetimes are stored as native BSON dates and read back as aware UTC datetimes
+        self.client = AsyncIOMotorClient(url, tz_aware=True, tzinfo=timezone.utc, event_listeners=list(event_listeners))
+        self.db = self.client[db_name]
+        self.users = MongoUserRepo(self.db.users)
+        self.classes = MongoClassRepo(self.db.classes)
+        self.reminders = MongoReminderRepo(self.db.reminders)
+        self.dead_letters = MongoDeadLetterRepo(self.db.dead_letters)
+        self.logs = MongoLogRepo(self.db.logs, self.db.log_rollups)
+        self.upload_jobs = MongoUploadJobRepo(self.db.upload_jobs)
+        self.job_leases = MongoJobLeaseRepo(self.db.job_leases)
+        self.indexes: Dict[str, List[IndexModel]] = {
+            "users": [
+                IndexModel([("id", ASCENDING)], unique=True),
+                IndexModel([("email", ASCENDING)], unique=True),
+                IndexModel(USERS_ORDER),
+            ],
+            "classes": [
+                IndexModel([("id", ASCENDING)], unique=True),
+                IndexModel([("teacher_email", ASCENDING), ("start_datetime", ASCENDING), ("id", ASCENDING)]),
+                IndexModel([("teacher_email", ASCENDING), ("recurrence", ASCENDING), ("start_datetime", ASCENDING)]),
+                IndexModel([("recurrence", ASCENDING), ("start_datetime", ASCENDING)]),
+                IndexModel(CLASSES_ORDER),
+                IndexModel([("recurrence", ASCENDING), ("materialized_until", ASCENDING)]),
+                IndexModel([("room", ASCENDING), ("start_datetime", ASCENDING)]),
+            ],
+            "reminders": [
+                IndexModel([("id", ASCENDING)], unique=True),
+                IndexModel([("status", ASCENDING), ("scheduled_time", ASCENDING)]),
+                IndexModel([("status", ASCENDING), ("lease_expires_at", ASCENDING)]),
+                IndexModel([("claim_token", ASCENDING)], sparse=True),
+                IndexModel([("class_id", ASCENDING), ("status", ASCENDING), ("occurrence_start", ASCENDING)]),
+                # Only reminders that failed at least once carry attempts
+                IndexModel([("attempts", ASCENDING), ("scheduled_time", ASCENDING)], sparse=True),
+            ],
+            "dead_letters": [
+                IndexModel([("id", ASCENDING)], unique=True),
+                IndexModel(DEAD_LETTERS_ORDER),
+            ],
+            "logs": [
+                IndexModel(LOGS_ORDER),
+                IndexModel([("reminder_id", ASCENDING)]),
+                IndexModel([("timestamp", ASCENDING)], expireAfterSeconds=log_retention_days * 86400),
+            ],
+            "log_rollups": [
+                IndexModel([("hour", ASCENDING)]),
+            ],
+            "upload_jobs": [
+                IndexModel([("id", ASCENDING)], unique=True),
+                IndexModel([("finished_at", ASCENDING)], expireAfterSeconds=upload_job_retention_days * 86400),
+            ],
+        }
+
+    async def ensure_indexes(self):
+        """Create every declared index; existing ones are left untouched"""
+        for collection, indexes in self.indexes.items():
+            for index in indexes:
+                try:
+                    await self.db[collection].create_indexes([index])
+                except OperationFailure as e:
+                    # e.g. duplicate emails already stored block the unique index
+                    logging.error(f"Index {collection}.{index.document['name']} not created: {str(e)}")
+
+    async def explain_queries(self) -> List[Dict[str, Any]]:
+        """Explain each hot query and flag the ones that fall back to a collection scan"""
+        now = datetime.now(timezone.utc)
+        email = "diagnostics@example.com"
+        checks = [
+            ("get_current_user", "users", {"id": "diagnostics"}, None),
+            ("login", "users", {"email": email}, None),
+            ("process_reminders", "reminders", {"status": "pending", "scheduled_time": {"$lte": now}}, None),
+            ("reminder_dispatcher", "reminders", {"status": "pending"}, [("scheduled_time", ASCENDING)]),
+            ("release_expired_leases", "reminders", {"status": "processing", "lease_expires_at": {"$lte": now}}, None),
+            ("retry_queue", "reminders", RETRY_QUEUE_QUERY, RETRY_ORDER),
+            ("dead_letters", "dead_letters", {}, DEAD_LETTERS_ORDER),
+            ("cancel_class_occurrence", "reminders", {"class_id": "diagnostics", "status": {"$in": WAITING_STATUSES}, "occurrence_start": {"$gte": now}}, None),
+            ("extend_reminder_horizon", "classes", horizon_query(now + timedelta(days=14)), [("materialized_until", ASCENDING)]),
+            ("get_all_users", "users", {}, USERS_ORDER),
+            ("get_my_timetable", "classes", {"teacher_email": email}, CLASSES_ORDER),
+            ("get_my_upcoming_classes", "classes", {**occurrence_query(now, now + timedelta(days=7)), "teacher_email": email}, None),
+            ("get_upcoming_classes", "classes", occurrence_query(now, now + timedelta(hours=24)), None),
+            ("get_logs", "logs", {}, LOGS_ORDER),
+            ("export_logs", "logs", {"timestamp": {"$gte": now}}, EXPORT_LOGS_ORDER),
+            ("export_classes", "classes", {"start_datetime": {"$gte": now}}, CLASSES_ORDER),
+        ]
+
+        report = []
+        for name, collection, query, sort in checks:
+            cursor = self.db[collection].find(query, {"_id": 0})
+            if sort:
+                cursor = cursor.sort(sort)
+            stages = plan_stages((await cursor.explain()).get("queryPlanner", {}))
+            report.append({
+                "query": name,
+                "collection": collection,
+                "stages": sorted(stages),
+                "collection_scan": "COLLSCAN" in stages
+            })
+        return report
+
+    async def backfill_occurrence_starts(self, batch_size: int = 1000) -> int:
+        """Give reminders written before occurrences were tracked their class's start as `occurrence_start`"""
+        backfilled = 0
+        last_id = None
+        query = {"occurrence_start": {"$exists": False}}
+        while True:
+            batch_query = {**query, "_id": {"$gt": last_id}} if last_id is not None else query
+            reminders = await self.db.reminders.find(batch_query, {"_id": 1, "class_id": 1}).sort("_id", 1).to_list(batch_size)
+            if not reminders:
+                break
+            class_ids = list({r["class_id"] for r in reminders})
+            starts = {
+                c["id"]: c["start_datetime"] if isinstance(c["start_datetime"], datetime) else parse_legacy_datetime(c["start_datetime"])
+                async for c in self.db.classes.find({"id": {"$in": class_ids}}, {"_id": 0, "id": 1, "start_datetime": 1})
+            }
+            updates = [
+                UpdateOne({"_id": r["_id"], **query}, {"$set": {"occurrence_start": starts[r["class_id"]]}})
+                for r in reminders
+                if r["class_id"] in starts
+            ]
+            if updates:
+                result = await self.db.reminders.bulk_write(updates, ordered=False)
+                backfilled += result.modified_count
+            last_id = reminders[-1]["_id"]
+        return backfilled
+
+    async def migrate_datetimes(self, batch_size: int = 1000) -> Dict[str, int]:
+        """Convert legacy ISO-string datetimes to native BSON dates in place.
+
+        Safe to run against a live database and to interrupt: only documents
+        that still hold a string in one of the fields are selected, so a rerun
+        resumes where the last one stopped. Naive strings are taken as UTC.
+        Legacy reminders also get their missing `occurrence_start`.
+        """
+        converted = {}
+        for collection, fields in DATETIME_FIELDS.items():
+            query = {"$or": [{field: {"$type": "string"}} for field in fields]}
+            converted[collection] = 0
+            last_id = None
+            while True:
+                batch_query = {**query, "_id": {"$gt": last_id}} if last_id is not None else query
+                docs = await self.db[collection].find(batch_query, {field: 1 for field in fields}).sort("_id", 1).to_list(batch_size)
+                if not docs:
+                    break
+                updates = []
+                for doc in docs:
+                    changes = {}
+                    for field in fields:
+                        if isinstance(doc.get(field), str):
+                            try:
+                                changes[field] = parse_legacy_datetime(doc[field])
+                            except ValueError:
+                                logging.warning(f"Unparseable {collection}.{field} on {doc['_id']}: {doc[field]!r}")
+                    if changes:
+                        # Only overwrite values that are still the string we read
+                        updates.append(UpdateOne(
+                            {"_id": doc["_id"], **{field: doc[field] for field in changes}},
+                            {"$set": changes}
+                        ))
+                if updates:
+                    result = await self.db[collection].bulk_write(updates, ordered=False)
+                    converted[collection] += result.modified_count
+                last_id = docs[-1]["_id"]
+                logging.info(f"Migrated {converted[collection]} {collection} documents")
+        converted["reminders_occurrence_start"] = await self.backfill_occurrence_starts(batch_size)
+        return converted
+
+    def close(self):
+        self.client.close()
+
+
+def plan_stages(plan: Any) -> set:
+    """Collect every stage name in an explain() plan tree"""
+    stages = set()
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.add(plan["stage"])
+        for value in plan.values():
+            stages |= plan_stages(value)
+    elif isinstance(plan, list):
+        for value in plan:
+            stages |= plan_stages(value)
+    return stages
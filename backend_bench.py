@@ -0,0 +1,358 @@
+"""Benchmark suite for the timetable API.
+
+Runs the FastAPI app in-process (httpx over ASGI) against the in-memory
+storage backend (STORAGE_BACKEND=memory) or a real server given with
+--mongo-url, and delivers reminder emails to a local aiosmtpd sink. Results
+are written as JSON so runs can be compared.
+
+    pip install -r backend/requirements.txt
+    python backend_bench.py --output bench.json
+    python backend_bench.py --mongo-url mongodb://localhost:27017 --upload-sizes 1000,10000,100000
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import httpx
+
+BACKEND_DIR = Path(__file__).parent / "backend"
+BENCH_DB = "timetable_bench"
+STAFF_COUNT = 500
+PASSWORD = "bench-password"
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of samples"""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+class SMTPSink:
+    """Local SMTP server that accepts and counts every message"""
+
+    def __init__(self):
+        from aiosmtpd.controller import Controller
+
+        self.received = 0
+        # aiosmtpd cannot bind port 0 itself, so reserve a free port first
+        with socket.socket() as probe:
+            probe.bind(("127.0.0.1", 0))
+            self.port = probe.getsockname()[1]
+        self.controller = Controller(self, hostname="127.0.0.1", port=self.port)
+
+    async def handle_DATA(self, server, session, envelope):
+        self.received += 1
+        return "250 Message accepted"
+
+    def start(self):
+        self.controller.start()
+        return self.port
+
+    def stop(self):
+        self.controller.stop()
+
+
+class TimetableBenchmark:
+    def __init__(self, server, upload_sizes, reminders, read_clients, reads_per_client, logins, login_concurrency):
+        self.server = server
+        self.upload_sizes = upload_sizes
+        self.reminders = reminders
+        self.read_clients = read_clients
+        self.reads_per_client = reads_per_client
+        self.logins = logins
+        self.login_concurrency = login_concurrency
+        self.http = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=server.app),
+            base_url="http://bench",
+            timeout=None
+        )
+        self.admin_headers = None
+        self.staff_headers = None
+        self.results = {}
+
+    @property
+    def storage(self):
+        return self.server.storage
+
+    async def setup(self):
+        """Register an admin and a staff user through the API and seed staff for uploads"""
+        await self.storage.ensure_indexes()
+        admin = await self.http.post("/api/auth/register", json={
+            "name": "Bench Admin", "email": "admin@bench.example.com", "password": PASSWORD, "role": "admin"
+        })
+        staff = await self.http.post("/api/auth/register", json={
+            "name": "Bench Staff", "email": "staff@bench.example.com", "password": PASSWORD
+        })
+        self.admin_headers = {"Authorization": f"Bearer {admin.json()['token']}"}
+        self.staff_headers = {"Authorization": f"Bearer {staff.json()['token']}"}
+
+        # Upload teachers need accounts for reminders to be scheduled; one hash is reused
+        hashed = await self.server.password_hasher.hash(PASSWORD)
+        now = datetime.now(timezone.utc)
+        for i in range(STAFF_COUNT):
+            user = self.server.User(name=f"Teacher {i}", email=f"teacher{i}@bench.example.com").model_dump()
+            user.update(password=hashed, created_at=now)
+            await self.storage.users.insert(user)
+
+    async def reset_schedule(self):
+        await self.storage.clear(["classes", "reminders", "logs"])
+        self.server.agenda_cache.clear()
+
+    def timetable_csv(self, rows):
+        """Rows spread so no room or teacher is double-booked, all within the reminder horizon"""
+        base = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0) + timedelta(days=1)
+        lines = ["class_title,room,teacher_email,start_datetime,end_datetime,recurrence"]
+        for i in range(rows):
+            start = base + timedelta(minutes=(i // STAFF_COUNT) * 60 % (10 * 24 * 60))
+            lines.append(
+                f"Class {i},Room {i % 5000}-{i // 5000},teacher{i % STAFF_COUNT}@bench.example.com,"
+                f"{start.isoformat()},{(start + timedelta(minutes=50)).isoformat()},ONCE"
+            )
+        return "\n".join(lines).encode()
+
+    async def bench_upload(self):
+        results = []
+        for rows in self.upload_sizes:
+            await self.reset_schedule()
+            body = self.timetable_csv(rows)
+            started = time.perf_counter()
+            response = await self.http.post(
+                "/api/admin/timetables/upload",
+                headers=self.admin_headers,
+                files={"file": ("bench.csv", body, "text/csv")}
+            )
+            elapsed = time.perf_counter() - started
+            data = response.json()
+            results.append({
+                "rows": rows,
+                "status": response.status_code,
+                "seconds": round(elapsed, 3),
+                "rows_per_second": round(rows / elapsed, 1),
+                "classes_created": data.get("classes_created"),
+                "reminders_created": data.get("reminders_created"),
+                "errors": len(data.get("errors", [])),
+                "stage_timings_ms": data.get("timings")
+            })
+            print(f"✅ Upload {rows} rows: {elapsed:.2f}s ({rows / elapsed:.0f} rows/s)")
+        self.results["upload"] = results
+
+    async def bench_process_reminders(self, sink):
+        await self.reset_schedule()
+        now = datetime.now(timezone.utc)
+        teachers = await self.storage.users.find_by_emails([f"teacher{i}@bench.example.com" for i in range(STAFF_COUNT)])
+        class_id = str(uuid.uuid4())
+        await self.storage.classes.insert({
+            "id": class_id, "title": "Bench", "room": "Bench", "teacher_email": "teacher0@bench.example.com",
+            "start_datetime": now + timedelta(hours=1), "end_datetime": now + timedelta(hours=2),
+            "recurrence": "ONCE", "exception_dates": []
+        })
+        await self.storage.reminders.insert_many([{
+            "id": str(uuid.uuid4()),
+            "class_id": class_id,
+            "user_id": teachers[i % len(teachers)]["id"],
+            "channel": "email",
+            "scheduled_time": now - timedelta(seconds=1),
+            "occurrence_start": now + timedelta(hours=1),
+            "status": "pending",
+            "sent_at": None,
+            "error": None
+        } for i in range(self.reminders)])
+
+        received = sink.received
+        transport = self.server.SMTPPoolTransport("127.0.0.1", sink.port, starttls=False)
+        self.server.set_mail_transport(transport)
+        try:
+            started = time.perf_counter()
+            batches = 0
+            while await self.server.process_reminders(self.server.REMINDER_BATCH_SIZE):
+                batches += 1
+            elapsed = time.perf_counter() - started
+        finally:
+            await transport.close()
+        sent = sink.received - received
+        self.results["process_reminders"] = {
+            "reminders": self.reminders,
+            "sent": sent,
+            "batches": batches,
+            "seconds": round(elapsed, 3),
+            "reminders_per_second": round(self.reminders / elapsed, 1)
+        }
+        print(f"✅ process_reminders: {self.reminders / elapsed:.0f} reminders/s ({sent} sent)")
+
+    async def bench_reads(self):
+        await self.reset_schedule()
+        await self.http.post("/api/admin/timetables/upload", headers=self.admin_headers, files={
+            "file": ("bench.csv", self.timetable_csv(1000), "text/csv")
+        })
+        await self.http.post("/api/admin/classes", headers=self.admin_headers, json={
+            "title": "Staff Class", "room": "Staff Room", "teacher_email": "staff@bench.example.com",
+            "start_datetime": (datetime.now(timezone.utc) + timedelta(hours=3)).isoformat(),
+            "end_datetime": (datetime.now(timezone.utc) + timedelta(hours=4)).isoformat(),
+            "recurrence": "WEEKLY"
+        })
+
+        results = {}
+        for name, path, headers in (
+            ("staff_classes", "/api/users/me/classes?days=7", self.staff_headers),
+            ("admin_upcoming", "/api/admin/upcoming?hours=48", self.admin_headers),
+        ):
+            latencies = []
+
+            async def client():
+                for _ in range(self.reads_per_client):
+                    started = time.perf_counter()
+                    response = await self.http.get(path, headers=headers)
+                    latencies.append(time.perf_counter() - started)
+                    response.raise_for_status()
+
+            started = time.perf_counter()
+            await asyncio.gather(*(client() for _ in range(self.read_clients)))
+            elapsed = time.perf_counter() - started
+            results[name] = {
+                "clients": self.read_clients,
+                "requests": len(latencies),
+                "requests_per_second": round(len(latencies) / elapsed, 1),
+                "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+                "p99_ms": round(percentile(latencies, 99) * 1000, 2)
+            }
+            print(f"✅ {name}: p50 {results[name]['p50_ms']}ms, p99 {results[name]['p99_ms']}ms")
+        self.results["reads"] = results
+
+    async def bench_serialization(self, rows=1000, repeats=200):
+        """CPU time to encode one read response: FastAPI's default path vs the fast JSON path"""
+        from fastapi.encoders import jsonable_encoder
+        from fastapi.responses import JSONResponse
+
+        await self.reset_schedule()
+        await self.http.post("/api/admin/timetables/upload", headers=self.admin_headers, files={
+            "file": ("bench.csv", self.timetable_csv(rows), "text/csv")
+        })
+        now = datetime.now(timezone.utc)
+        documents = (await self.server.get_agenda(None, "UTC", now, now + timedelta(days=11)))[:rows]
+        user_doc = await self.storage.users.find_by_email("staff@bench.example.com")
+        user_doc.pop("password")
+
+        def cpu_ms(encode):
+            samples = []
+            for _ in range(repeats):
+                started = time.process_time()
+                encode()
+                samples.append((time.process_time() - started) * 1000)
+            return percentile(samples, 50)
+
+        default_ms = cpu_ms(lambda: JSONResponse(jsonable_encoder(documents)))
+        fast_ms = cpu_ms(lambda: self.server.fast_json(documents))
+        validated_ms = cpu_ms(lambda: self.server.User(**user_doc))
+        constructed_ms = cpu_ms(lambda: self.server.User.model_construct(**user_doc))
+        self.results["serialization"] = {
+            "rows": len(documents),
+            "bytes": len(self.server.fast_json(documents).body),
+            "default_cpu_ms": round(default_ms, 3),
+            "fast_cpu_ms": round(fast_ms, 3),
+            "saved_cpu_ms_per_response": round(default_ms - fast_ms, 3),
+            "speedup": round(default_ms / fast_ms, 1) if fast_ms else None,
+            "user_validate_us": round(validated_ms * 1000, 1),
+            "user_construct_us": round(constructed_ms * 1000, 1)
+        }
+        print(f"✅ Serialization of {len(documents)} rows: {default_ms:.2f}ms -> {fast_ms:.2f}ms CPU per response")
+
+    async def bench_login(self):
+        slots = asyncio.Semaphore(self.login_concurrency)
+        statuses = []
+
+        async def login():
+            async with slots:
+                response = await self.http.post("/api/auth/login", json={"email": "staff@bench.example.com", "password": PASSWORD})
+                statuses.append(response.status_code)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(login() for _ in range(self.logins)))
+        elapsed = time.perf_counter() - started
+        self.results["login"] = {
+            "logins": self.logins,
+            "concurrency": self.login_concurrency,
+            "succeeded": statuses.count(200),
+            "seconds": round(elapsed, 3),
+            "logins_per_second": round(self.logins / elapsed, 1)
+        }
+        print(f"✅ Login: {self.logins / elapsed:.1f} logins/s")
+
+    async def run(self, sink):
+        await self.setup()
+        await self.bench_upload()
+        await self.bench_process_reminders(sink)
+        await self.bench_reads()
+        await self.bench_serialization()
+        await self.bench_login()
+        await self.http.aclose()
+        return self.results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the timetable API in-process")
+    parser.add_argument("--mongo-url", help="Benchmark against a real MongoDB instead of the in-memory backend")
+    parser.add_argument("--upload-sizes", default="1000,10000,100000")
+    parser.add_argument("--reminders", type=int, default=5000)
+    parser.add_argument("--read-clients", type=int, default=50)
+    parser.add_argument("--reads-per-client", type=int, default=20)
+    parser.add_argument("--logins", type=int, default=100)
+    parser.add_argument("--login-concurrency", type=int, default=20)
+    parser.add_argument("--output", default="backend_bench_results.json")
+    args = parser.parse_args()
+
+    if args.mongo_url:
+        os.environ["MONGO_URL"] = args.mongo_url
+    os.environ["STORAGE_BACKEND"] = "mongo" if args.mongo_url else "memory"
+    os.environ["DB_NAME"] = BENCH_DB
+    sys.path.insert(0, str(BACKEND_DIR))
+    import server
+
+    if args.mongo_url:
+        asyncio.run(server.storage.clear())
+
+    sink = SMTPSink()
+    sink.start()
+    benchmark = TimetableBenchmark(
+        server,
+        upload_sizes=[int(size) for size in args.upload_sizes.split(",") if size],
+        reminders=args.reminders,
+        read_clients=args.read_clients,
+        reads_per_client=args.reads_per_client,
+        logins=args.logins,
+        login_concurrency=args.login_concurrency
+    )
+    print("🚀 Starting Timetable API Benchmarks...")
+    try:
+        results = asyncio.run(benchmark.run(sink))
+    finally:
+        sink.stop()
+        server.password_hasher.shutdown()
+
+    with open(args.output, "w") as f:
+        json.dump({
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "environment": {
+                "python": platform.python_version(),
+                "storage": server.STORAGE_BACKEND,
+                "bcrypt_rounds": server.pwd_context.to_dict().get("bcrypt__rounds"),
+                "emails_received": sink.received
+            },
+            "results": results
+        }, f, indent=2)
+    print(f"📊 Results written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
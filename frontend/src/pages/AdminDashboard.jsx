@@ -15,6 +15,7 @@ export default function AdminDashboard({ user, onLogout }) {
   const [logs, setLogs] = useState([]);
   const [users, setUsers] = useState([]);
   const [uploading, setUploading] = useState(false);
+  const [uploadProgress, setUploadProgress] = useState(0);
   const [newClass, setNewClass] = useState({
     title: "",
     room: "",
@@ -57,19 +58,49 @@ export default function AdminDashboard({ user, onLogout }) {
     }
   };
 
+  const pollUploadJob = async (jobId) => {
+    while (true) {
+      const response = await axios.get(`${API}/admin/timetables/jobs/${jobId}`);
+      const job = response.data;
+      setUploadProgress(job.rows_processed);
+      if (job.status === "completed" || job.status === "failed") return job;
+      await new Promise((resolve) => setTimeout(resolve, 1000));
+    }
+  };
+
   const handleFileUpload = async (e) => {
     const file = e.target.files[0];
     if (!file) return;
 
     setUploading(true);
+    setUploadProgress(0);
     const formData = new FormData();
     formData.append("file", file);
 
+    // Legacy .xls workbooks cannot be streamed; import them in one request
+    const stream = !file.name.toLowerCase().endsWith(".xls");
+
     try {
-      const response = await axios.post(`${API}/admin/timetables/upload`, formData, {
+      const response = await axios.post(`${API}/admin/timetables/upload${stream ? "?stream=true" : ""}`, formData, {
         headers: { "Content-Type": "multipart/form-data" }
       });
-      toast.success(`${response.data.classes_created} classes uploaded successfully!`);
+      const job = stream ? await pollUploadJob(response.data.job_id) : {
+        status: "completed",
+        classes_created: response.data.classes_created,
+        error_count: response.data.errors.length,
+        conflict_count: response.data.conflicts.length
+      };
+      if (job.status === "failed") {
+        toast.error(job.error || "Upload failed");
+      } else {
+        toast.success(`${job.classes_created} classes uploaded successfully!`);
+        if (job.error_count > 0) {
+          toast.warning(`${job.error_count} rows were skipped`);
+        }
+        if (job.conflict_count > 0) {
+          toast.warning(`${job.conflict_count} double-bookings were rejected`);
+        }
+      }
       fetchUpcoming();
     } catch (error) {
       toast.error(error.response?.data?.detail || "Upload failed");
@@ -92,7 +123,8 @@ export default function AdminDashboard({ user, onLogout }) {
       });
       fetchUpcoming();
     } catch (error) {
-      toast.error(error.response?.data?.detail || "Failed to create class");
+      const detail = error.response?.data?.detail;
+      toast.error(detail?.message || detail || "Failed to create class");
     }
   };
 
@@ -255,7 +287,7 @@ export default function AdminDashboard({ user, onLogout }) {
                   />
                   <p className="text-xs text-gray-500 mt-2">CSV or Excel files only</p>
                 </div>
-                {uploading && <p className="text-center text-blue-600">Uploading...</p>}
+                {uploading && <p className="text-center text-blue-600">Uploading... {uploadProgress} rows processed</p>}
               </CardContent>
             </Card>
           </TabsContent>
@@ -418,7 +450,11 @@ export default function AdminDashboard({ user, onLogout }) {
                           <span className="text-sm text-gray-600">{log.response}</span>
                           <span
                             className={`px-2 py-1 rounded-full text-xs font-medium ${
-                              log.status === "sent" ? "bg-green-100 text-green-800" : "bg-red-100 text-red-800"
+                              log.status === "sent"
+                                ? "bg-green-100 text-green-800"
+                                : log.status === "retrying"
+                                  ? "bg-amber-100 text-amber-800"
+                                  : "bg-red-100 text-red-800"
                             }`}
                           >
                             {log.status}
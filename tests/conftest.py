@@ -0,0 +1,50 @@
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+# The backend is run from its own directory, so its modules import as top-level names
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+os.environ.setdefault("STORAGE_BACKEND", "memory")
+# Cheap hashes; the cost factor is irrelevant to what the tests check
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+
+from storage_memory import MemoryStorage  # noqa: E402
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+@pytest.fixture
+def storage():
+    return MemoryStorage()
+
+
+@pytest.fixture
+def server(storage, monkeypatch):
+    """The server module wired to fresh in-memory storage"""
+    import server as server_module
+
+    monkeypatch.setattr(server_module, "storage", storage)
+    server_module.user_cache.clear()
+    server_module.agenda_cache.clear()
+    return server_module
+
+
+@pytest.fixture
+def admin(server):
+    return server.User(name="Admin", email="admin@x.com", role="admin")
+
+
+def stored(storage, repo):
+    """A copy of every document a memory repository holds"""
+    return [dict(doc) for doc in getattr(storage, repo).docs.values()]
+
+
+def register(server, email):
+    """Register a staff user through the API and return the stored user"""
+    user = run(server.register(server.UserCreate(name=email.split("@")[0], email=email, password="secret")))["user"]
+    return server.User(**user)
@@ -0,0 +1,69 @@
+import time
+from datetime import datetime, timedelta, timezone
+
+from tests.conftest import run
+
+MONDAY = datetime(2030, 1, 7, tzinfo=timezone.utc)
+
+
+def create(server, admin, day_offset=0, **fields):
+    start = MONDAY + timedelta(days=day_offset, hours=9)
+    class_data = server.Class(
+        title="Maths", room="R1", teacher_email="t@x.com",
+        start_datetime=start, end_datetime=start + timedelta(hours=1), **fields
+    )
+    return run(server.create_class(class_data, admin))["class"]
+
+
+def week(server, teacher="t@x.com"):
+    return run(server.get_agenda(teacher, "UTC", MONDAY, MONDAY + timedelta(days=7)))
+
+
+def test_repeat_reads_are_served_from_the_cache(server, storage, admin):
+    class_obj = create(server, admin)
+    assert [o["title"] for o in week(server)] == ["Maths"]
+    run(storage.classes.update(class_obj["id"], {"title": "Changed behind the cache"}))
+
+    assert [o["title"] for o in week(server)] == ["Maths"]
+    stats = server.agenda_cache.stats()
+    assert stats["misses"] == 7 and stats["hits"] == 7 and stats["size"] == 7
+
+
+def test_cached_days_expire_after_the_ttl(server, storage, admin, monkeypatch):
+    monkeypatch.setattr(server, "agenda_cache", server.AgendaCache(ttl_seconds=0.05))
+    class_obj = create(server, admin)
+    week(server)
+    run(storage.classes.update(class_obj["id"], {"title": "Algebra"}))
+
+    time.sleep(0.1)
+    assert [o["title"] for o in week(server)] == ["Algebra"]
+
+
+def test_class_writes_drop_only_the_days_they_touch(server, admin):
+    class_obj = create(server, admin)
+    week(server)
+    assert server.agenda_cache.stats()["size"] == 7
+
+    create(server, admin, day_offset=2)
+    assert server.agenda_cache.stats()["size"] == 6
+    assert [o["start_datetime"].day for o in week(server)] == [7, 9]
+
+    run(server.update_class(class_obj["id"], server.ClassUpdate(title="Algebra"), admin))
+    assert server.agenda_cache.stats()["size"] == 6
+    assert [o["title"] for o in week(server)] == ["Algebra", "Maths"]
+
+
+def test_cancelled_occurrences_leave_the_agenda(server, admin):
+    class_obj = create(server, admin, recurrence="WEEKLY")
+    next_week = run(server.get_agenda("t@x.com", "UTC", MONDAY + timedelta(days=7), MONDAY + timedelta(days=14)))
+    assert len(next_week) == 1
+
+    run(server.cancel_class_occurrence(class_obj["id"], server.ClassException(date=(MONDAY + timedelta(days=7)).date()), admin))
+    assert run(server.get_agenda("t@x.com", "UTC", MONDAY + timedelta(days=7), MONDAY + timedelta(days=14))) == []
+    assert len(week(server)) == 1
+
+
+def test_the_all_teachers_agenda_is_invalidated_too(server, admin):
+    assert week(server, teacher=None) == []
+    create(server, admin)
+    assert [o["teacher_email"] for o in week(server, teacher=None)] == ["t@x.com"]
@@ -0,0 +1,108 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+from passlib.context import CryptContext
+
+from tests.conftest import run
+
+
+def bearer(token):
+    return HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+
+
+def register_with_token(server, email):
+    result = run(server.register(server.UserCreate(name="Teacher", email=email, password="secret")))
+    return result["token"], result["user"]
+
+
+# --- User cache ---
+def test_repeat_lookups_are_served_from_the_cache(server, storage):
+    token, user = register_with_token(server, "t@x.com")
+    assert run(server.get_current_user(bearer(token))).timezone == "UTC"
+    run(storage.users.update_preferences(user["id"], "Europe/Paris", {}))
+
+    assert run(server.get_current_user(bearer(token))).timezone == "UTC"
+    assert server.user_cache.stats()["hits"] == 1 and server.user_cache.stats()["misses"] == 1
+
+
+def test_cached_users_expire_after_the_ttl(server, storage, monkeypatch):
+    monkeypatch.setattr(server, "user_cache", server.UserCache(ttl_seconds=0.05))
+    token, user = register_with_token(server, "t@x.com")
+    run(server.get_current_user(bearer(token)))
+    run(storage.users.update_preferences(user["id"], "Europe/Paris", {}))
+
+    time.sleep(0.1)
+    assert run(server.get_current_user(bearer(token))).timezone == "Europe/Paris"
+    assert server.user_cache.stats()["misses"] == 2
+
+
+def test_updating_preferences_invalidates_the_cached_user(server):
+    token, _ = register_with_token(server, "t@x.com")
+    user = run(server.get_current_user(bearer(token)))
+    run(server.update_preferences(server.PreferencesUpdate(lead_time_minutes=30), user))
+    assert run(server.get_current_user(bearer(token))).preferences["lead_time_minutes"] == 30
+
+
+def test_least_recently_used_users_are_evicted(server):
+    cache = server.UserCache(max_size=2)
+    users = [server.User(name=name, email=f"{name}@x.com") for name in "abc"]
+    cache.put(users[0])
+    cache.put(users[1])
+    cache.get(users[0].id)
+    cache.put(users[2])
+    assert cache.get(users[1].id) is None
+    assert cache.get(users[0].id) is users[0] and cache.get(users[2].id) is users[2]
+
+
+# --- Password hashing ---
+def test_saturated_hasher_refuses_with_503(server):
+    hasher = server.PasswordHasher(workers=1, max_pending=1)
+    release = threading.Event()
+
+    async def scenario():
+        blocked = asyncio.ensure_future(hasher._run(release.wait))
+        await asyncio.sleep(0)
+        with pytest.raises(HTTPException) as error:
+            await hasher.hash("secret")
+        release.set()
+        await blocked
+        return error.value
+
+    try:
+        error = run(scenario())
+    finally:
+        hasher.shutdown()
+    assert error.status_code == 503 and error.headers == {"Retry-After": "1"}
+    assert hasher.stats()["rejected"] == 1 and hasher.stats()["pending"] == 0
+
+
+def test_pool_hashes_and_verifies_concurrently(server):
+    hasher = server.PasswordHasher(workers=2)
+
+    async def scenario():
+        return await asyncio.gather(*(hasher.hash(password) for password in ("a", "b", "c")))
+
+    try:
+        hashes = run(scenario())
+        assert all(run(hasher.verify_and_update(password, hashed))[0] for password, hashed in zip("abc", hashes))
+    finally:
+        hasher.shutdown()
+    assert hasher.stats()["p50_ms"] is not None
+
+
+def test_login_upgrades_hashes_made_with_another_cost(server, storage):
+    _, user = register_with_token(server, "t@x.com")
+    old_hash = CryptContext(schemes=["bcrypt"], bcrypt__rounds=5).hash("secret")
+    current_hash = storage.users.docs[user["id"]]["password"]
+    assert run(storage.users.set_password(user["id"], current_hash, old_hash))
+
+    run(server.login(server.UserLogin(email="t@x.com", password="secret")))
+    new_hash = run(storage.users.find_by_email("t@x.com"))["password"]
+    assert new_hash != old_hash and new_hash.startswith("$2b$04$")
+    with pytest.raises(HTTPException) as error:
+        run(server.login(server.UserLogin(email="t@x.com", password="wrong")))
+    assert error.value.status_code == 401
@@ -0,0 +1,80 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import HTTPException
+
+from tests.conftest import register, run, stored
+
+
+def tomorrow_at(hour):
+    day = datetime.now(timezone.utc).date() + timedelta(days=1)
+    return datetime(day.year, day.month, day.day, hour, tzinfo=timezone.utc)
+
+
+def create(server, admin, **fields):
+    start = fields.pop("start", tomorrow_at(9))
+    class_data = server.Class(
+        title="Maths", room="R1", teacher_email="t@x.com",
+        start_datetime=start, end_datetime=start + timedelta(hours=1), **fields
+    )
+    return run(server.create_class(class_data, admin))["class"]
+
+
+# --- Cancellations ---
+def test_cancelling_drops_the_reminder_for_that_local_day(server, storage, admin):
+    register(server, "t@x.com")
+    sydney = server.ZoneInfo("Australia/Sydney")
+    first_day = datetime.now(sydney).date() + timedelta(days=3)
+    # 08:00 in Sydney falls on the previous UTC day
+    start = datetime.combine(first_day, datetime.min.time().replace(hour=8), tzinfo=sydney).astimezone(timezone.utc)
+    class_obj = create(server, admin, start=start, recurrence="WEEKLY", timezone="Australia/Sydney")
+
+    cancelled_day = first_day + timedelta(weeks=1)
+    result = run(server.cancel_class_occurrence(class_obj["id"], server.ClassException(date=cancelled_day), admin))
+    assert result["reminders_cancelled"] == 1
+    remaining = {r["occurrence_start"].astimezone(sydney).date() for r in stored(storage, "reminders")}
+    assert first_day in remaining and cancelled_day not in remaining
+
+
+def test_unknown_class_timezone_is_rejected(server, admin):
+    with pytest.raises(HTTPException) as error:
+        create(server, admin, timezone="Mars/Olympus")
+    assert error.value.status_code == 400
+
+
+# --- Rescheduling ---
+def test_moving_a_class_replaces_its_reminders(server, storage, admin):
+    register(server, "t@x.com")
+    class_obj = create(server, admin, recurrence="WEEKLY")
+    before = {r["occurrence_start"] for r in stored(storage, "reminders")}
+    assert tomorrow_at(9) in before
+
+    moved = server.ClassUpdate(start_datetime=tomorrow_at(11), end_datetime=tomorrow_at(12))
+    result = run(server.update_class(class_obj["id"], moved, admin))
+    after = stored(storage, "reminders")
+    assert result["reminders_rescheduled"] == len(before) + len(after)
+    assert {r["occurrence_start"] for r in after} == {start + timedelta(hours=2) for start in before}
+    assert {r["scheduled_time"] for r in after} == {start + timedelta(hours=2, minutes=-15) for start in before}
+
+
+def test_renaming_a_class_keeps_its_reminders(server, storage, admin):
+    register(server, "t@x.com")
+    class_obj = create(server, admin)
+    before = stored(storage, "reminders")
+    result = run(server.update_class(class_obj["id"], server.ClassUpdate(title="Algebra"), admin))
+    assert result["reminders_rescheduled"] == 0
+    assert stored(storage, "reminders") == before
+
+
+@pytest.mark.parametrize("field", ["start_datetime", "end_datetime", "teacher_email", "title"])
+def test_required_fields_cannot_be_cleared(server, admin, field):
+    class_obj = create(server, admin)
+    with pytest.raises(HTTPException) as error:
+        run(server.update_class(class_obj["id"], server.ClassUpdate(**{field: None}), admin))
+    assert error.value.status_code == 422
+
+
+def test_repeat_until_can_be_cleared(server, admin):
+    class_obj = create(server, admin, recurrence="WEEKLY", repeat_until=tomorrow_at(9) + timedelta(weeks=2))
+    result = run(server.update_class(class_obj["id"], server.ClassUpdate(repeat_until=None), admin))
+    assert result["class"]["repeat_until"] is None
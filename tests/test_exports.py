@@ -0,0 +1,77 @@
+import csv
+import io
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import HTTPException
+
+from tests.conftest import run
+
+START = datetime(2030, 1, 1, 9, tzinfo=timezone.utc)
+
+
+def seed_logs(storage, count):
+    logs = [
+        {
+            "id": f"log-{i:02d}",
+            "reminder_id": f"r-{i:02d}",
+            "channel": "email",
+            "timestamp": START + timedelta(minutes=i),
+            "scheduled_time": START + timedelta(minutes=i),
+            "lag_seconds": 1.5,
+            "status": "sent",
+            "response": None,
+        }
+        for i in range(count)
+    ]
+    run(storage.logs.insert_many(logs[::-1]))
+
+
+async def read_chunks(response):
+    return [chunk async for chunk in response.body_iterator]
+
+
+def export(server, admin, fmt, **kwargs):
+    response = run(server.export_logs(format=fmt, current_user=admin, **kwargs))
+    return response, run(read_chunks(response))
+
+
+def test_logs_export_as_ndjson_in_time_order(server, storage, admin, monkeypatch):
+    monkeypatch.setattr(server, "EXPORT_BATCH_SIZE", 2)
+    seed_logs(storage, 5)
+    response, chunks = export(server, admin, "ndjson", start=START + timedelta(minutes=1), end=START + timedelta(minutes=4))
+    assert response.media_type == "application/x-ndjson"
+    assert response.headers["content-disposition"] == 'attachment; filename="logs.ndjson"'
+    # Streamed a batch at a time rather than built up in one string
+    assert len(chunks) == 2
+    lines = [json.loads(line) for line in "".join(chunks).splitlines()]
+    assert [line["id"] for line in lines] == ["log-01", "log-02", "log-03"]
+    assert lines[0]["timestamp"] == (START + timedelta(minutes=1)).isoformat()
+
+
+def test_logs_export_as_csv_with_a_header(server, storage, admin):
+    seed_logs(storage, 2)
+    response, chunks = export(server, admin, "csv")
+    assert response.media_type.startswith("text/csv")
+    rows = list(csv.reader(io.StringIO("".join(chunks))))
+    assert rows[0] == server.EXPORT_COLUMNS["logs"]
+    assert [row[0] for row in rows[1:]] == ["log-00", "log-01"]
+    assert rows[1][3] == START.isoformat() and rows[1][7] == ""
+
+
+def test_classes_export_joins_exception_dates(server, admin):
+    class_data = server.Class(
+        title="Maths", room="R1", teacher_email="t@x.com", recurrence="WEEKLY",
+        start_datetime=START, end_datetime=START + timedelta(hours=1), exception_dates=["2030-01-08", "2030-01-15"]
+    )
+    run(server.create_class(class_data, admin))
+    response = run(server.export_classes(format="csv", current_user=admin))
+    rows = list(csv.DictReader(io.StringIO("".join(run(read_chunks(response))))))
+    assert [row["exception_dates"] for row in rows] == ["2030-01-08;2030-01-15"]
+
+
+def test_unknown_export_format_is_rejected(server, admin):
+    with pytest.raises(HTTPException) as error:
+        run(server.export_logs(format="xml", current_user=admin))
+    assert error.value.status_code == 400
@@ -0,0 +1,82 @@
+import smtplib
+from email.mime.multipart import MIMEMultipart
+
+import pytest
+
+from tests.conftest import run
+
+
+class FakeSMTP:
+    """Stands in for smtplib.SMTP; `script` holds the error (or None) for each send in turn"""
+
+    opened = []
+
+    def __init__(self, host, port, timeout=None):
+        self.script = []
+        self.closed = False
+        self.sent = 0
+        FakeSMTP.opened.append(self)
+
+    def send_message(self, msg):
+        error = self.script.pop(0) if self.script else None
+        if error:
+            raise error
+        self.sent += 1
+
+    def close(self):
+        self.closed = True
+
+    def quit(self):
+        self.closed = True
+
+
+@pytest.fixture
+def transport(server, monkeypatch):
+    FakeSMTP.opened = []
+    monkeypatch.setattr(smtplib, "SMTP", FakeSMTP)
+    return server.SMTPPoolTransport("localhost", 25, starttls=False, pool_size=1)
+
+
+def message(to="a@x.com"):
+    msg = MIMEMultipart()
+    msg["To"] = to
+    return msg
+
+
+def send(server, transport, msg):
+    try:
+        run(transport.send(msg))
+    except server.MailDeliveryError as e:
+        return e
+
+
+def test_connection_is_reused_after_a_refused_recipient(server, transport):
+    assert send(server, transport, message()) is None
+    conn = FakeSMTP.opened[0]
+    conn.script = [smtplib.SMTPRecipientsRefused({"b@x.com": (550, b"no such user")})]
+    assert send(server, transport, message("b@x.com")).permanent
+    assert send(server, transport, message()) is None
+    assert FakeSMTP.opened == [conn]
+    assert (conn.sent, conn.closed) == (2, False)
+
+
+def test_connection_is_closed_after_a_connection_error(server, transport):
+    send(server, transport, message())
+    broken = FakeSMTP.opened[0]
+    broken.script = [TimeoutError("timed out")]
+    assert not send(server, transport, message()).permanent
+    assert broken.closed
+    assert transport.stats()["idle_connections"] == 0
+
+    assert send(server, transport, message()) is None
+    assert len(FakeSMTP.opened) == 2
+
+
+def test_stale_connection_is_closed_before_reconnecting(server, transport):
+    send(server, transport, message())
+    stale = FakeSMTP.opened[0]
+    stale.script = [smtplib.SMTPServerDisconnected("idle timeout")]
+    assert send(server, transport, message()) is None
+    assert stale.closed
+    assert FakeSMTP.opened[1].sent == 1
+    assert transport.stats()["idle_connections"] == 1
@@ -0,0 +1,10 @@
+from tests.conftest import run
+
+
+def test_metrics_are_served_in_the_prometheus_format(server):
+    server.reminder_retries.labels(channel="email").inc()
+    response = run(server.get_metrics())
+    assert response.media_type.startswith("text/plain")
+    body = response.body.decode()
+    assert 'reminder_retries_total{channel="email"}' in body
+    assert "# TYPE reminder_batch_duration_seconds histogram" in body
@@ -0,0 +1,188 @@
+import random
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from tests.conftest import run
+
+START = datetime(2030, 1, 7, 9, 0, tzinfo=timezone.utc)  # a Monday in ISO week 2
+
+
+def make_class(recurrence="WEEKLY", start=START, hours=1, **extra):
+    return {
+        "id": extra.pop("id", "c"),
+        "title": "Maths",
+        "room": extra.pop("room", "R1"),
+        "teacher_email": extra.pop("teacher_email", "t@x.com"),
+        "start_datetime": start,
+        "end_datetime": start + timedelta(hours=hours),
+        "recurrence": recurrence,
+        **extra,
+    }
+
+
+def expand_naively(class_obj, window_start, window_end, weeks=200):
+    """Every weekly slot from the first start, filtered the slow way"""
+    skipped = set(class_obj.get("exception_dates") or [])
+    repeat_until = class_obj.get("repeat_until")
+    duration = class_obj["end_datetime"] - class_obj["start_datetime"]
+    slots = [class_obj["start_datetime"]]
+    if class_obj["recurrence"] != "ONCE":
+        slots = [class_obj["start_datetime"] + timedelta(weeks=i) for i in range(weeks)]
+    parity = {"ODD_WEEKS": 1, "EVEN_WEEKS": 0}.get(class_obj["recurrence"])
+    return [
+        (slot, slot + duration) for slot in slots
+        if window_start <= slot < window_end
+        and (parity is None or slot.isocalendar().week % 2 == parity)
+        and slot.date().isoformat() not in skipped
+        and (repeat_until is None or slot <= repeat_until)
+    ]
+
+
+def test_once_yields_only_inside_window(server):
+    class_obj = make_class("ONCE")
+    assert list(server.iter_occurrences(class_obj, START, START + timedelta(days=1))) == [(START, START + timedelta(hours=1))]
+    assert list(server.iter_occurrences(class_obj, START + timedelta(seconds=1), START + timedelta(days=1))) == []
+
+
+def test_odd_and_even_weeks_follow_iso_week_parity(server):
+    window = (START, START + timedelta(weeks=6))
+    odd = [s for s, _ in server.iter_occurrences(make_class("ODD_WEEKS"), *window)]
+    even = [s for s, _ in server.iter_occurrences(make_class("EVEN_WEEKS"), *window)]
+    assert [s.isocalendar().week for s in odd] == [3, 5, 7]
+    assert [s.isocalendar().week for s in even] == [2, 4, 6]
+
+
+def test_exception_dates_and_repeat_until(server):
+    class_obj = make_class(
+        exception_dates=[(START + timedelta(weeks=1)).date().isoformat()],
+        repeat_until=START + timedelta(weeks=3)
+    )
+    starts = [s for s, _ in server.iter_occurrences(class_obj, START, START + timedelta(weeks=10))]
+    # repeat_until is inclusive
+    assert starts == [START, START + timedelta(weeks=2), START + timedelta(weeks=3)]
+
+
+@pytest.mark.parametrize("recurrence", ["ONCE", "WEEKLY", "ODD_WEEKS", "EVEN_WEEKS"])
+def test_matches_naive_expansion_for_random_windows(server, recurrence):
+    rng = random.Random(recurrence)
+    for _ in range(100):
+        class_obj = make_class(
+            recurrence,
+            exception_dates=[(START + timedelta(weeks=rng.randrange(30))).date().isoformat() for _ in range(3)],
+            repeat_until=START + timedelta(weeks=rng.randrange(10, 60)) if rng.random() < 0.5 else None
+        )
+        window_start = START + timedelta(hours=rng.randrange(-500, 8000))
+        window_end = window_start + timedelta(hours=rng.randrange(1, 3000))
+        assert list(server.iter_occurrences(class_obj, window_start, window_end)) == expand_naively(class_obj, window_start, window_end)
+
+
+def test_weekly_classes_keep_their_wall_clock_time_across_dst(server):
+    # 09:00 in London is 08:00 UTC in BST; the clocks go back on 2026-10-25
+    class_obj = make_class("WEEKLY", start=datetime(2026, 10, 20, 8, tzinfo=timezone.utc), timezone="Europe/London")
+    starts = [s for s, _ in server.iter_occurrences(class_obj, class_obj["start_datetime"], datetime(2026, 11, 4, tzinfo=timezone.utc))]
+    assert starts == [
+        datetime(2026, 10, 20, 8, tzinfo=timezone.utc),
+        datetime(2026, 10, 27, 9, tzinfo=timezone.utc),
+        datetime(2026, 11, 3, 9, tzinfo=timezone.utc),
+    ]
+    # Jumping straight into a window after the change lands on the same slots
+    later = list(server.iter_occurrences(class_obj, datetime(2026, 11, 3, 9, tzinfo=timezone.utc), datetime(2026, 11, 4, tzinfo=timezone.utc)))
+    assert [s for s, _ in later] == starts[-1:]
+
+
+def test_week_parity_and_exceptions_use_the_local_date(server):
+    # Monday 08:00 in Sydney is still Sunday in UTC, which is in the previous ISO week
+    monday = datetime(2030, 1, 6, 21, tzinfo=timezone.utc)  # 2030-01-07 08:00 AEDT, ISO week 2
+    window = (monday, monday + timedelta(weeks=4))
+    even = make_class("EVEN_WEEKS", start=monday, timezone="Australia/Sydney", exception_dates=["2030-01-21"])
+    starts = [s for s, _ in server.iter_occurrences(even, *window)]
+    assert starts == [monday]
+    assert [s.astimezone(server.ZoneInfo("Australia/Sydney")).date().isoformat() for s in starts] == ["2030-01-07"]
+
+
+def test_unknown_class_timezones_fall_back_to_utc(server):
+    class_obj = make_class("WEEKLY", timezone="Not/AZone")
+    assert next(server.iter_occurrences(class_obj, START, START + timedelta(days=1)))[0] == START
+
+
+def test_legacy_string_datetimes_are_expanded(server):
+    class_obj = make_class("WEEKLY")
+    class_obj["start_datetime"] = class_obj["start_datetime"].isoformat()
+    class_obj["end_datetime"] = class_obj["end_datetime"].isoformat()
+    assert next(server.iter_occurrences(class_obj, START, START + timedelta(days=1)))[0] == START
+
+
+def test_find_occurrences_pages_by_start_and_id(server, storage):
+    assert run(storage.classes.insert_many([make_class(id="b"), make_class(id="a"), make_class("ONCE", id="c", start=START + timedelta(days=1))])) == []
+    window = (START, START + timedelta(weeks=2))
+    everything = run(server.find_occurrences(None, *window))
+    assert [(o["start_datetime"], o["id"]) for o in everything] == [
+        (START, "a"), (START, "b"), (START + timedelta(days=1), "c"),
+        (START + timedelta(weeks=1), "a"), (START + timedelta(weeks=1), "b"),
+    ]
+    rest = run(server.find_occurrences(None, *window, after=(START, "b"), limit=2))
+    assert [(o["start_datetime"], o["id"]) for o in rest] == [(START + timedelta(days=1), "c"), (START + timedelta(weeks=1), "a")]
+
+
+# --- Booking conflicts ---
+def flagged(conflicts):
+    return {(c["row"], c["resource"]) for c in conflicts}
+
+
+def test_back_to_back_classes_do_not_conflict(server):
+    first = make_class("ONCE")
+    second = make_class("ONCE", start=START + timedelta(hours=1))
+    assert server.find_booking_conflicts([(2, first), (3, second)], [], START, START + timedelta(days=1)) == []
+
+
+def test_room_and_teacher_double_bookings(server):
+    candidate = make_class("ONCE", start=START + timedelta(minutes=30), room="R1", teacher_email="other@x.com")
+    same_teacher = make_class("ONCE", start=START + timedelta(minutes=30), room="R2")
+    existing = make_class("WEEKLY", id="existing", start=START - timedelta(weeks=2))
+    conflicts = server.find_booking_conflicts([(2, candidate), (3, same_teacher)], [existing], START - timedelta(days=1), START + timedelta(days=1))
+    assert flagged(conflicts) == {(2, "room"), (3, "teacher")}
+    room_conflict = next(c for c in conflicts if c["row"] == 2)
+    assert room_conflict["conflicts_with"]["class_id"] == "existing"
+    assert room_conflict["start_datetime"] == candidate["start_datetime"].isoformat()
+
+
+def test_sweep_flags_the_same_rows_as_pairwise_checks(server):
+    rng = random.Random(3)
+    window = (START, START + timedelta(weeks=4))
+    for _ in range(30):
+        classes = [
+            make_class(
+                rng.choice(["ONCE", "WEEKLY", "ODD_WEEKS"]),
+                id=f"c{i}",
+                start=START + timedelta(hours=rng.randrange(0, 24 * 7)),
+                hours=rng.choice([1, 2, 3]),
+                room=rng.choice(["R1", "R2", "R3"]),
+                teacher_email=rng.choice(["a@x.com", "b@x.com", "c@x.com"]),
+            )
+            for i in range(12)
+        ]
+        candidates, existing = list(enumerate(classes[:8])), classes[8:]
+
+        expected = set()
+        for row, candidate in candidates:
+            others = [c for c in classes if c is not candidate]
+            for resource, field in (("room", "room"), ("teacher", "teacher_email")):
+                for other in others:
+                    if other[field] != candidate[field]:
+                        continue
+                    if any(
+                        a_start < b_end and b_start < a_end
+                        for a_start, a_end in server.iter_occurrences(candidate, *window)
+                        for b_start, b_end in server.iter_occurrences(other, *window)
+                    ):
+                        expected.add((row, resource))
+        assert flagged(server.find_booking_conflicts(candidates, existing, *window)) == expected
+
+
+def test_check_booking_conflicts_skips_the_class_being_edited(server, storage):
+    stored = make_class("WEEKLY", id="stored")
+    run(storage.classes.insert(dict(stored)))
+    moved = {**stored, "start_datetime": START + timedelta(minutes=30), "end_datetime": START + timedelta(minutes=90)}
+    assert run(server.check_booking_conflicts([(None, moved)], exclude_id="stored")) == []
+    assert run(server.check_booking_conflicts([(None, {**moved, "id": "new"})]))
@@ -0,0 +1,269 @@
+import asyncio
+import os
+import smtplib
+import subprocess
+import sys
+import time
+from pathlib import Path
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import HTTPException, Response
+
+from tests.conftest import run, stored
+
+
+# --- Quiet hours ---
+def london_user(start="22:00", end="07:00"):
+    return {
+        "id": "u",
+        "timezone": "Europe/London",
+        "preferences": {"quiet_hours": {"enabled": True, "start": start, "end": end}},
+    }
+
+
+def test_quiet_hours_follow_dst_changes(server):
+    # Clocks go forward on 2026-03-29: the night starts at 22:00 GMT and ends at 07:00 BST
+    starts, ends = server.quiet_hours_intervals(
+        london_user(), datetime(2026, 3, 28, 23, tzinfo=timezone.utc), datetime(2026, 3, 29, 12, tzinfo=timezone.utc)
+    )
+    windows = list(zip(starts, ends))
+    assert (datetime(2026, 3, 28, 22, tzinfo=timezone.utc).timestamp(), datetime(2026, 3, 29, 6, tzinfo=timezone.utc).timestamp()) in windows
+
+
+def test_send_inside_quiet_hours_is_deferred_or_suppressed(server):
+    send_time = datetime(2026, 3, 28, 23, tzinfo=timezone.utc)
+    reminders = [
+        {"user_id": "u", "occurrence_start": datetime(2026, 3, 29, 8, tzinfo=timezone.utc)},
+        {"user_id": "u", "occurrence_start": datetime(2026, 3, 29, 5, tzinfo=timezone.utc)},
+        {"user_id": "u"},  # legacy row without an occurrence: deferred, never suppressed
+    ]
+    results = server.enforce_quiet_hours(reminders, {"u": london_user()}, [send_time] * 3)
+    assert results == [datetime(2026, 3, 29, 6, tzinfo=timezone.utc), None, datetime(2026, 3, 29, 6, tzinfo=timezone.utc)]
+
+
+def test_send_outside_quiet_hours_is_unchanged(server):
+    send_time = datetime(2026, 7, 1, 12, tzinfo=timezone.utc)
+    reminder = {"user_id": "u", "occurrence_start": send_time + timedelta(minutes=15)}
+    assert server.enforce_quiet_hours([reminder], {"u": london_user()}, [send_time]) == [send_time]
+    assert server.enforce_quiet_hours([reminder], {"u": {"id": "u"}}, [send_time]) == [send_time]
+
+
+def test_quiet_hours_do_not_load_numpy():
+    # A fresh interpreter, since other tests may already have imported NumPy
+    probe = """
+import sys
+from datetime import datetime, timezone
+import server
+night = datetime(2030, 1, 1, 3, tzinfo=timezone.utc)
+user = {"id": "u", "preferences": {"quiet_hours": {"enabled": True, "start": "22:00", "end": "07:00"}}}
+print(server.enforce_quiet_hours([{"user_id": "u"}], {"u": user}, [night]) != [night])
+print("numpy" in sys.modules)
+"""
+    backend = Path(__file__).resolve().parent.parent / "backend"
+    result = subprocess.run([sys.executable, "-c", probe], cwd=backend, capture_output=True, text=True, check=True,
+                            env={**os.environ, "STORAGE_BACKEND": "memory"})
+    assert result.stdout.strip().splitlines()[-2:] == ["True", "False"]
+
+
+# --- Retries ---
+@pytest.mark.parametrize("error, permanent", [
+    (smtplib.SMTPRecipientsRefused({"a@x.com": (550, b"no such user")}), True),
+    (smtplib.SMTPRecipientsRefused({"a@x.com": (450, b"mailbox busy")}), False),
+    (smtplib.SMTPResponseException(554, b"rejected"), True),
+    (smtplib.SMTPResponseException(421, b"try later"), False),
+    (smtplib.SMTPAuthenticationError(535, b"bad credentials"), False),
+    (smtplib.SMTPServerDisconnected("dropped"), False),
+    (TimeoutError("timed out"), False),
+])
+def test_classify_smtp_error(server, error, permanent):
+    assert server.classify_smtp_error(error).permanent is permanent
+
+
+def test_retry_delay_doubles_with_jitter_and_a_cap(server):
+    now = datetime(2030, 1, 1, tzinfo=timezone.utc)
+    for attempts in range(1, 10):
+        delay = min(server.RETRY_MAX_SECONDS, server.RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+        for _ in range(20):
+            seconds = (server.next_retry_time(attempts, now) - now).total_seconds()
+            assert delay / 2 <= seconds <= delay
+
+
+# --- Keyset pagination ---
+def test_cursor_round_trips_datetimes(server):
+    values = [datetime(2030, 1, 1, 12, 30, tzinfo=timezone.utc), "id-1"]
+    assert server.decode_cursor(server.encode_cursor(values)) == values
+    with pytest.raises(HTTPException):
+        server.decode_cursor("not a cursor")
+
+
+def test_paginate_visits_every_row_once(server, storage):
+    base = datetime(2030, 1, 1, tzinfo=timezone.utc)
+    # Repeated timestamps force the id tie-breaker
+    run(storage.logs.insert_many([{"id": f"{i:03d}", "timestamp": base + timedelta(minutes=i // 3)} for i in range(50)]))
+    seen, cursor = [], None
+    while True:
+        response = Response()
+        page = run(server.paginate(storage.logs.page, ["timestamp", "id"], 7, cursor, response))
+        seen.extend(row["id"] for row in page)
+        cursor = response.headers.get(server.NEXT_CURSOR_HEADER)
+        if not cursor:
+            break
+    assert seen == sorted((f"{i:03d}" for i in range(50)), reverse=True)
+
+
+# --- Leases ---
+async def insert_due_reminders(storage, count):
+    now = datetime.now(timezone.utc)
+    await storage.reminders.insert_many([
+        {"id": f"r{i}", "class_id": "c", "user_id": "u", "scheduled_time": now - timedelta(seconds=count - i),
+         "occurrence_start": now + timedelta(hours=1), "status": "pending", "channel": "email"}
+        for i in range(count)
+    ])
+
+
+def test_claims_never_overlap(server, storage):
+    async def scenario():
+        await insert_due_reminders(storage, 5)
+        first_token, first = await server.claim_reminders(3)
+        second_token, second = await server.claim_reminders(3)
+        return first_token, first, second_token, second
+
+    first_token, first, second_token, second = run(scenario())
+    assert first_token != second_token
+    assert [r["id"] for r in first] == ["r0", "r1", "r2"]
+    assert [r["id"] for r in second] == ["r3", "r4"]
+
+
+def test_only_expired_leases_are_released(server, storage, monkeypatch):
+    lease_seconds = server.REMINDER_LEASE_SECONDS
+
+    async def scenario():
+        await insert_due_reminders(storage, 2)
+        # Claimed by a worker that died; its lease has run out
+        monkeypatch.setattr(server, "REMINDER_LEASE_SECONDS", -1)
+        await server.claim_reminders(1)
+        monkeypatch.setattr(server, "REMINDER_LEASE_SECONDS", lease_seconds)
+        await server.claim_reminders(1)
+        released = await server.release_expired_leases()
+        statuses = {r["id"]: r["status"] for r in stored(storage, "reminders")}
+        return released, statuses
+
+    assert run(scenario()) == (1, {"r0": "pending", "r1": "processing"})
+
+
+def test_lease_is_renewed_while_held(server, storage, monkeypatch):
+    monkeypatch.setattr(server, "REMINDER_LEASE_SECONDS", 0.3)
+
+    async def scenario():
+        await insert_due_reminders(storage, 1)
+        claimed_at = time.monotonic()
+        token, _ = await server.claim_reminders(1)
+        first_expiry = storage.reminders.docs["r0"]["lease_expires_at"]
+        lease = server.ReminderLease(token, claimed_at)
+        lease.start()
+        await asyncio.sleep(0.5)
+        held = lease.held
+        await lease.stop()
+        return first_expiry, storage.reminders.docs["r0"]["lease_expires_at"], held
+
+    first_expiry, renewed_expiry, held = run(scenario())
+    assert renewed_expiry > first_expiry
+    assert held
+
+
+def test_lease_is_given_up_once_released(server, storage, monkeypatch):
+    monkeypatch.setattr(server, "REMINDER_LEASE_SECONDS", 0.3)
+
+    async def scenario():
+        await insert_due_reminders(storage, 1)
+        token, _ = await server.claim_reminders(1)
+        lease = server.ReminderLease(token, time.monotonic())
+        lease.start()
+        # Another worker recovered the reminder as if the lease had lapsed
+        await storage.reminders.release_expired(datetime.now(timezone.utc) + timedelta(hours=1))
+        await asyncio.sleep(0.2)
+        held = lease.held
+        await lease.stop()
+        return held
+
+    assert run(scenario()) is False
+
+
+# --- Delivery statistics ---
+def test_lag_percentiles_interpolate_within_buckets(server):
+    histogram = {}
+    for lag in range(250):
+        bucket = sum(1 for bound in server.LAG_BUCKETS if bound < lag)
+        histogram[bucket] = histogram.get(bucket, 0) + 1
+    assert [server.lag_percentile(histogram, 250, p, 249) for p in (50, 90, 99)] == [124.0, 224.0, 246.5]
+    assert server.lag_percentile({}, 0, 50, None) is None
+
+
+# --- Processing ---
+class RecordingTransport:
+    """Fails sends to the addresses in `failing` with a transient error"""
+
+    def __init__(self, server, failing=()):
+        self.error = server.MailDeliveryError
+        self.failing = set(failing)
+        self.sent = []
+
+    async def send(self, msg, may_send=None):
+        if msg["To"] in self.failing:
+            raise self.error("SMTP 421: try later")
+        self.sent.append(msg["To"])
+
+
+def test_one_bad_row_does_not_drop_the_batch(server, storage, monkeypatch):
+    transport = RecordingTransport(server, failing={"busy@x.com"})
+    monkeypatch.setattr(server, "mail_transport", transport)
+    start = datetime.now(timezone.utc) + timedelta(hours=1)
+    due = datetime.now(timezone.utc) - timedelta(minutes=1)
+
+    async def scenario():
+        await storage.classes.insert({"id": "c", "title": "Maths", "room": "R1", "start_datetime": start,
+                                            "end_datetime": start + timedelta(hours=1), "recurrence": "ONCE"})
+        for u in ("ok", "busy", "bad"):
+            await storage.users.insert({"id": u, "email": f"{u}@x.com"})
+        await storage.reminders.insert_many([
+            # Legacy row from before occurrence tracking
+            {"id": "legacy", "class_id": "c", "user_id": "ok", "scheduled_time": due, "status": "pending", "channel": "email"},
+            {"id": "retry", "class_id": "c", "user_id": "busy", "scheduled_time": due, "occurrence_start": start,
+             "status": "pending", "channel": "email"},
+            # Sends fine, but its outcome cannot be worked out
+            {"id": "bad", "class_id": "c", "user_id": "bad", "scheduled_time": due, "first_scheduled_time": "not a date",
+             "occurrence_start": start, "status": "pending", "channel": "email"},
+        ])
+        claimed = await server.process_reminders()
+        return claimed, {r["id"]: r["status"] for r in stored(storage, "reminders")}
+
+    assert run(scenario()) == (3, {"legacy": "sent", "retry": "pending", "bad": "sent"})
+    assert sorted(transport.sent) == ["bad@x.com", "ok@x.com"]
+
+
+def test_dead_letter_for_a_missing_class_can_be_requeued(server, storage, admin):
+    # Whole seconds, as stored dates only keep milliseconds
+    due = datetime.now(timezone.utc).replace(microsecond=0) - timedelta(minutes=1)
+
+    async def scenario():
+        await storage.users.insert({"id": "u", "email": "u@x.com", "preferences": {"lead_time_minutes": 30}})
+        # Legacy row, and its class has since been deleted
+        await storage.reminders.insert_many([{"id": "r", "class_id": "gone", "user_id": "u", "scheduled_time": due,
+                                              "status": "pending", "channel": "email"}])
+        await server.process_reminders()
+        dead_letter = await storage.dead_letters.get("r")
+        result = await server.requeue_dead_letter("r", admin)
+        return dead_letter, result, storage.reminders.docs["r"]
+
+    dead_letter, result, reminder = run(scenario())
+    assert (dead_letter["reason"], dead_letter["occurrence_start"]) == ("permanent_failure", due + timedelta(minutes=30))
+    assert result == {"success": True}
+    assert reminder["status"] == "pending"
+
+
+def test_dead_letter_without_an_occurrence_start_is_not_requeued(server, storage, admin):
+    run(storage.dead_letters.upsert_many([{"id": "r", "scheduled_time": datetime.now(timezone.utc), "occurrence_start": None}]))
+    with pytest.raises(HTTPException) as error:
+        run(server.requeue_dead_letter("r", admin))
+    assert error.value.status_code == 409
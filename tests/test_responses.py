@@ -0,0 +1,49 @@
+import json
+from datetime import datetime, timedelta, timezone
+
+from fastapi import Response
+from fastapi.encoders import jsonable_encoder
+
+from tests.conftest import register, run
+
+MONDAY = datetime(2030, 1, 7, 9, tzinfo=timezone.utc)
+
+
+def default_encoding(content):
+    """What FastAPI would send for the same content without fast_json"""
+    return json.loads(json.dumps(jsonable_encoder(content)))
+
+
+def test_fast_json_matches_the_default_encoder(server):
+    content = {
+        "when": datetime(2030, 1, 7, 9, 30, 15, 250000, tzinfo=timezone.utc),
+        "user": server.User(name="T", email="t@x.com"),
+        "tags": {"a"},
+        "nested": [{"n": 1, "f": 1.5, "none": None}],
+    }
+    assert json.loads(server.fast_json(content).body) == default_encoding(content)
+
+
+def test_timetable_page_matches_the_default_encoder(server, admin):
+    teacher = register(server, "t@x.com")
+    for week in range(3):
+        start = MONDAY + timedelta(weeks=week)
+        class_data = server.Class(title="Maths", room="R1", teacher_email="t@x.com", start_datetime=start, end_datetime=start + timedelta(hours=1))
+        run(server.create_class(class_data, admin))
+
+    response = Response()
+    page = run(server.get_my_timetable(response, limit=2, cursor=None, current_user=teacher))
+    classes = [server.class_view(c) for c in run(server.storage.classes.page_for_teacher("t@x.com", 2))]
+    assert page.media_type == "application/json"
+    assert json.loads(page.body) == default_encoding(classes)
+    assert [c["start_datetime"] for c in json.loads(page.body)] == [MONDAY.isoformat(), (MONDAY + timedelta(weeks=1)).isoformat()]
+    # The next-page cursor set on the injected response is carried over
+    assert page.headers[server.NEXT_CURSOR_HEADER] == response.headers[server.NEXT_CURSOR_HEADER]
+
+
+def test_login_matches_the_user_model(server):
+    register(server, "t@x.com")
+    body = json.loads(run(server.login(server.UserLogin(email="t@x.com", password="secret"))).body)
+    [stored_user] = run(server.storage.users.find_by_emails(["t@x.com"]))
+    assert body["user"] == default_encoding(server.User(**stored_user).model_dump())
+    assert "password" not in body["user"]
@@ -0,0 +1,172 @@
+"""The dict-backed repositories against the results the Mongo ones give for the same calls"""
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from storage import DuplicateError
+from storage_memory import MemoryStorage
+from tests.conftest import run
+
+START = datetime(2030, 1, 7, 9, tzinfo=timezone.utc)
+
+
+def make_class(class_id, recurrence="ONCE", days=0, **fields):
+    start = START + timedelta(days=days)
+    return {"id": class_id, "title": "Maths", "room": "R1", "teacher_email": "t@x.com", "start_datetime": start,
+            "end_datetime": start + timedelta(hours=1), "recurrence": recurrence, **fields}
+
+
+def reminder(reminder_id, minutes, **fields):
+    return {"id": reminder_id, "class_id": "c", "user_id": "u", "scheduled_time": START + timedelta(minutes=minutes),
+            "occurrence_start": START + timedelta(hours=1), "status": "pending", "channel": "email", **fields}
+
+
+def test_datetimes_are_stored_as_aware_utc_milliseconds(storage):
+    naive = datetime(2030, 1, 1, 12, 0, 0, 123456)
+    run(storage.classes.insert(make_class("c", start_datetime=naive)))
+    class_obj = run(storage.classes.get("c"))
+    assert class_obj["start_datetime"] == datetime(2030, 1, 1, 12, 0, 0, 123000, tzinfo=timezone.utc)
+
+    # Reads are copies; changing one never reaches the stored document
+    class_obj["title"] = "Changed"
+    assert run(storage.classes.get("c"))["title"] == "Maths"
+
+
+def test_duplicate_ids_and_emails_are_rejected(storage):
+    run(storage.users.insert({"id": "a", "email": "t@x.com", "password": "h"}))
+    for user in ({"id": "a", "email": "other@x.com"}, {"id": "b", "email": "t@x.com"}):
+        with pytest.raises(DuplicateError):
+            run(storage.users.insert(user))
+    assert run(storage.users.get("a")) == {"id": "a", "email": "t@x.com"}
+    assert run(storage.users.find_by_email("t@x.com"))["password"] == "h"
+
+    failures = run(storage.classes.insert_many([make_class("x"), make_class("x"), make_class("y")]))
+    assert [index for index, _ in failures] == [1] and set(storage.classes.docs) == {"x", "y"}
+
+
+def test_claims_take_due_reminders_once_in_order(storage):
+    run(storage.reminders.insert_many([reminder("late", 5), reminder("b", -1), reminder("a", -2), reminder("c", -3, status="sent")]))
+    lease = START + timedelta(minutes=2)
+    first = run(storage.reminders.claim_due(START, 1, "w", "t1", lease))
+    second = run(storage.reminders.claim_due(START, 5, "w", "t2", lease))
+    assert [r["id"] for r in first] == ["a"] and [r["id"] for r in second] == ["b"]
+    assert run(storage.reminders.claim_due(START, 5, "w", "t3", lease)) == []
+
+    # An outcome is recorded only under the claim that holds the reminder
+    run(storage.reminders.record_outcomes("t2", {"a": {"status": "sent"}, "b": {"status": "sent"}}))
+    assert storage.reminders.docs["a"]["status"] == "processing"
+    assert storage.reminders.docs["b"]["status"] == "sent" and "claim_token" not in storage.reminders.docs["b"]
+
+    assert run(storage.reminders.renew_lease("t1", lease + timedelta(minutes=1))) == 1
+    assert run(storage.reminders.release_expired(lease)) == 0
+    assert run(storage.reminders.release_expired(lease + timedelta(minutes=1))) == 1
+    assert run(storage.reminders.next_pending_times(5)) == [START - timedelta(minutes=2), START + timedelta(minutes=5)]
+
+
+def test_backlog_and_retry_queue(storage):
+    run(storage.reminders.insert_many([reminder("a", -2, attempts=1), reminder("b", -1), reminder("c", 5, attempts=2)]))
+    assert run(storage.reminders.backlog(START)) == {"depth": 2, "oldest_scheduled_time": START - timedelta(minutes=2), "retrying": 2}
+    first = run(storage.reminders.page_retrying(1))
+    assert [r["id"] for r in first] == ["a"]
+    rest = run(storage.reminders.page_retrying(5, [first[0]["scheduled_time"], "a"]))
+    assert [r["id"] for r in rest] == ["c"]
+
+
+def test_waiting_reminders_are_deleted_by_occurrence(storage):
+    run(storage.reminders.insert_many([
+        reminder("a", 0, occurrence_start=START),
+        reminder("b", 0, occurrence_start=START + timedelta(days=7), status="suppressed"),
+        reminder("c", 0, occurrence_start=START, status="sent"),
+        reminder("legacy", 0, occurrence_start=None),
+    ]))
+    assert run(storage.reminders.delete_waiting("c", START, START + timedelta(days=1))) == 1
+    assert set(storage.reminders.docs) == {"b", "c", "legacy"}
+    assert run(storage.reminders.delete_waiting("c")) == 2
+    assert set(storage.reminders.docs) == {"c"}
+
+
+def test_occurring_and_overlapping_classes(storage):
+    run(storage.classes.insert_many([
+        make_class("once"),
+        make_class("later", days=8),
+        make_class("weekly", "WEEKLY", days=-14, room="R2"),
+        make_class("future", "WEEKLY", days=8),
+        make_class("other", teacher_email="o@x.com", room="R3"),
+    ]))
+    window = (START - timedelta(hours=1), START + timedelta(days=7))
+    assert {c["id"] for c in run(storage.classes.occurring(*window))} == {"once", "weekly", "other"}
+    assert {c["id"] for c in run(storage.classes.occurring(*window, "t@x.com"))} == {"once", "weekly"}
+    overlapping = run(storage.classes.overlapping(*window, ["R2", "R3"], ["nobody@x.com"], exclude_id="other"))
+    assert [c["id"] for c in overlapping] == ["weekly"]
+
+
+def test_horizon_lists_unmaterialized_classes_first(storage):
+    horizon = START + timedelta(days=14)
+    run(storage.classes.insert_many([
+        make_class("done", "WEEKLY", materialized_until=horizon),
+        make_class("behind", "WEEKLY", materialized_until=START),
+        make_class("legacy", "WEEKLY"),
+        make_class("once", materialized_until=START),
+    ]))
+    assert [c["id"] for c in run(storage.classes.behind_horizon(horizon, 5))] == ["legacy", "behind"]
+    run(storage.classes.set_materialized_until(["legacy", "behind"], horizon))
+    assert run(storage.classes.behind_horizon(horizon, 5)) == []
+
+
+def test_pages_resume_after_ties(storage):
+    run(storage.dead_letters.upsert_many([{"id": f"{i}", "dead_lettered_at": START + timedelta(minutes=i // 2)} for i in range(5)]))
+    seen, after = [], None
+    while page := run(storage.dead_letters.page(2, after)):
+        seen.extend(d["id"] for d in page)
+        after = [page[-1]["dead_lettered_at"], page[-1]["id"]]
+    assert seen == ["4", "3", "2", "1", "0"]
+
+    run(storage.classes.insert_many([make_class(c, days=d) for c, d in (("b", 0), ("a", 0), ("c", 1))]))
+    first = run(storage.classes.page_for_teacher("t@x.com", 2))
+    assert [c["id"] for c in first] == ["a", "b"]
+    assert [c["id"] for c in run(storage.classes.page_for_teacher("t@x.com", 2, [START, "b"]))] == ["c"]
+    assert run(storage.classes.page_for_teacher("o@x.com", 2)) == []
+
+
+def test_logs_are_summarised_and_rolled_up_by_hour(storage):
+    run(storage.logs.insert_many([
+        {"id": "a", "timestamp": START, "status": "sent", "lag_seconds": 0.5},
+        {"id": "b", "timestamp": START + timedelta(minutes=30), "status": "sent", "lag_seconds": 90, "channel": "email"},
+        {"id": "c", "timestamp": START + timedelta(minutes=45), "status": "failed"},
+        {"id": "d", "timestamp": START + timedelta(hours=1), "status": "sent", "lag_seconds": 1},
+    ]))
+    summaries = run(storage.logs.summarise(START, START + timedelta(hours=1)))
+    sent = next(s for s in summaries if s["status"] == "sent")
+    assert (sent["hour"], sent["channel"], sent["count"], sent["lag_sum"], sent["lag_max"]) == (START, "email", 2, 90.5, 90)
+    assert sorted((h["bucket"], h["count"]) for h in sent["lag_histogram"]) == [(0, 1), (5, 1)]
+    failed = next(s for s in summaries if s["status"] == "failed")
+    assert (failed["count"], failed["lag_max"], failed["lag_histogram"]) == (1, None, [{"bucket": None, "count": 1}])
+
+    run(storage.logs.roll_up(None, START + timedelta(hours=1)))
+    assert run(storage.logs.last_rollup_hour()) == START
+    run(storage.logs.roll_up(START, START + timedelta(hours=2)))
+    assert run(storage.logs.last_rollup_hour()) == START + timedelta(hours=1)
+    assert len(run(storage.logs.rollups(START, START + timedelta(hours=1)))) == 2
+
+
+def test_expired_logs_are_pruned_on_write():
+    storage = MemoryStorage(log_retention_days=30)
+    now = datetime.now(timezone.utc)
+    run(storage.logs.insert_many([{"id": "old", "timestamp": now - timedelta(days=31)}, {"id": "new", "timestamp": now}]))
+    assert set(storage.logs.docs) == {"new"}
+
+
+def test_job_leases_exclude_other_holders_until_expiry(storage):
+    assert run(storage.job_leases.acquire("job", "a", START, START + timedelta(minutes=30)))
+    assert not run(storage.job_leases.acquire("job", "b", START + timedelta(minutes=10), START + timedelta(minutes=40)))
+    assert run(storage.job_leases.acquire("job", "a", START + timedelta(minutes=10), START + timedelta(minutes=40)))
+    assert run(storage.job_leases.acquire("job", "b", START + timedelta(minutes=40), START + timedelta(minutes=70)))
+
+
+def test_keyset_query_matches_rows_after_the_cursor():
+    from storage_mongo import keyset_query
+
+    assert keyset_query([("timestamp", 1), ("id", 1)], [START, "001"]) == {
+        "$or": [{"timestamp": {"$gt": START}}, {"timestamp": START, "id": {"$gt": "001"}}]
+    }
+    assert keyset_query([("timestamp", -1), ("id", -1)], [START, "001"])["$or"][1] == {"timestamp": START, "id": {"$lt": "001"}}
@@ -0,0 +1,96 @@
+import io
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import BackgroundTasks, HTTPException, UploadFile
+
+from tests.conftest import register, run, stored
+
+HEADER = "class_title,room,teacher_email,start_datetime,end_datetime,recurrence,timezone\n"
+
+
+def upload_file(rows, header=HEADER, filename="timetable.csv"):
+    return UploadFile(file=io.BytesIO((header + "".join(rows)).encode()), filename=filename)
+
+
+def row(title="Maths", room="R1", teacher="t@x.com", start_hour=9, end_hour=10, recurrence="ONCE", tz=""):
+    day = datetime.now(timezone.utc).date() + timedelta(days=1)
+    start = datetime(day.year, day.month, day.day, start_hour, tzinfo=timezone.utc)
+    end = datetime(day.year, day.month, day.day, end_hour, tzinfo=timezone.utc)
+    return f"{title},{room},{teacher},{start.isoformat()},{end.isoformat()},{recurrence},{tz}\n"
+
+
+def upload(server, admin, rows, **kwargs):
+    return run(server.upload_timetable(BackgroundTasks(), upload_file(rows, **kwargs), current_user=admin))
+
+
+# --- Validation ---
+def test_valid_rows_are_imported_and_bad_rows_reported(server, storage, admin):
+    register(server, "t@x.com")
+    result = upload(server, admin, [
+        row(),
+        row(title="", room="R2"),
+        row(teacher="not-an-email", room="R3"),
+        row(start_hour=11, end_hour=10, room="R4"),
+        row(recurrence="DAILY", room="R5"),
+        row(tz="Mars/Olympus", room="R6"),
+    ])
+    assert result["rows_total"] == 6
+    assert result["classes_created"] == 1
+    assert result["reminders_created"] == 1
+    assert result["errors"] == [
+        {"row": 3, "errors": ["class_title is required"]},
+        {"row": 4, "errors": ["teacher_email is invalid"]},
+        {"row": 5, "errors": ["end_datetime must be after start_datetime"]},
+        {"row": 6, "errors": ["recurrence must be one of ONCE, WEEKLY, ODD_WEEKS, EVEN_WEEKS"]},
+        {"row": 7, "errors": ["timezone is not a known IANA timezone"]},
+    ]
+    assert set(result["timings"]) >= {"parse_ms", "validate_ms", "insert_classes_ms", "schedule_reminders_ms"}
+    [class_obj] = stored(storage, "classes")
+    assert class_obj["room"] == "R1" and class_obj["timezone"] == server.CLASS_TIMEZONE
+
+
+def test_missing_columns_are_rejected(server, admin):
+    with pytest.raises(HTTPException) as error:
+        upload(server, admin, [], header="class_title,room\n")
+    assert error.value.status_code == 400
+    assert "teacher_email" in error.value.detail
+
+
+def test_unsupported_file_types_are_rejected(server, admin):
+    with pytest.raises(HTTPException) as error:
+        upload(server, admin, [row()], filename="timetable.txt")
+    assert error.value.status_code == 400
+
+
+# --- Streaming imports ---
+def test_streamed_upload_is_imported_in_chunks_and_polled(server, storage, admin, monkeypatch):
+    monkeypatch.setattr(server, "UPLOAD_CHUNK_ROWS", 2)
+    register(server, "t@x.com")
+    tasks = BackgroundTasks()
+    rows = [row(room=f"R{i}", teacher=f"t{i}@x.com") for i in range(4)] + [row(title="", room="R9")]
+    started = run(server.upload_timetable(tasks, upload_file(rows), stream=True, current_user=admin))
+    assert started["status"] == "queued"
+    assert run(server.get_upload_job(started["job_id"], admin))["status"] == "queued"
+
+    run(tasks())
+    job = run(server.get_upload_job(started["job_id"], admin))
+    assert job["status"] == "completed"
+    assert job["rows_processed"] == 5 and job["chunks_processed"] == 3
+    assert job["classes_created"] == 4
+    assert job["errors"] == [{"row": 6, "errors": ["class_title is required"]}]
+    assert job["finished_at"] is not None
+    assert len(stored(storage, "classes")) == 4
+
+
+def test_streamed_upload_checks_the_header_before_queueing(server, storage, admin):
+    with pytest.raises(HTTPException) as error:
+        run(server.upload_timetable(BackgroundTasks(), upload_file([], header="class_title,room\n"), stream=True, current_user=admin))
+    assert error.value.status_code == 400
+    assert stored(storage, "upload_jobs") == []
+
+
+def test_unknown_upload_job_is_not_found(server, admin):
+    with pytest.raises(HTTPException) as error:
+        run(server.get_upload_job("missing", admin))
+    assert error.value.status_code == 404